@@ -12,7 +12,7 @@ setuptools.setup(
     long_description=long_description,
     url="https://github.com/kahlangibson/Syncopation",
     packages=setuptools.find_packages(),
-    install_requires = ['docopt'],
+    install_requires = ['docopt', 'numpy'],
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,133 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+import os, sys, threading, subprocess, time
+from concurrent.futures import ThreadPoolExecutor
+
+from .misc import read_file, save, get_source_file
+from .settings import *
+
+class BatchState(object):
+    """
+    Progress of a batch, saved as json after every stage so that an
+    interrupted batch resumes where it stopped:
+        {design_dir: {stage: "done" | "failed"}}
+    """
+    def __init__(self, filename):
+        self.filename = os.path.abspath(filename)
+        self.lock = threading.Lock()
+        if os.path.exists(self.filename): self.stages = read_file(self.filename)
+        else: self.stages = {}
+
+    def done(self, design, stage):
+        return self.stages.get(design, {}).get(stage) == "done"
+
+    def record(self, design, stage, status):
+        with self.lock:
+            self.stages.setdefault(design, {})[stage] = status
+            temp_file = self.filename + ".tmp"
+            save(temp_file, self.stages)
+            os.replace(temp_file, self.filename)
+
+def run_stage(design, stage, options, log_file, limits):
+    """ Run one syncopation stage in a design directory, holding the slots of its tools """
+    tools = sorted(BATCH_STAGE_TOOLS.get(stage, []))
+    for tool in tools: limits[tool].acquire()
+    try:
+        command = [sys.executable, "-m", "src.syncopation", stage] + options
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join([os.path.dirname(TOOL_PATH)] + [p for p in [env.get("PYTHONPATH")] if p])
+        print("INFO: [{}] {}".format(os.path.basename(design), stage))
+        with open(log_file, 'a') as log:
+            log.write("#### syncopation {} ({})\n".format(' '.join([stage] + options), time.strftime("%Y-%m-%d %H:%M:%S")))
+            log.flush()
+            return subprocess.call(command, cwd=design, stdout=log, stderr=subprocess.STDOUT, env=env) == 0
+    finally:
+        for tool in reversed(tools): limits[tool].release()
+
+def run_design(design, stages, stage_options, state, limits):
+    """ Run the stages of one design in order, skipping the completed ones """
+    log_file = os.path.join(design, "syncopation_batch.log")
+    for stage in stages:
+        if state.done(design, stage):
+            if DEBUG: print("DEBUG: [{}] {} already done".format(os.path.basename(design), stage))
+            continue
+        if not run_stage(design, stage, stage_options.get(stage, []), log_file, limits):
+            print("ERROR: [{}] {} failed, see {}".format(os.path.basename(design), stage, log_file))
+            state.record(design, stage, "failed")
+            return False
+        state.record(design, stage, "done")
+    return True
+
+def get_design_results(design):
+    """ Baseline fmax, Syncopation latency and effective frequency of a design, where available """
+    src = get_source_file(design)
+    out_dir = os.path.join(design, src.split(".")[0]+"_files")
+
+    def first_value(name):
+        filename = os.path.join(out_dir, name)
+        if not os.path.exists(filename): return ''
+        lines = read_file(filename)
+        return lines[0] if len(lines) else ''
+
+    hw_time = first_value("hwTime.csv")
+    transition_count = first_value("transition_count.csv")
+    effective_frequency = ''
+    if hw_time and transition_count:
+        effective_frequency = float(transition_count)/float(hw_time)
+    return [os.path.basename(design), design, first_value("no_sync_fmax.csv"), hw_time, effective_frequency]
+
+def run_batch(designs, stages, jobs=None, state_file=None, out_file="syncopation_batch.csv", no_sync_hardware=False, pipeline=False):
+    """
+    Runs the flow stages for each LegUp design directory, with at most
+    jobs designs at a time and at most BATCH_TOOL_LIMITS runs of each tool.
+    """
+    designs = [os.path.abspath(d) for d in designs]
+    for design in designs:
+        if get_source_file(design) == None:
+            print("ERROR: No makefile found in "+design)
+            sys.exit(2)
+    stages = stages.split(",")
+    for stage in stages:
+        if stage not in BATCH_STAGE_TOOLS:
+            print("ERROR: Unknown batch stage "+stage)
+            sys.exit(2)
+    jobs = int(jobs) if jobs else BATCH_JOBS
+    state = BatchState(state_file if state_file else BATCH_STATE)
+    limits = dict((tool, threading.BoundedSemaphore(n)) for tool, n in BATCH_TOOL_LIMITS.items())
+
+    make_options = []
+    if no_sync_hardware: make_options.append("--no_sync_hardware")
+    if pipeline: make_options.append("--pipeline")
+    stage_options = {'make':make_options}
+
+    print("INFO: Running {} on {} designs, {} at a time...".format(', '.join(stages), len(designs), jobs))
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        succeeded = list(executor.map(lambda d: run_design(d, stages, stage_options, state, limits), designs))
+
+    lines = ["design,path,no_sync_fmax,hw_time,effective_frequency"]
+    for design in designs:
+        lines.append(','.join([str(v) for v in get_design_results(design)]))
+    save(os.path.abspath(out_file), "\n".join(lines)+"\n")
+    print("INFO: {} of {} designs completed. Saved results to {}".format(succeeded.count(True), len(designs), out_file))
+    print("INFO: Batch progress saved to "+state.filename)
@@ -0,0 +1,145 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+"""Syncopation parser benchmarks
+
+Times the parsing and generation stages on synthetic LegUp designs of
+increasing size and saves the results as json. With --compare, each
+stage is compared against the results of an earlier run.
+Run with `python -m src.benchmark`.
+
+Usage:
+    benchmark [--states=<LIST>] [--modules=<N>] [--instructions=<N>] [--depth=<N>] [--seed=<N>] [--out=<FILE>] [--compare=<FILE>]
+    benchmark -h|--help
+
+Options:
+    -h --help               Show this screen
+    --states=<LIST>         Comma-separated total state counts [default: 1000,10000,100000]
+    --modules=<N>           Modules per design [default: 8]
+    --instructions=<N>      Instructions per state [default: 2]
+    --depth=<N>             Call depth below main [default: 2]
+    --seed=<N>              Seed of the design generator [default: 0]
+    --out=<FILE>            Results file [default: benchmark.json]
+    --compare=<FILE>        Earlier results file to compare against
+"""
+
+import os, sys, time, json, random, shutil, tempfile
+from docopt import docopt
+
+from .model import Project
+from .cache import artifact_cache
+from .synthetic import generate_design
+from .schedule_processing import get_hls_data
+from .verilog_processing import get_rtl_data, pull_out_state
+from .project import match_rtl_data
+from .synthesis import generate_mif_files
+from .settings import *
+
+REGRESSION = 1.2 # slowdown ratio reported as a regression by --compare
+
+def benchmark_design(num_states, num_modules, instructions_per_state, call_depth, seed):
+    """ Seconds spent in each stage on one synthetic design """
+    directory = tempfile.mkdtemp(prefix="syncopation_bench_")
+    cwd = os.getcwd()
+    try:
+        start = time.perf_counter()
+        verilog_file = generate_design(directory, "bench", num_modules, num_states//num_modules, instructions_per_state, call_depth, seed=seed)
+        generated = time.perf_counter() - start
+        with open(verilog_file) as f: verilog_lines = sum(1 for _ in f)
+        os.chdir(directory)
+        # stages read their inputs relative to the project
+        project = Project("bench.v", export=False)
+
+        stages = [
+            ("get_hls_data", lambda: get_hls_data(project)),
+            ("get_rtl_data", lambda: get_rtl_data(project)),
+            ("profile_rtl", lambda: match_rtl_data(project)),
+            ("pull_out_state", lambda: pull_out_state(False, project)),
+            ("generate_mif_files", lambda: generate_mif_files(project, False))
+        ]
+        times = {'generate_design':generated}
+        for name, stage in stages:
+            if name == "generate_mif_files":
+                # frequencies normally come from timing analysis
+                rng = random.Random(seed)
+                states = project.read("hls_statesPerModule.json")
+                project.save("correctedFrequencyPerState.json", dict((s, rng.uniform(100, 500)) for m in states.values() for s in m))
+                os.makedirs(os.path.join(project.out_dir, "rom"))
+            start = time.perf_counter()
+            stage()
+            times[name] = time.perf_counter() - start
+            print("INFO: {} states: {} {:.3f} s".format(num_states, name, times[name]))
+        return times, verilog_lines
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+
+def compare(results, baseline_file):
+    """ Print the speedup of every stage against an earlier results file """
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+    previous = dict(((r['states'], r['stage']), r['time']) for r in baseline['results'])
+    print("Comparison with "+baseline_file)
+    print("  {:>10} {:<20} {:>10} {:>10} {:>8}".format("states", "stage", "before", "after", "speedup"))
+    regressions = 0
+    for r in results:
+        key = (r['states'], r['stage'])
+        if key not in previous: continue
+        ratio = previous[key]/r['time'] if r['time'] > 0 else float('inf')
+        flag = ""
+        if r['time'] > previous[key]*REGRESSION:
+            flag = "REGRESSION"
+            regressions += 1
+        print("  {:>10} {:<20} {:>10.3f} {:>10.3f} {:>7.2f}x {}".format(r['states'], r['stage'], previous[key], r['time'], ratio, flag))
+    return regressions
+
+def main():
+    options = docopt(__doc__)
+    modules = int(options["--modules"])
+    instructions = int(options["--instructions"])
+    depth = int(options["--depth"])
+    seed = int(options["--seed"])
+
+    # measure the parsers themselves, not cache restores
+    artifact_cache.enabled = False
+
+    results = []
+    for num_states in [int(n) for n in options["--states"].split(",")]:
+        times, verilog_lines = benchmark_design(num_states, modules, instructions, depth, seed)
+        for stage, t in times.items():
+            results.append({'states':num_states, 'verilog_lines':verilog_lines, 'stage':stage, 'time':t,
+                'states_per_second':num_states/t if t > 0 else None})
+
+    report = {
+        'settings':{'modules':modules, 'instructions_per_state':instructions, 'call_depth':depth, 'seed':seed, 'tool_version':TOOL_VERSION},
+        'results':results
+    }
+    with open(options["--out"], 'w') as f:
+        json.dump(report, f, indent=1)
+    print("INFO: Saved benchmark results to "+options["--out"])
+
+    if options["--compare"]:
+        if compare(results, options["--compare"]) > 0: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+import os, glob, json, hashlib, tempfile
+from .settings import *
+
+class ArtifactCache(object):
+    """
+    Content-addressed store of stage results shared between projects.
+    Each entry is one json file of {artifact name: data} named by the hash
+    of the stage inputs, so a shared directory only ever holds data; entries
+    are evicted least recently used first once the directory grows beyond
+    max_size MB. Disabled unless USE_CACHE (SYNCOPATION_CACHE_DIR is set) or
+    enabled with `--cache`.
+    """
+    def __init__(self, directory=CACHE_DIR, max_size=CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size*1024*1024
+        self.hits = 0
+        self.misses = 0
+        self.tool_digest = None
+        self.enabled = USE_CACHE
+
+    def digest(self):
+        """ Tool version and sources, so that parser changes invalidate entries """
+        if self.tool_digest is None:
+            h = hashlib.sha256(TOOL_VERSION.encode())
+            for f in sorted(glob.glob(os.path.join(TOOL_PATH, "*.py"))):
+                with open(f, 'rb') as src:
+                    h.update(src.read())
+            self.tool_digest = h.hexdigest()
+        return self.tool_digest
+
+    def key(self, stage, files, settings=()):
+        h = hashlib.sha256(self.digest().encode())
+        h.update(stage.encode())
+        for f in files:
+            h.update(b'\0')
+            with open(f, 'rb') as inp:
+                for block in iter(lambda: inp.read(1<<20), b''):
+                    h.update(block)
+        h.update(repr((PLL_CLOCK, COUNTER_BITS) + tuple(settings)).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key+".json")
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'r') as f:
+                artifacts = json.load(f)
+            os.utime(self.path(key)) # mark as recently used
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return artifacts
+
+    def put(self, key, artifacts):
+        try: data = json.dumps(artifacts)
+        except (TypeError, ValueError):
+            if DEBUG: print("DEBUG: Artifacts {} are not json, not cached".format(list(artifacts.keys())))
+            return
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        # write then rename, concurrent builds may share the directory
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.replace(tmp, self.path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for f in glob.glob(os.path.join(self.directory, "*.json")):
+            try: entries.append((os.path.getmtime(f), os.path.getsize(f), f))
+            except OSError: pass
+        total = sum([size for _, size, _ in entries])
+        for _, size, f in sorted(entries):
+            if total <= self.max_size: break
+            if DEBUG: print("DEBUG: Evicting cache entry "+f)
+            try: os.remove(f)
+            except OSError: pass
+            total -= size
+
+    def run(self, project, stage, files, function, settings=()):
+        """
+        Restore the artifacts of stage from the cache, or run function and
+        store every artifact it saved to the project.
+        """
+        if not self.enabled: return function(project)
+        key = self.key(stage, files, settings)
+        artifacts = self.get(key)
+        if artifacts is not None:
+            print("INFO: Restoring {} from cache ({} artifacts)".format(stage, len(artifacts)))
+            for name, data in artifacts.items():
+                project.save(name, data)
+            return
+        # cache the data as the stage saved it, so a hit saves exactly the same;
+        # an enclosing cached stage also records what this one saves
+        enclosing = project.recording
+        project.recording = {}
+        try:
+            function(project)
+            artifacts = project.recording
+        finally:
+            project.recording = enclosing
+        if enclosing is not None: enclosing.update(artifacts)
+        self.put(key, artifacts)
+
+    def report(self):
+        if self.enabled and self.hits + self.misses:
+            print("INFO: Artifact cache {} hits, {} misses ({})".format(self.hits, self.misses, self.directory))
+
+artifact_cache = ArtifactCache()
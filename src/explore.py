@@ -0,0 +1,132 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+import os, sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .misc import save
+from .transitions import TransitionCounts
+from .verilog_processing import get_num_bits, get_num_nStates
+from .synthesis import generate_mif_files
+from .settings import *
+
+# trace summary and per-state frequencies, loaded once per worker process
+_worker = {}
+
+def _init_worker(transitions_file, frequencies, pipeline):
+    transitions = TransitionCounts.load(transitions_file)
+    _worker['transitions'] = transitions
+    _worker['frequencies'] = transitions.frequency_array(frequencies)
+    _worker['pipeline'] = pipeline
+
+def _evaluate_point(point):
+    """ Simulated performance of one (pll_clock, counter_bits) point, None if infeasible """
+    pll_clock, counter_bits = point
+    frequencies = _worker['frequencies']
+    # the slowest state must be reachable with the largest divisor
+    if np.nanmin(frequencies) < pll_clock/((2**counter_bits)-1):
+        return None
+    return _worker['transitions'].evaluate(frequencies, _worker['pipeline'], pll_clock, counter_bits)
+
+def get_rom_bits(project, counter_bits):
+    """ Total bits of the divisor ROMs of every module """
+    bits = get_num_bits(project)
+    num_nStates = get_num_nStates(project)
+    return sum([(2**bits[m]) * num_nStates[m] * (counter_bits + bits[m]) for m in bits])
+
+def get_pareto_front(points):
+    """ Points not dominated in effective frequency (higher) and ROM bits (lower) """
+    front = []
+    for p in points:
+        dominated = any([q['effective_frequency'] >= p['effective_frequency'] and q['rom_bits'] <= p['rom_bits'] and
+            (q['effective_frequency'] > p['effective_frequency'] or q['rom_bits'] < p['rom_bits']) for q in points])
+        if not dominated: front.append(p)
+    return front
+
+def explore(project, pipeline, pll_clocks, counter_widths, workers=EXPLORE_WORKERS):
+    """
+    Evaluates every combination of PLL frequency and divisor counter width
+    against the per-state frequencies of the last timing analysis and the
+    transition counts of the last simulation. Writes explore.csv.
+    """
+    transitions_file = os.path.join(project.out_dir, "transitions.npz")
+    if not os.path.exists(transitions_file):
+        print("ERROR: No transition counts found in "+project.out_dir)
+        print("       Run `syncopation synth` first to simulate the design.")
+        sys.exit(2)
+    frequencies = project.read("correctedFrequencyPerState.json")
+
+    grid = [(float(pll_clock), int(counter_bits)) for pll_clock in pll_clocks for counter_bits in counter_widths]
+    print("INFO: Evaluating {} design points on {} processes...".format(len(grid), workers))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(transitions_file, frequencies, pipeline)) as executor:
+        results = list(executor.map(_evaluate_point, grid, chunksize=max(1, len(grid)//(4*workers))))
+
+    rom_bits = dict((b, get_rom_bits(project, b)) for b in set([b for _, b in grid]))
+    points = []
+    for (pll_clock, counter_bits), result in zip(grid, results):
+        if result is None:
+            if DEBUG: print("DEBUG: PLL {} MHz with {} counter bits cannot reach the slowest state".format(pll_clock, counter_bits))
+            continue
+        points.append({
+            'pll_clock':pll_clock,
+            'counter_bits':counter_bits,
+            'effective_frequency':result['effective_frequency'],
+            'latency':result['time'],
+            'rom_bits':rom_bits[counter_bits],
+            'pll_available':os.path.exists(os.path.join(TOOL_PATH, "pll", str(int(pll_clock))))
+        })
+    points.sort(key=lambda p: (-p['effective_frequency'], p['rom_bits']))
+    front = get_pareto_front(points)
+
+    lines = ["rank,pll_clock,counter_bits,effective_frequency,latency,rom_bits,pareto,pll_available"]
+    for rank, p in enumerate(points):
+        lines.append("{},{},{},{},{},{},{},{}".format(rank+1, p['pll_clock'], p['counter_bits'], p['effective_frequency'],
+            p['latency'], p['rom_bits'], p in front, p['pll_available']))
+    report_file = os.path.join(project.out_dir, "explore.csv")
+    save(report_file, "\n".join(lines)+"\n")
+
+    print("Pareto front (effective frequency vs ROM bits)")
+    for p in front:
+        print("  PLL {:g} MHz, {} counter bits: EFFECTIVE FREQUENCY {} ROM BITS {}".format(p['pll_clock'], p['counter_bits'], p['effective_frequency'], p['rom_bits']))
+    print("INFO: Saved report to "+report_file)
+    return points
+
+def select_point(project, pipeline, pll_clock, counter_bits):
+    """
+    Regenerates the divisor MIFs for one design point. The project ROMs are
+    only replaced if the RTL was generated for the point, otherwise the MIFs
+    go to rom_<MHZ>_<BITS> in the project directory.
+    """
+    print("INFO: Generating divisor memories for PLL {:g} MHz with {} counter bits...".format(pll_clock, counter_bits))
+    if pll_clock == PLL_CLOCK and counter_bits == COUNTER_BITS:
+        generate_mif_files(project, pipeline, pll_clock, counter_bits)
+        return
+    # the PLL and the ROM/counter widths are fixed in the generated RTL
+    rom_dir = os.path.join(project.out_dir, "rom_{:g}_{}".format(pll_clock, counter_bits))
+    generate_mif_files(project, pipeline, pll_clock, counter_bits, rom_dir=rom_dir)
+    print("INFO: The project was generated for PLL {:g} MHz with {} counter bits, its memories are unchanged.".format(PLL_CLOCK, COUNTER_BITS))
+    print("      Saved the memories of this point to "+rom_dir)
+    print("      Set PLL_CLOCK and COUNTER_BITS in settings.py and run `syncopation make` to use this point in hardware.")
+    if not os.path.exists(os.path.join(TOOL_PATH, "pll", str(int(pll_clock)))):
+        print("      No PLL is available for {:g} MHz in {}".format(pll_clock, os.path.join(TOOL_PATH, "pll")))
@@ -0,0 +1,73 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+"""
+Shared configuration of the stand-in tools in this directory, read from
+the environment so that a whole flow run can be tuned without editing
+files:
+
+    SYNCOPATION_FAKE_LATENCY  seconds per run of each tool, e.g.
+                              "make=0.5,fit=10,sta=0.05,sim=2,sh=1"
+                              (sta is per query, sim per 1000 cycles)
+    SYNCOPATION_FAKE_SLACK    slack distribution in ns, "uniform:<lo>:<hi>"
+                              or "normal:<mean>:<sd>" [uniform:-1.5:0.5]
+    SYNCOPATION_FAKE_DESIGN   synthetic design built by `make`, e.g.
+                              "modules=4,states=64,instructions=2,depth=2,seed=0"
+    SYNCOPATION_FAKE_CYCLES   minimum simulated cycles; main is restarted
+                              until reached [0]
+"""
+
+import os, sys, time, hashlib
+from statistics import NormalDist
+
+# the syncopation package (src) is the parent of this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+def options(name, default=""):
+    """ Dict of a comma-separated key=value environment variable """
+    text = os.environ.get(name, default)
+    return dict([item.split('=') for item in text.split(',') if '=' in item])
+
+def wait(tool, scale=1.0):
+    """ Imitate the run time of tool """
+    latency = float(options("SYNCOPATION_FAKE_LATENCY").get(tool, 0))*scale
+    if latency > 0: time.sleep(latency)
+
+def fake_slack(*key):
+    """ Deterministic slack for a query, drawn from SYNCOPATION_FAKE_SLACK """
+    digest = hashlib.md5(' '.join(key).encode('utf-8')).hexdigest()
+    u = int(digest[:8], 16) / float(0xffffffff)
+    kind, a, b = os.environ.get("SYNCOPATION_FAKE_SLACK", "uniform:-1.5:0.5").split(':')
+    if kind == "normal":
+        u = min(max(u, 1e-9), 1-1e-9)
+        return round(NormalDist(float(a), float(b)).inv_cdf(u), 3)
+    return round(float(a) + u*(float(b)-float(a)), 3)
+
+def makefile_name(directory='.'):
+    """ NAME of the LegUp Makefile in directory """
+    name = 'main'
+    with open(os.path.join(directory, 'Makefile')) as f:
+        for line in f:
+            if line.startswith('NAME') and '=' in line:
+                name = line.split('=')[1].strip()
+    return name
@@ -0,0 +1,173 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+import os, sys, time, hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .settings import *
+
+class Stage(object):
+    """
+    One step of a flow, the files it reads and writes, the stages it must
+    follow and the tool files (templates) whose contents it depends on
+    """
+    def __init__(self, name, action, inputs=(), outputs=(), after=(), tool=False, sources=()):
+        self.name = name
+        self.action = action
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+        self.tool = tool
+        self.sources = list(sources)
+
+class Flow(object):
+    """
+    Stages run as a dependency graph: a stage depends on the stages producing
+    its inputs and on the stages it is declared after. Independent stages run
+    concurrently. A stage is skipped if it ran before (its stamp in state_dir
+    is newer than its inputs), its outputs still exist, none of the stages it
+    depends on ran in this flow and its digest is unchanged. The digest covers
+    the contents of the stage sources and, except for stages only running an
+    external tool, the given digest of the syncopation sources and settings.
+    Stages editing a file in place (the RTL) or the shared Project order
+    themselves with `after` instead of listing the file as an input. The
+    profiler charges process-wide CPU time to every stage running at the
+    time, so profile with workers=1.
+    """
+    def __init__(self, state_dir, profiler, force=False, workers=FLOW_WORKERS, digest=''):
+        self.state_dir = state_dir
+        self.profiler = profiler
+        self.force = force
+        self.workers = workers
+        self.digest = digest
+        self.stages = []
+        self.times = {}
+
+    def add(self, name, action, inputs=(), outputs=(), after=(), tool=False, sources=()):
+        self.stages.append(Stage(name, action, inputs, outputs, after, tool, sources))
+
+    def dependencies(self, stage):
+        producers = dict((output, s.name) for s in self.stages for output in s.outputs)
+        depends = [producers[i] for i in stage.inputs if i in producers] + stage.after
+        return list(dict.fromkeys([d for d in depends if d != stage.name]))
+
+    def stamp(self, stage):
+        return os.path.join(self.state_dir, stage.name)
+
+    def stage_digest(self, stage):
+        h = hashlib.sha256(stage.name.encode())
+        if not stage.tool: h.update(self.digest.encode())
+        for source in stage.sources:
+            if os.path.isdir(source):
+                files = sorted([os.path.join(d, f) for d, _, fs in os.walk(source) for f in fs])
+            else: files = [source]
+            for f in files:
+                h.update(b'\0'+os.path.relpath(f, source).encode()+b'\0')
+                with open(f, 'rb') as inp:
+                    h.update(inp.read())
+        return h.hexdigest()
+
+    def up_to_date(self, stage, ran):
+        if self.force or any([d in ran for d in self.dependencies(stage)]): return False
+        if not os.path.exists(self.stamp(stage)): return False
+        if not all([os.path.exists(o) for o in stage.outputs]): return False
+        with open(self.stamp(stage), 'r') as f:
+            if f.read().strip() != self.stage_digest(stage):
+                if DEBUG: print("DEBUG: Stage {} sources or settings changed".format(stage.name))
+                return False
+        stamp_time = os.path.getmtime(self.stamp(stage))
+        return all([os.path.exists(i) and os.path.getmtime(i) <= stamp_time for i in stage.inputs])
+
+    def execute(self, stage):
+        start = time.perf_counter()
+        with self.profiler.stage(stage.name, tool=stage.tool):
+            stage.action()
+        # the stamp is written after the action, which may have cleared state_dir
+        if not os.path.exists(self.state_dir):
+            os.makedirs(self.state_dir)
+        with open(self.stamp(stage), 'w') as f:
+            f.write(self.stage_digest(stage)+'\n')
+        return time.perf_counter() - start
+
+    def run(self):
+        """ Run the stages, then print the critical path """
+        names = [s.name for s in self.stages]
+        depends = dict((s.name, self.dependencies(s)) for s in self.stages)
+        for name, ds in depends.items():
+            for d in ds:
+                if d not in names:
+                    print("ERROR: Stage {} depends on unknown stage {}".format(name, d))
+                    sys.exit(2)
+
+        start = time.perf_counter()
+        done, ran, running = set(), set(), {}
+        order, skipped = [], []
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as executor:
+            try:
+                while len(done) < len(self.stages):
+                    for stage in self.stages:
+                        if stage.name in done or stage.name in running.values(): continue
+                        if not all([d in done for d in depends[stage.name]]): continue
+                        if self.up_to_date(stage, ran):
+                            if DEBUG: print("DEBUG: Stage {} is up to date".format(stage.name))
+                            self.times[stage.name] = 0.0
+                            skipped.append(stage.name)
+                            order.append(stage.name)
+                            done.add(stage.name)
+                        else:
+                            running[executor.submit(self.execute, stage)] = stage.name
+                    if len(done) == len(self.stages): break
+                    if not running:
+                        print("ERROR: Stages {} depend on each other".format([n for n in names if n not in done]))
+                        sys.exit(2)
+                    finished, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        name = running.pop(future)
+                        self.times[name] = future.result()
+                        ran.add(name)
+                        order.append(name)
+                        done.add(name)
+            except BaseException:
+                # let running stages finish, start no new ones
+                for future in running: future.cancel()
+                raise
+        self.report(depends, order, skipped, time.perf_counter() - start)
+
+    def report(self, depends, order, skipped, wall_time):
+        # longest chain of stage times through the graph, in completion order
+        path_time, previous = {}, {}
+        for name in order:
+            ds = depends[name]
+            previous[name] = max(ds, key=lambda d: path_time[d]) if ds else None
+            path_time[name] = self.times[name] + (path_time[previous[name]] if ds else 0.0)
+        last = max(path_time, key=lambda n: path_time[n])
+        path = []
+        while last is not None:
+            path.insert(0, last)
+            last = previous[last]
+        if skipped:
+            print("INFO: {} of {} stages up to date: {}".format(len(skipped), len(self.stages), ", ".join(skipped)))
+        path = [n for n in path if n not in skipped]
+        if path:
+            print("INFO: Critical path {:.2f} s of {:.2f} s: {}".format(path_time[path[-1]], wall_time,
+                " -> ".join(["{} ({:.2f} s)".format(n, self.times[n]) for n in path])))
@@ -21,61 +21,106 @@
 # IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #---------------------------------------------------------------------------
 
-import os, sys, json, csv
+import os, sys, json, csv, signal, threading
 import subprocess
+from collections import deque
 
 from .settings import *
 
-def execute(command, cd='.', err=False, t=1200, wait=False, quiet=False, filename=None, print_output=False):
+class OutputCapture(object):
+    """
+    Bounded record of a tool's output: the last `tail` lines and every
+    line containing one of the `keep` strings, in their original order.
+    """
+    def __init__(self, tail=EXECUTE_TAIL_LINES, keep=EXECUTE_KEEP):
+        self.lines = deque(maxlen=tail)
+        self.kept = []
+        self.keep = keep
+
+    def add(self, line):
+        if len(self.lines) == self.lines.maxlen:
+            # the oldest line is about to drop out of the tail
+            if any(k in self.lines[0] for k in self.keep): self.kept.append(self.lines[0])
+        self.lines.append(line)
+
+    def text(self):
+        lines = self.kept + list(self.lines)
+        return ''.join([l + '\n' for l in lines])
+
+def execute(command, cd='.', err=False, t=1200, wait=False, quiet=False, filename=None, print_output=False, log_file=None, on_line=None, cancel=None):
     """ 
     Given a command described as a list of strings, run using subprocess.
     Execute command executed in directory indicated by dir.
-    Returns stdout as string. 
+    Output is streamed line by line: written to log_file and passed to
+    on_line if given. Returns stdout as string, bounded as described by
+    OutputCapture. Setting the threading.Event cancel interrupts the
+    command; t=None disables the timeout.
     """
     if isinstance(command, str):
         command = command.split(' ')
-    outs = ''
-    errs = ''
     if VERBOSE:
         command_str = ' '.join(command)
         print("VERBOSE: Executing `"+command_str+"` in dir "+cd)
 
     if wait:
-        subprocess.Popen(command, cwd=cd, stdout=subprocess.PIPE,stderr=subprocess.PIPE).wait()
+        subprocess.Popen(command, cwd=cd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).wait()
         return None
     elif filename:
         log = open(filename, 'w+')
         subprocess.Popen(command, cwd=cd, stdout=log, stderr=log, shell=True).wait()
-    elif print_output:
-        p = subprocess.Popen(command, cwd=cd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        while p.poll() is None:
-            l = str(p.stdout.readline(), 'utf-8').strip('\n')
-            if len(l) > 0 and '#' != l[0]:
-                print(l)
-            outs = outs + l + '\n'
-        while l:
-            l = str(p.stdout.readline(), 'utf-8').strip('\n')
-            if len(l) > 0 and '#' != l[0]:
-                print(l)
-            outs = outs + l + '\n'
-    else:
-        try:
-            with subprocess.Popen(command, cwd=cd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, preexec_fn=os.setsid) as process:
-                try:
-                    outs, errs = process.communicate(timeout=t)
-                except subprocess.TimeoutExpired:
-                    os.killpg(process.pid, signal.SIGINT)
-                    output = process.communicate()[0]
-        except subprocess.CalledProcessError as e:
-            print(e)
-
-        if type(outs) is bytes: outs = outs.decode('UTF-8')
-        if type(errs) is bytes: errs = errs.decode('UTF-8')
-        if outs and not quiet:
-            print(outs)
-        if errs and not quiet and not print_output:
-            print(errs)
-            sys.exit(2)
+        return ('', '') if err else ''
+
+    outs = OutputCapture()
+    errs = OutputCapture()
+    # stderr is merged into the printed output, otherwise read alongside stdout
+    process = subprocess.Popen(command, cwd=cd, stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT if print_output else subprocess.PIPE, preexec_fn=None if print_output else os.setsid)
+    def interrupt():
+        if process.poll() is not None: return
+        if print_output: process.send_signal(signal.SIGINT)
+        else: os.killpg(process.pid, signal.SIGINT)
+    reader = timer = None
+    if not print_output:
+        def read_errors():
+            for line in process.stderr:
+                errs.add(line.decode('utf-8', 'replace').rstrip('\n'))
+        reader = threading.Thread(target=read_errors, daemon=True)
+        reader.start()
+        if t is not None:
+            timer = threading.Timer(t, interrupt)
+            timer.start()
+    if cancel is not None:
+        def watch():
+            while not cancel.wait(0.1):
+                if process.poll() is not None: return
+            interrupt()
+        threading.Thread(target=watch, daemon=True).start()
+
+    log = None
+    if log_file:
+        if not os.path.exists(os.path.dirname(os.path.abspath(log_file))):
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)))
+        log = open(log_file, 'w+')
+    try:
+        for line in process.stdout:
+            l = line.decode('utf-8', 'replace').rstrip('\n')
+            if log: log.write(l + '\n')
+            if on_line: on_line(l)
+            if print_output:
+                if len(l) > 0 and '#' != l[0]: print(l)
+            elif not quiet: print(l)
+            outs.add(l)
+        process.wait()
+    finally:
+        if log: log.close()
+        if timer: timer.cancel()
+        if reader: reader.join()
+
+    outs = outs.text()
+    errs = errs.text()
+    if errs and not quiet and not print_output:
+        print(errs)
+        sys.exit(2)
 
     if err: return (outs,errs)
     else: return outs
@@ -127,4 +172,23 @@ def save(filename, data):
         if not os.path.exists(os.path.dirname(filename)):
             os.makedirs(os.path.dirname(filename))
         with open(filename, 'w+') as f:
-            f.write(data)
\ No newline at end of file
+            f.write(data)
+
+def get_source_file(directory='.'):
+    """
+    Name of the C source of the LegUp design in directory, from its Makefile.
+    Returns None if there is no Makefile.
+    """
+    makefile = os.path.join(directory, 'Makefile')
+    if not os.path.exists(makefile): return None
+    src = ''
+    name = ''
+    with open(makefile, 'r') as mfile:
+        for line in mfile:
+            if 'SRCS' in line:
+                src = line.split('=')[1].strip()
+            if 'NAME' in line:
+                name = line.split('=')[1].strip()
+    if src == '':
+        src = name + '.c'
+    return src
@@ -0,0 +1,195 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+import os, io, csv, json, pickle
+from array import array
+from .misc import read_file, save
+from .settings import *
+
+def as_exported(name, data):
+    """
+    data as read_file returns it from the file save writes, so stage results
+    read the same from the model as from the exported files (string keys,
+    csv rows as strings)
+    """
+    if name.split('.')[-1] == 'json':
+        if isinstance(data, dict): return json.loads(json.dumps(data))
+        return data
+    if isinstance(data, list):
+        text = io.StringIO()
+        w = csv.writer(text)
+        for each in data:
+            w.writerow([each])
+        text = text.getvalue()
+    elif isinstance(data, dict): text = json.dumps(data)
+    elif isinstance(data, str): text = data
+    else: return data
+    return [line.strip() for line in io.StringIO(text, newline=None)]
+
+class Interner(object):
+    """ Two-way table between names and dense integer ids """
+    __slots__ = ('ids', 'names')
+
+    def __init__(self, names=()):
+        self.ids = {}
+        self.names = []
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name):
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return self.ids[name]
+
+    def __getitem__(self, name):
+        return self.ids[name]
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def name(self, id):
+        return self.names[id]
+
+class StateTable(object):
+    """
+    Per-state records in parallel typed arrays indexed by state id:
+    owning module id, encoded state value in the RTL and the range of the
+    state's next states within next_states.
+    """
+    __slots__ = ('module', 'value', 'first_next', 'next_states')
+
+    def __init__(self, size):
+        self.module = array('i', [0]) * size
+        self.value = array('i', [-1]) * size
+        self.first_next = array('i', [0]) * (size + 1)
+        self.next_states = array('i')
+
+    def successors(self, state):
+        return self.next_states[self.first_next[state]:self.first_next[state+1]]
+
+class Project(object):
+    """
+    In-memory model of a Syncopation project, built once per run and passed
+    to every flow stage. Stage results are kept by their file name in
+    <project>_files, in the form read_file gives for the exported file;
+    results of earlier runs are loaded from model.pickle, except those whose
+    exported file was changed after the model was stored, then from the
+    individual files. The json/csv files themselves are only written when
+    export is set. index() gives integer ids and compact state records, used
+    by the trace evaluation; the stages work on the name-keyed results.
+    """
+    def __init__(self, verilog_file, export=EXPORT_FILES):
+        self.verilog_file = verilog_file
+        self.project_name = verilog_file.split(".")[0]
+        self.project_folder = os.path.dirname(os.path.abspath(verilog_file))
+        self.out_dir = self.project_name+"_files"
+        self.export = export
+        self.data = {}
+        self.recording = None # data as passed to save while recording, see cache.py
+        self.tables = None
+        if os.path.exists(self.path("model.pickle")):
+            stored = os.path.getmtime(self.path("model.pickle"))
+            with open(self.path("model.pickle"), 'rb') as f:
+                self.data = pickle.load(f)
+            # exported files edited or regenerated since are read instead
+            for name in list(self.data.keys()):
+                if os.path.exists(self.path(name)) and os.path.getmtime(self.path(name)) > stored:
+                    if DEBUG: print("DEBUG: {} changed since the model was stored, reading it".format(self.path(name)))
+                    del self.data[name]
+
+    def clear(self):
+        """ Forget all stage results, e.g. after the design was regenerated """
+        self.data = {}
+        self.recording = None
+        self.tables = None
+
+    def path(self, name):
+        return os.path.join(self.out_dir, name)
+
+    def exists(self, name):
+        return name in self.data or os.path.exists(self.path(name))
+
+    def read(self, name):
+        if name not in self.data:
+            self.data[name] = read_file(self.path(name))
+        return self.data[name]
+
+    def save(self, name, data):
+        self.data[name] = as_exported(name, data)
+        if self.recording is not None: self.recording[name] = data
+        self.tables = None
+        if self.export: save(self.path(name), data)
+
+    def store(self):
+        """ Persist the model for the next syncopation command """
+        if not os.path.exists(self.out_dir):
+            os.makedirs(self.out_dir)
+        with open(self.path("model.pickle"), 'wb') as f:
+            pickle.dump(self.data, f, pickle.HIGHEST_PROTOCOL)
+
+    def index(self):
+        """
+        Interned ids for modules, states, instructions and registers, and
+        the StateTable of every HLS state. Rebuilt after any save.
+        """
+        if self.tables is None:
+            states_per_module = self.read("hls_statesPerModule.json")
+            nstates_per_state = self.read("hls_nstatesPerState.json")
+            modules = Interner(states_per_module.keys())
+            states = Interner()
+            for module_states in states_per_module.values():
+                for state in module_states:
+                    states.intern(state)
+            for nstates in nstates_per_state.values():
+                for state in nstates:
+                    states.intern(state)
+            instructions = Interner(self.read("hls_instructions.csv"))
+            registers = Interner(self.read("hls_registers.csv"))
+
+            table = StateTable(len(states))
+            for module, module_states in states_per_module.items():
+                for state in module_states:
+                    table.module[states[state]] = modules[module]
+            if self.exists("valuePerState.json"):
+                for state, value in self.read("valuePerState.json").items():
+                    if state in states: table.value[states[state]] = int(value)
+            for id in range(len(states)):
+                table.first_next[id] = len(table.next_states)
+                table.next_states.extend([states[n] for n in nstates_per_state.get(states.name(id), [])])
+            table.first_next[len(states)] = len(table.next_states)
+
+            self.tables = {
+                'modules':modules,
+                'states':states,
+                'instructions':instructions,
+                'registers':registers,
+                'state_table':table
+            }
+        return self.tables
@@ -0,0 +1,104 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+import os, time, resource, cProfile
+from contextlib import contextmanager
+
+from .misc import save
+
+class StageProfiler(object):
+    """
+    Wall time, CPU time and peak RSS of the stages of a command, for
+    `--profile`. CPU time and RSS are split into this process (Python) and
+    its children (Quartus, Modelsim, make). Children are counted by
+    getrusage once they exit, so a timing session shows up in the stage
+    that closes it. RSS comes from ru_maxrss, the high-water mark of the
+    process lifetime, so max_rss_so_far is the peak up to the end of the
+    stage and may have been reached by an earlier stage. With cprofile, a
+    cProfile dump is written per Python stage. A disabled profiler only
+    runs the stages.
+    """
+    def __init__(self, out_dir, enabled=False, cprofile=False):
+        self.out_dir = out_dir
+        self.enabled = enabled or cprofile
+        self.cprofile = cprofile
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, tool=False):
+        """ Profile the enclosed block as stage name; tool stages mostly run external programs """
+        if not self.enabled:
+            yield
+            return
+        profile = None
+        if self.cprofile and not tool:
+            profile = cProfile.Profile()
+        start = self.sample()
+        if profile: profile.enable()
+        try:
+            yield
+        finally:
+            if profile: profile.disable()
+            end = self.sample()
+            record = {
+                'stage':name,
+                'tool':tool,
+                'wall_time':end['wall'] - start['wall'],
+                'cpu_time':end['cpu'] - start['cpu'],
+                'child_cpu_time':end['child_cpu'] - start['child_cpu'],
+                'max_rss_so_far':end['rss'],
+                'child_max_rss_so_far':end['child_rss']
+            }
+            if profile:
+                record['cprofile'] = os.path.join(self.out_dir, "profile", name+".prof")
+                if not os.path.exists(os.path.dirname(record['cprofile'])):
+                    os.makedirs(os.path.dirname(record['cprofile']))
+                profile.dump_stats(record['cprofile'])
+            self.stages.append(record)
+
+    def sample(self):
+        times = os.times()
+        # ru_maxrss is in KB on Linux
+        return {
+            'wall':time.perf_counter(),
+            'cpu':times.user + times.system,
+            'child_cpu':times.children_user + times.children_system,
+            'rss':resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024,
+            'child_rss':resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss*1024
+        }
+
+    def report(self, command):
+        """ Print a summary table and save profile.json """
+        if not self.enabled: return
+        print("Profile of `syncopation {}`".format(command))
+        print("  {:<32} {:>10} {:>10} {:>10} {:>14} {:>14}".format("stage", "wall (s)", "cpu (s)", "tools (s)", "max rss* (MB)", "tools* (MB)"))
+        for s in self.stages:
+            print("  {:<32} {:>10.2f} {:>10.2f} {:>10.2f} {:>14.1f} {:>14.1f}".format(s['stage'], s['wall_time'], s['cpu_time'],
+                s['child_cpu_time'], s['max_rss_so_far']/2.0**20, s['child_max_rss_so_far']/2.0**20))
+        total = sum([s['wall_time'] for s in self.stages])
+        python = sum([s['wall_time'] for s in self.stages if not s['tool']])
+        print("  {:<32} {:>10.2f} ({:.2f} s in Python stages)".format("total", total, python))
+        print("  * peak RSS since the start of the command, not of the stage")
+        profile_file = os.path.join(self.out_dir, "profile.json")
+        save(profile_file, {'command':command, 'stages':self.stages})
+        print("INFO: Saved profile to "+profile_file)
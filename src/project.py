@@ -24,15 +24,17 @@
 from .verilog_processing import get_rtl_data, get_modules, generate_roms, pull_out_state, get_num_bits, generate_temp_mif
 from .schedule_processing import get_hls_data
 from .string_templates import top_template
-from .misc import read_file, save
+from .misc import read_file
+from .cache import artifact_cache
 import os
 from .settings import *
 
-def add_synthesis_directives(verilog_file):
+def add_synthesis_directives(project):
     """
     Insert synthesis directives into RTL
     """
-    modules = get_modules(verilog_file)
+    verilog_file = project.verilog_file
+    modules = get_modules(project)
     modules = list(modules) + ['top']
 
     verilog = read_file(verilog_file)
@@ -51,52 +53,75 @@ def add_synthesis_directives(verilog_file):
         for line in verilog:
             out_f.write(line+'\n')
 
-def profile_rtl(verilog_file):
+def profile_rtl(project):
     """
-    Get data from RTL
+    Get data from RTL, restored from the artifact cache if the schedule
+    and RTL are unchanged
     """
-    project_folder = os.path.dirname(verilog_file)
-    project_name = verilog_file.split(".")[0]
-    out_dir = project_name+"_files"
+    project_folder = os.path.dirname(project.verilog_file)
+    schedule_file = os.path.join(project_folder,"scheduling.legup.rpt")
+    artifact_cache.run(project, "profile_rtl", [schedule_file, project.verilog_file], match_rtl_data)
+
+class RegisterIndex(object):
+    """
+    RTL registers indexed by every HLS register name they match, so a lookup
+    does not scan the registers. A register matches hls_reg (without '.' and
+    '-') if it contains _<hls_reg>_reg, _<hls_reg>_var (registers only) or
+    arg_<hls_reg>. Matches keep the order of the registers, without repeats.
+    """
+    def __init__(self, registers):
+        self.registers = list(registers)
+        self.positions = {}
+        for position, reg in enumerate(self.registers):
+            names = set()
+            underscores = [i for i, c in enumerate(reg) if c == '_']
+            for suffix in ('_reg', '_var'):
+                if suffix == '_var' and '_reg' not in reg: continue
+                ends = [i for i in underscores if reg.startswith(suffix, i)]
+                names.update([reg[i+1:j] for i in underscores for j in ends if j > i])
+            start = reg.find('arg_')
+            while start >= 0:
+                names.update([reg[start+4:j] for j in range(start+4, len(reg)+1)])
+                start = reg.find('arg_', start+1)
+            for name in names:
+                self.positions.setdefault(name, []).append(position)
+
+    def match(self, hls_reg):
+        hls_reg = hls_reg.replace('.','').replace('-','')
+        return list(dict.fromkeys([self.registers[i] for i in self.positions.get(hls_reg, [])]))
+
+def match_rtl_data(project):
+    """ Match HLS instructions, registers and states to the RTL """
     
-    get_hls_data(verilog_file)
-    get_rtl_data(verilog_file)
+    get_hls_data(project)
+    get_rtl_data(project)
 
     # generate resources
-    states_per_module = read_file(os.path.join(out_dir, "hls_statesPerModule.json"))
-    hls_instructions_per_state = read_file(os.path.join(out_dir, "hls_instructionsPerState.json"))
-    hls_instructions_per_module = read_file(os.path.join(out_dir, "hls_instructionsPerModule.json"))
-    hls_drains_per_instruction = read_file(os.path.join(out_dir, "hls_drainsPerInstruction.json"))
-    hls_sources_per_instruction = read_file(os.path.join(out_dir, "hls_sourcesPerInstruction.json"))
-    start_per_instruction = read_file(os.path.join(out_dir, "hls_startStatesPerInstruction.json"))
-    finish_per_instruction = read_file(os.path.join(out_dir, "hls_finishStatesPerInstruction.json"))
-    hls_regs_per_module = read_file(os.path.join(out_dir, "hls_regsPerModule.json"))
-    alloca_per_module = read_file(os.path.join(out_dir, "hls_allocaPerModule.json"))
-    basic_blocks_per_module = read_file(os.path.join(out_dir, "hls_basicBlocksPerModule.json"))
+    states_per_module = project.read("hls_statesPerModule.json")
+    hls_instructions_per_state = project.read("hls_instructionsPerState.json")
+    hls_instructions_per_module = project.read("hls_instructionsPerModule.json")
+    hls_drains_per_instruction = project.read("hls_drainsPerInstruction.json")
+    hls_sources_per_instruction = project.read("hls_sourcesPerInstruction.json")
+    start_per_instruction = project.read("hls_startStatesPerInstruction.json")
+    finish_per_instruction = project.read("hls_finishStatesPerInstruction.json")
+    hls_regs_per_module = project.read("hls_regsPerModule.json")
+    alloca_per_module = project.read("hls_allocaPerModule.json")
+    basic_blocks_per_module = project.read("hls_basicBlocksPerModule.json")
     
-    rtl_drains_per_state = read_file(os.path.join(out_dir, "rtl_regsPerState.json"))
-    rtl_drains_per_instruction = read_file(os.path.join(out_dir, "rtl_regsPerInstruction.json"))
-    constant_phi_per_state = read_file(os.path.join(out_dir, "rtl_constantPhiPerState.json"))
-    rtl_nodes_per_module = read_file(os.path.join(out_dir, "rtl_nodesPerModule.json"))
-    rtl_registers_per_module = read_file(os.path.join(out_dir, "rtl_regsPerModule.json"))
-
-    memory_per_instruction = read_file(os.path.join(out_dir, "rtl_memoriesPerInstruction.json"))
-    memory_instances = read_file(os.path.join(out_dir, "rtl_memoryInstances.json"))
-    memory_modules = read_file(os.path.join(out_dir, "rtl_memoryModules.json"))
+    rtl_drains_per_state = project.read("rtl_regsPerState.json")
+    rtl_drains_per_instruction = project.read("rtl_regsPerInstruction.json")
+    constant_phi_per_state = project.read("rtl_constantPhiPerState.json")
+    rtl_nodes_per_module = project.read("rtl_nodesPerModule.json")
+    rtl_registers_per_module = project.read("rtl_regsPerModule.json")
+
+    memory_per_instruction = project.read("rtl_memoriesPerInstruction.json")
+    memory_instances = project.read("rtl_memoryInstances.json")
+    memory_modules = project.read("rtl_memoryModules.json")
     
-    def rtl_reg_match(hls_reg, registers):
-        # remove extra punctuation
-        hls_reg = hls_reg.replace('.','').replace('-','')
-        matches = []
-        # look for module/hls reg match in rtl registers
-        for reg in registers:
-            if '_{}_reg'.format(hls_reg) in reg:
-                matches.append(reg)
-            if '_{}_var'.format(hls_reg) in reg and '_reg' in reg:
-                matches.append(reg)
-            if 'arg_{}'.format(hls_reg) in reg:
-                matches.append(reg)
-        return list(dict.fromkeys(matches))
+    # stage0 drains are only matched within their module
+    stage0_index = dict((module, RegisterIndex([d for d in rtl_drains_per_state.get('', []) if module in d])) for module in states_per_module.keys())
+    drains_index = dict((state, RegisterIndex(regs)) for state, regs in rtl_drains_per_state.items())
+    registers_index = dict((module, RegisterIndex(regs)) for module, regs in rtl_registers_per_module.items())
 
     drains_per_state = {}
     sources_per_state = {}
@@ -129,7 +154,7 @@ def profile_rtl(verilog_file):
 
                 for hls in hls_drains_per_instruction[instruction]:
                     if 'stage0' in hls and starts:
-                        matches = [d for d in rtl_reg_match(hls, rtl_drains_per_state['']) if module in d]
+                        matches = stage0_index[module].match(hls)
                         if len(matches) > 0:
                             if len(matches) > 1 and DEBUG: print(module, instruction, hls,matches)
                             assert(len(matches) == 1)
@@ -154,7 +179,7 @@ def profile_rtl(verilog_file):
                                 name_map[module][hls].append(match)
                                 name_map[module][hls] = list(dict.fromkeys(name_map[module][hls]))
                         else:
-                            matches = [d for d in rtl_reg_match(hls, rtl_drains_per_state[state]) if module in d]
+                            matches = [d for d in drains_index[state].match(hls) if module in d]
                             if len(matches) > 0:
                                 if len(matches) > 1 and DEBUG: print(module, instruction, hls,matches)
                                 assert(len(matches) == 1)
@@ -197,7 +222,7 @@ def profile_rtl(verilog_file):
             for instruction in rescheduled_hls[module][from_state].keys():
                 hls = rescheduled_hls[module][from_state][instruction]
                 for state in states_per_module[module]:
-                    matches = rtl_reg_match(hls, rtl_drains_per_state[state])
+                    matches = drains_index[state].match(hls)
                     assert(len(matches) <= 1)
                     for match in matches:
                         if state not in drains_per_state.keys():
@@ -232,7 +257,7 @@ def profile_rtl(verilog_file):
                                     if hls in name_map[module].keys():
                                         matches = name_map[module][hls]
                                     else:
-                                        matches = rtl_reg_match(hls, rtl_registers_per_module[module])
+                                        matches = registers_index[module].match(hls)
 
                                     if len(matches) > 0:
                                         if dest_state not in sources_per_state.keys():
@@ -247,7 +272,7 @@ def profile_rtl(verilog_file):
                                 if hls in name_map[module].keys():
                                     matches = name_map[module][hls]
                                 else:
-                                    matches = rtl_reg_match(hls, rtl_registers_per_module[module])
+                                    matches = registers_index[module].match(hls)
                                 
                                 if len(matches) > 0:
                                     if state not in sources_per_state.keys():
@@ -335,7 +360,7 @@ def profile_rtl(verilog_file):
     for k,v in sources_per_state.items(): 
         sources_per_state[k] = list(dict.fromkeys(v))
         count += len(v)
-    save(os.path.join(out_dir, "sourcesPerState.json"), sources_per_state)
+    project.save("sourcesPerState.json", sources_per_state)
     count = 0
     for k,v in drains_per_state.items(): 
         drains_per_state[k] = list(dict.fromkeys(v))
@@ -361,44 +386,51 @@ def profile_rtl(verilog_file):
                         elif state in rescheduled[module].keys() and instruction not in rescheduled[module][state].keys():
                             if DEBUG: print("DEBUG: State {} has no sources, drains - but should have instruction {}".format(state,instruction))
 
-    save(os.path.join(out_dir, "drainsPerState.json"), drains_per_state)
-    save(os.path.join(out_dir, "rescheduled.json"), rescheduled)
-    save(os.path.join(out_dir, "name_map.json"), name_map)
+    project.save("drainsPerState.json", drains_per_state)
+    project.save("rescheduled.json", rescheduled)
+    project.save("name_map.json", name_map)
 
     for k,v in memory_sources_per_state.items(): memory_sources_per_state[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir, "memorySourcesPerState.json"), memory_sources_per_state)
+    project.save("memorySourcesPerState.json", memory_sources_per_state)
     for k,v in memory_drains_per_state.items(): memory_drains_per_state[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir, "memoryDrainsPerState.json"), memory_drains_per_state)
+    project.save("memoryDrainsPerState.json", memory_drains_per_state)
 
-def get_module_data(pipeline, verilog_file):
-    pull_out_state(pipeline, verilog_file) 
+def get_module_data(pipeline, project):
+    pull_out_state(pipeline, project) 
 
-def insert_syncoption_hardware(pipeline, verilog_file):
+def insert_syncoption_hardware(pipeline, project):
     """
     Inserts Syncopation hardware into Verilog RTL file generated by LEGUP
     """
+    verilog_file = project.verilog_file
     # insert hardware into rtl
-    verilog = pull_out_state(pipeline, verilog_file) 
+    verilog = pull_out_state(pipeline, project) 
     # save back to file
     with open(verilog_file, 'w') as out_f:
         for line in verilog:
             out_f.write(line+'\n')
 
-    generate_roms(verilog_file)
-    generate_temp_mif(verilog_file)
+def generate_rom_files(project):
+    """
+    Divisor memories included by the Syncopation hardware, initialized
+    with the safest divisor until `syncopation synth`
+    """
+    generate_roms(project)
+    generate_temp_mif(project)
 
-def generate_top_module(no_sync_hardware, pipeline, verilog_file):
+def generate_top_module(no_sync_hardware, pipeline, project):
     """
     Generate top-level module to instantiate specified hardware.
     """
+    verilog_file = project.verilog_file
     project_name = verilog_file.split(".")[0]
     project_folder = os.path.dirname(os.path.abspath(verilog_file))
     out_dir = project_name+"_files"
     top_file = os.path.join(project_folder,'board_top.v')
 
-    num_bits = get_num_bits(verilog_file)
+    num_bits = get_num_bits(project)
     max_addr_w = max([n for m,n in num_bits.items()])
-    modules = get_modules(verilog_file)
+    modules = get_modules(project)
     num_instances = len(modules)
     top_template_dict = {'addr_w':max_addr_w, 'num_inst':num_instances, 'div_w':COUNTER_BITS}
 
@@ -21,19 +21,24 @@
 # IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #---------------------------------------------------------------------------
 
-from .misc import read_file, save
+from .misc import read_file
+from .cache import artifact_cache
 import re, os
 from .settings import *
 
-def get_hls_data(verilog_file):
+def get_hls_data(project):
+    """ Schedule data of the project, restored from the artifact cache if possible """
+    schedule_file = os.path.join(os.path.dirname(project.verilog_file),"scheduling.legup.rpt")
+    artifact_cache.run(project, "get_hls_data", [schedule_file], parse_hls_data)
+
+def parse_hls_data(project):
     """
     Extract States, Instructions, and Transitions from HLS Schedule
     As well as extracting sources and drains
     """
+    verilog_file = project.verilog_file
     project_folder = os.path.dirname(verilog_file)
     schedule_file = os.path.join(project_folder,"scheduling.legup.rpt")
-    project_name = verilog_file.split(".")[0]
-    out_dir = project_name+"_files"
 
     lines = read_file(schedule_file)
 
@@ -256,36 +261,36 @@ def get_hls_data(verilog_file):
             nstates_per_state[currentState].extend([n for n in next_states])
 
 
-    save(os.path.join(out_dir,"hls_instructions.csv"), instructions)
-    save(os.path.join(out_dir,"hls_states.csv"), states)
-    save(os.path.join(out_dir,"hls_modules.csv"), modules)
-    save(os.path.join(out_dir,"hls_registers.csv"), registers)
+    project.save("hls_instructions.csv", instructions)
+    project.save("hls_states.csv", states)
+    project.save("hls_modules.csv", modules)
+    project.save("hls_registers.csv", registers)
 
     for k,v in nstates_per_state.items(): nstates_per_state[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"hls_nstatesPerState.json"), nstates_per_state)
+    project.save("hls_nstatesPerState.json", nstates_per_state)
     for k,v in sources_per_state.items(): sources_per_state[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"hls_sourcesPerState.json"), sources_per_state)
+    project.save("hls_sourcesPerState.json", sources_per_state)
     for k,v in drains_per_state.items(): drains_per_state[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"hls_drainsPerState.json"), drains_per_state)
+    project.save("hls_drainsPerState.json", drains_per_state)
     for k,v in instructions_per_state.items(): instructions_per_state[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"hls_instructionsPerState.json"), instructions_per_state)
+    project.save("hls_instructionsPerState.json", instructions_per_state)
     for k,v in function_calls_per_state.items(): function_calls_per_state[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"hls_functionCallsPerState.json"), function_calls_per_state)
+    project.save("hls_functionCallsPerState.json", function_calls_per_state)
     
     for k,v in instructions_per_module.items(): instructions_per_module[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"hls_instructionsPerModule.json"), instructions_per_module)
+    project.save("hls_instructionsPerModule.json", instructions_per_module)
     for k,v in regs_per_module.items(): regs_per_module[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"hls_regsPerModule.json"), regs_per_module)
+    project.save("hls_regsPerModule.json", regs_per_module)
     for k,v in states_per_module.items(): states_per_module[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"hls_statesPerModule.json"), states_per_module)
+    project.save("hls_statesPerModule.json", states_per_module)
     for k,v in alloca_per_module.items(): alloca_per_module[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"hls_allocaPerModule.json"), alloca_per_module)
+    project.save("hls_allocaPerModule.json", alloca_per_module)
     for k,v in basic_blocks_per_module.items(): basic_blocks_per_module[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"hls_basicBlocksPerModule.json"), basic_blocks_per_module)
+    project.save("hls_basicBlocksPerModule.json", basic_blocks_per_module)
 
-    save(os.path.join(out_dir,"hls_startStatesPerInstruction.json"), starts_per_instruction)
-    save(os.path.join(out_dir,"hls_finishStatesPerInstruction.json"), finishes_per_instruction)
+    project.save("hls_startStatesPerInstruction.json", starts_per_instruction)
+    project.save("hls_finishStatesPerInstruction.json", finishes_per_instruction)
     for k,v in sources_per_instruction.items(): sources_per_instruction[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"hls_sourcesPerInstruction.json"), sources_per_instruction)
+    project.save("hls_sourcesPerInstruction.json", sources_per_instruction)
     for k,v in drains_per_instruction.items(): drains_per_instruction[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"hls_drainsPerInstruction.json"), drains_per_instruction)
+    project.save("hls_drainsPerInstruction.json", drains_per_instruction)
@@ -0,0 +1,154 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+import os, sys, re
+from .settings import *
+
+class SdcBuilder(object):
+    """
+    Collects set_max_delay constraints keyed by (from, to); single-ended
+    constraints leave the other side as None. A key constrained more than
+    once keeps its tightest (smallest) delay, so every pair is written once.
+    """
+    def __init__(self):
+        self.delays = {}
+
+    def __len__(self):
+        return len(self.delays)
+
+    def max_delay(self, delay, frm=None, to=None):
+        key = (frm, to)
+        delay = float(delay)
+        if key not in self.delays or delay < self.delays[key]:
+            self.delays[key] = delay
+
+    def keys(self, sort=True):
+        if sort: return sorted(self.delays.keys(), key=lambda k: (k[0] or '', k[1] or ''))
+        return list(self.delays.keys())
+
+    def lines(self, sort=True, compact=COMPACT_SDC):
+        """
+        Yield constraint lines, sorted by (from, to) or in insertion order.
+        With compact, endpoints sharing a delay are merged into collections.
+        """
+        if compact:
+            for froms, tos, delay in compact_constraints([(k, self.delays[k]) for k in self.keys(sort)]):
+                yield constraint_line(froms, tos, delay)
+        else:
+            for frm, to in self.keys(sort):
+                yield constraint_line([frm] if frm else [], [to] if to else [], "{:.3f}".format(self.delays[(frm, to)]))
+
+    def write(self, filename, sort=True, compact=COMPACT_SDC):
+        if DEBUG: print("DEBUG: Saving "+filename+" ({} constraints)".format(len(self)))
+        if not os.path.exists(os.path.dirname(os.path.abspath(filename))):
+            os.makedirs(os.path.dirname(os.path.abspath(filename)))
+        with open(filename, 'w+') as f:
+            for line in self.lines(sort, compact):
+                f.write(line)
+
+def collection(patterns):
+    if len(patterns) == 1: return patterns[0]
+    return "[get_keepers {{{}}}]".format(' '.join(patterns))
+
+def constraint_line(froms, tos, delay):
+    line = "set_max_delay"
+    if len(froms) > 0: line += " -from "+collection(froms)
+    if len(tos) > 0: line += " -to "+collection(tos)
+    return line+" "+delay+"\n"
+
+def compact_constraints(constraints):
+    """
+    Group ((from, to), delay) constraints into (froms, tos, delay) so that
+    every group covers exactly the pairs it replaces: single-ended endpoints
+    are grouped by delay, pairs first by source and delay, then sources with
+    an identical set of drains.
+    """
+    singles = {}
+    drains_per_source = {}
+    for (frm, to), delay in constraints:
+        delay = "{:.3f}".format(delay)
+        if to is None: key, reg = (('from', delay), frm)
+        elif frm is None: key, reg = (('to', delay), to)
+        else: key, reg = ((frm, delay), to)
+        groups = singles if (to is None or frm is None) else drains_per_source
+        if key not in groups: groups[key] = []
+        groups[key].append(reg)
+
+    sources_per_drains = {}
+    for (frm, delay), tos in drains_per_source.items():
+        key = (tuple(sorted(tos)), delay)
+        if key not in sources_per_drains: sources_per_drains[key] = []
+        sources_per_drains[key].append(frm)
+
+    for (direction, delay), regs in singles.items():
+        if direction == 'from': yield (regs, [], delay)
+        else: yield ([], regs, delay)
+    for (tos, delay), froms in sources_per_drains.items():
+        yield (froms, list(tos), delay)
+
+def read_constraints(filename):
+    """
+    Expand an sdc file into {(from, to): delay} over individual patterns,
+    collections are expanded into every pair they cover. Returns the
+    constraints and the number of pairs constrained more than once.
+    """
+    endpoint = re.compile(r'-(from|to) (\[get_\w+ \{([^}]*)\}\]|\S+)')
+    constraints = {}
+    duplicates = 0
+    with open(filename, 'r') as f:
+        for line in f:
+            words = line.split()
+            if len(words) == 0 or words[0] != "set_max_delay": continue
+            sides = {'from':[None], 'to':[None]}
+            for match in endpoint.finditer(line):
+                if match.group(3) is not None: sides[match.group(1)] = match.group(3).split()
+                else: sides[match.group(1)] = [match.group(2)]
+            delay = float(words[-1])
+            for frm in sides['from']:
+                for to in sides['to']:
+                    if (frm, to) in constraints:
+                        duplicates += 1
+                        constraints[(frm, to)] = min(delay, constraints[(frm, to)])
+                    else: constraints[(frm, to)] = delay
+    return constraints, duplicates
+
+def compare_sdc(file_a, file_b):
+    """ Print differences in effective set_max_delay constraints, return True if equivalent """
+    a, duplicates_a = read_constraints(file_a)
+    b, duplicates_b = read_constraints(file_b)
+    missing = [k for k in a.keys() if k not in b]
+    extra = [k for k in b.keys() if k not in a]
+    changed = [k for k in a.keys() if k in b and abs(a[k]-b[k]) > 0.0005]
+    print("INFO: {} constrains {} pairs ({} repeated), {} constrains {} pairs ({} repeated)".format(
+        file_a, len(a), duplicates_a, file_b, len(b), duplicates_b))
+    for k in missing: print("Only in {}: -from {} -to {} {}".format(file_a, k[0], k[1], a[k]))
+    for k in extra: print("Only in {}: -from {} -to {} {}".format(file_b, k[0], k[1], b[k]))
+    for k in changed: print("Changed: -from {} -to {} {} -> {}".format(k[0], k[1], a[k], b[k]))
+    return len(missing) == 0 and len(extra) == 0 and len(changed) == 0
+
+if __name__ == "__main__":
+    # python -m src.sdc <a.sdc> <b.sdc>
+    if len(sys.argv) != 3:
+        print("Usage: python -m src.sdc <a.sdc> <b.sdc>")
+        sys.exit(2)
+    sys.exit(0 if compare_sdc(sys.argv[1], sys.argv[2]) else 1)
@@ -32,4 +32,49 @@ TOOL_PATH, _ = os.path.split(os.path.abspath(__file__))
 DEBUG = True # to print additional messages
 VERBOSE = True
 PLL_CLOCK = 500.0
-COUNTER_BITS = 4
\ No newline at end of file
+COUNTER_BITS = 4
+EXPORT_FILES = True # also write every intermediate result as json/csv in <project>_files
+COMPACT_SDC = False # merge endpoints sharing a delay into [get_keepers] collections
+STA_WORKERS = 4 # concurrent quartus_sta processes for timing analysis
+# `--incremental_sta`: states are queried again if their previous slack is within
+# STA_REUSE_MARGIN ns of a divisor boundary, or the worst slack of their module moved
+# by more than STA_PROBE_MARGIN ns
+STA_REUSE_MARGIN = 0.05
+STA_PROBE_MARGIN = 0.01
+EXPLORE_WORKERS = os.cpu_count() or 1 # processes evaluating design points of `syncopation explore`
+FLOW_WORKERS = 4 # concurrent independent stages of `syncopation make`
+
+# `syncopation batch`: concurrent designs, and concurrent runs per external tool
+BATCH_JOBS = 4
+BATCH_TOOL_LIMITS = {'legup':4, 'modelsim':2, 'quartus':1, 'sta':2}
+# every tool a stage may start: make also sets up the Quartus project, synth
+# simulates alongside synthesis if there is no simulation log yet
+BATCH_STAGE_TOOLS = {'make':['legup', 'quartus'], 'modelsim':['modelsim'], 'synth':['modelsim', 'quartus', 'sta']}
+BATCH_STATE = "syncopation_batch.json"
+
+# Tool executables; point these at fake_tools/ to run the flow without Quartus
+TOOL_BIN = os.environ.get("SYNCOPATION_TOOL_BIN", "") # e.g. <syncopation>/src/fake_tools
+MAKE = os.path.join(TOOL_BIN, "make")
+QUARTUS_SH = os.path.join(TOOL_BIN, "quartus_sh")
+QUARTUS_CDB = os.path.join(TOOL_BIN, "quartus_cdb")
+QUARTUS_ASM = os.path.join(TOOL_BIN, "quartus_asm")
+QUARTUS_STA = os.environ.get("SYNCOPATION_QUARTUS_STA", os.path.join(TOOL_BIN, "quartus_sta"))
+
+# Tool output kept in memory by misc.execute: the last lines, plus every line
+# containing one of the EXECUTE_KEEP strings; the full output goes to log files
+EXECUTE_TAIL_LINES = 1000
+EXECUTE_KEEP = ["Slack: ", "MHz"]
+
+# Shared cache of parsed schedule/RTL artifacts, keyed by input hashes; only
+# used if SYNCOPATION_CACHE_DIR is set or with `syncopation make --cache`
+USE_CACHE = "SYNCOPATION_CACHE_DIR" in os.environ
+CACHE_DIR = os.environ.get("SYNCOPATION_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "syncopation"))
+CACHE_SIZE = 512 # MB; least recently used entries are evicted above this
+TOOL_VERSION = "1.0.0"
+
+# How the instrumented testbench records the state of every instance per cycle:
+# "text" prints STATE lines to the Modelsim log, "binary" writes TRACE_FILE with $fwrite,
+# "changes" prints CHANGE lines for the active call chain only when a state changes
+STATE_TRACE = "text"
+TRACE_FILE = "state_trace.bin"
+TRACE_FIELD = 128 # bytes per header field of the binary trace
@@ -0,0 +1,147 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+import os, sys
+import subprocess, queue
+from concurrent.futures import ThreadPoolExecutor
+
+from .settings import *
+
+class StaSession(object):
+    """
+    Long-lived quartus_sta process running tcl/sta_session.tcl.
+    The project is opened and the timing netlist is built once; slack
+    queries are then sent over stdin and answered without restarting
+    the tool. The process is started on the first query, so constraint
+    files written before that point are read without a reload.
+    """
+    def __init__(self, project_folder):
+        self.project_folder = project_folder
+        self.process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        command = [QUARTUS_STA, '-t', os.path.join(TOOL_PATH, 'tcl', 'sta_session.tcl')]
+        if VERBOSE:
+            print("VERBOSE: Starting timing session `"+' '.join(command)+"` in dir "+self.project_folder)
+        self.process = subprocess.Popen(command, cwd=self.project_folder, stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1)
+        self.read_reply("STA_READY")
+
+    def read_reply(self, marker="STA_DONE"):
+        """ Return output lines up to (not including) the marker line """
+        lines = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                print("ERROR: Timing session exited unexpectedly")
+                print('\n'.join(lines))
+                sys.exit(2)
+            line = line.rstrip('\n')
+            if line.strip() == marker:
+                return lines
+            lines.append(line)
+
+    def query(self, command):
+        """ Send one command to the session, return its output as a list of lines """
+        if self.process is None:
+            self.start()
+        self.process.stdin.write(command+'\n')
+        self.process.stdin.flush()
+        return self.read_reply()
+
+    def report_longest(self, clock, to=None, frm=None):
+        """ Worst setup slack on clock, optionally restricted to paths from frm to to """
+        if to is None:
+            return self.query("longest {}".format(clock))
+        return self.query("longest {} {{{}}} {{{}}}".format(clock, to, frm))
+
+    def report_fmax(self):
+        return self.query("fmax")
+
+    def reload(self):
+        """ Re-read sdc files after they have been rewritten """
+        if self.process is not None:
+            self.query("reload")
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write("exit\n")
+            self.process.stdin.close()
+            self.process.wait(timeout=60)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+class StaPool(object):
+    """
+    Fixed set of timing sessions queried concurrently. Each session is its
+    own quartus_sta process; threads only wait on their output. An existing
+    session can be passed in to become one of the workers.
+    """
+    def __init__(self, project_folder, workers, sta=None):
+        self.sessions = [] if sta is None else [sta]
+        self.owned = [StaSession(project_folder) for _ in range(max(workers, 1) - len(self.sessions))]
+        self.sessions.extend(self.owned)
+        self.idle = queue.Queue()
+        for session in self.sessions:
+            self.idle.put(session)
+        self.executor = ThreadPoolExecutor(max_workers=len(self.sessions))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def run(self, function, item):
+        session = self.idle.get()
+        try:
+            return function(session, item)
+        finally:
+            self.idle.put(session)
+
+    def map(self, function, items):
+        """ Return [function(session, item) for item in items], run across the sessions """
+        return list(self.executor.map(lambda item: self.run(function, item), items))
+
+    def reload(self):
+        list(self.executor.map(lambda session: session.reload(), self.sessions))
+
+    def close(self):
+        self.executor.shutdown()
+        for session in self.owned:
+            session.close()
+
+def get_slack(lines):
+    """ Slack value from the `Slack:` line of a timing report """
+    slack = [l for l in lines if "Slack: " in l]
+    return float(slack[0].split()[-1])
@@ -142,23 +142,27 @@ read_sdc $$project_sdc
 update_timing_netlist
 
 """)
-request_template = Template("""puts "report_timing -from_clock { dyn_clk } -to_clock { dyn_clk } -setup -${dir} ${reg} -nworst 1"
-set tuple [report_timing -from_clock { dyn_clk } -to_clock { dyn_clk } -setup -${dir} ${reg} -nworst 1]
-set num [lindex $$tuple 0]
-set result [lindex $$tuple 1]
-puts "State ${state} ${dir} ${reg} $priority Delay $$result"
-""") # dir = to/from, Type = Drain/Source
-
-request_template_dual = Template("""puts "report_timing -from_clock { dyn_clk } -to_clock { dyn_clk } -setup -to ${to} -from ${from} -nworst 1"
-set tuple [report_timing -from_clock { dyn_clk } -to_clock { dyn_clk } -setup -to ${to} -from ${from} -nworst 1]
-set num [lindex $$tuple 0]
-set result [lindex $$tuple 1]
-puts "State ${state} from $from to $to $priority Delay $$result"
-""") 
-
-sdc_template = Template("""
-set_max_delay -${dir} ${reg} ${freq}
-""")
+
+query_proc = """proc query {key args} {
+    global results
+    if {![info exists results($key)]} {
+        puts "report_timing -from_clock { dyn_clk } -to_clock { dyn_clk } -setup $args -nworst 1"
+        set tuple [report_timing -from_clock { dyn_clk } -to_clock { dyn_clk } -setup {*}$args -nworst 1]
+        set results($key) [lindex $tuple 1]
+    }
+    return $results($key)
+}
+
+""" # each distinct query is issued once per shard, args = -to/-from reg or -to reg -from reg
+
+query_template = Template("""set result [query ${key} ${args}]
+puts "State ${state} ${endpoints} ${priority} Delay $$result"
+if {$$result < 0} { ${flags} }
+""") # flags = set {neg(...)} 1 for every endpoint and state the violation settles
+
+guard_template = Template("""if {${condition}} {
+${body}}
+""") # condition = ![info exists {neg(...)}] terms joined by || or &&
 
 sdc_template_dual = Template("""
 set_max_delay -from ${from} -to ${to} ${freq}
@@ -24,10 +24,12 @@
 """Syncopation
 
 Usage:
-    syncopation make [--no_synth_directives] [--add_synth_directives] [--no_sync_hardware] [--pipeline]
+    syncopation make [--no_synth_directives] [--add_synth_directives] [--no_sync_hardware] [--pipeline] [--force] [--cache] [--profile] [--cprofile]
     syncopation modelsim [--log=<LOG_FILE>]
-    syncopation synth [--log=<LOG_FILE>] [--enhanced_synthesis] [--no_synthesis] [--no_sta]
-    syncopation timing
+    syncopation synth [--log=<LOG_FILE>] [--enhanced_synthesis] [--no_synthesis] [--no_sta] [--incremental_sta] [--profile] [--cprofile]
+    syncopation timing [--incremental_sta] [--profile] [--cprofile]
+    syncopation explore [--pll=<MHZ>] [--counter_bits=<BITS>] [--workers=<N>] [--select=<POINT>]
+    syncopation batch <design_dir>... [--stages=<STAGES>] [--jobs=<N>] [--state=<STATE_FILE>] [--out=<CSV_FILE>] [--no_sync_hardware] [--pipeline]
     syncopation -h|--help
 
 Options:
@@ -36,118 +38,66 @@ Options:
     --add_synth_directives  Add synthesis directives to baseline circuit
     --no_sync_hardware      No syncopation DMs, clock generator
     --pipeline              Pipeline the divisor selection logic; use conservative predict
+    --force                 Rerun every stage, also those whose results are up to date
+    --cache                 Reuse parsed schedule/RTL results through the artifact cache (default SYNCOPATION_CACHE_DIR or ~/.cache/syncopation)
     --enhanced_synthesis    If no enhanced synthesis constraints are found, generate them. If found, resynthesize
     --no_synthesis          Perform performance eval without resynthesizing design
     --no_sta                Perform synthesis without performance eval/fine-grained sta
+    --incremental_sta       Only re-query states whose timing may have changed since the last fine-grained sta
     --log=<LOG_FILE>        Modelsim log file generated by simulation and used to assess Syncopation performance
+    --profile               Record wall time, CPU time and peak memory so far per stage in <project>_files/profile.json
+    --cprofile              Also write a cProfile dump per Python stage to <project>_files/profile
+    --pll=<MHZ>             Comma-separated PLL frequencies to explore [default: 500,630]
+    --counter_bits=<BITS>   Comma-separated divisor counter widths to explore [default: 3,4,5,6]
+    --workers=<N>           Processes evaluating design points (default EXPLORE_WORKERS)
+    --select=<POINT>        Regenerate divisor memories for a point given as <MHZ>:<BITS>
+    --stages=<STAGES>       Comma-separated stages run for each design [default: make,modelsim,synth]
+    --jobs=<N>              Designs processed concurrently (default BATCH_JOBS)
+    --state=<STATE_FILE>    Batch progress, completed stages are skipped when resuming (default BATCH_STATE)
+    --out=<CSV_FILE>        Combined results of all designs [default: syncopation_batch.csv]
 """
 
-import subprocess, os, shutil
-from .misc import execute, clean_file, save, read_file
+import subprocess, os, sys, shutil, threading, hashlib
+from concurrent.futures import ThreadPoolExecutor
+from .misc import execute, clean_file, save, read_file, get_source_file
 import getopt
 from docopt import docopt
-from .project import generate_top_module, insert_syncoption_hardware, profile_rtl, add_synthesis_directives, get_module_data
-from .synthesis import perform_sta, get_dynamic_timing, generate_clock_settings, generate_mif_files, get_simulation_performance, get_timing_constraints
+from .project import generate_top_module, insert_syncoption_hardware, generate_rom_files, profile_rtl, add_synthesis_directives, get_module_data
+from .synthesis import perform_sta, get_dynamic_timing, generate_clock_settings, generate_mif_files, get_simulation_performance, get_timing_constraints, get_default_log
+from .sta_session import StaSession, get_slack
+from .model import Project
+from .cache import artifact_cache
+from .explore import explore, select_point
+from .batch import run_batch
+from .profiling import StageProfiler
+from .flow import Flow
 from .settings import *
 
 #################################
 ######### Setup Project #########
 #################################
-def make_project(c_file, no_synth_directives, add_synth_directives, no_sync_hardware, pipeline):
-    """ Generates Syncopation Hardware, Project Files """
+def make_project(c_file, no_synth_directives, add_synth_directives, no_sync_hardware, pipeline, profile=False, cprofile=False, force=False):
+    """
+    Generates Syncopation Hardware, Project Files. Stages whose results are
+    up to date are skipped, see flow.py.
+    """
 
     # create project name based on input file
     project_name = c_file.split(".")[0]
     verilog_file = project_name+'.v'
     project_folder = os.path.dirname(os.path.abspath(c_file))
     output_directory = project_name+"_files"
-
-    # Create folder and generate Makefile
-    print("INFO: Creating project...") 
-    if os.path.exists(output_directory):
-        shutil.rmtree(output_directory, ignore_errors=True)
-    os.makedirs(output_directory)
-    # remove pll, verilog, tcl...
-    if os.path.exists(os.path.join(project_folder,"pll")):
-        shutil.rmtree(os.path.join(project_folder,"pll"))
-    if os.path.exists(os.path.join(project_folder,"sdc")):
-        shutil.rmtree(os.path.join(project_folder,"sdc"))
-    if os.path.exists(os.path.join(project_folder,"dynamic_clock.v")):
-        os.remove(os.path.join(project_folder,"dynamic_clock.v"))
-    if os.path.exists(os.path.join(project_folder,"setup_sync_proj.tcl")):
-        os.remove(os.path.join(project_folder,"setup_sync_proj.tcl"))
-    if os.path.exists(os.path.join(project_folder,project_name+"_record.v")):
-        os.remove(os.path.join(project_folder,project_name+"_record.v"))
-    if os.path.exists(os.path.join(project_folder,"board_top.v")):
-        os.remove(os.path.join(project_folder,"board_top.v"))
-    if os.path.exists(os.path.join(project_folder,"connect_top.v")):
-        os.remove(os.path.join(project_folder,"connect_top.v"))
-
-    # make:
-    print("INFO: Cleaning previous files...")
-    execute(["make","clean"], cd=project_folder, wait=True)
-    execute(["make"], cd=project_folder, wait=True)
-    # backup copy of verilog
-    shutil.copy(verilog_file,project_name+"_record.v")
-
-    # Clean away sdc timing constraint files
-    # enhanced synthesis constraints
+    record_file = project_name+"_record.v"
+    schedule_file = os.path.join(project_folder, "scheduling.legup.rpt")
+    # timing constraints: enhanced synthesis, debug, fmax and project
     sdc_file = os.path.join(project_folder, 'sdc', "path_delays.sdc")
-    clean_file(sdc_file)
-    # debug constraints
     sdc_file_debug = os.path.join(project_folder, 'sdc', "path_delays_debug.sdc")
-    clean_file(sdc_file_debug)
     sdc_file_fmax = os.path.join(project_folder, 'sdc', "fmax_delay.sdc")
-    clean_file(sdc_file_fmax)
-
-    # make p:
-    print("INFO: Generating Quartus Project...")
-    # project constraints
     sdc_file_project = project_name+".sdc"
-    clean_file(sdc_file_project) # to be repopulated later
-
-    # move plls
-    shutil.copytree(os.path.join(TOOL_PATH,"pll",str(int(PLL_CLOCK))), os.path.join(project_folder,"pll"))
-    # move clock file
-    shutil.copy(os.path.join(TOOL_PATH, "verilog", "dynamic_clock.v"), os.path.join(project_folder, "dynamic_clock.v"))
-    # move tcl file
-    shutil.copy(os.path.join(TOOL_PATH, "tcl", "setup_sync_proj.tcl"), os.path.join(project_folder, "setup_sync_proj.tcl"))
-
-    execute(["make","p"], cd=project_folder, wait=True)
 
-    # add synthesis directives
-    add_directives = bool(no_sync_hardware==False and no_synth_directives==False) or bool(no_sync_hardware==True and add_synth_directives==True)
-    if add_directives: 
-        print("INFO: Adding synthesis directives")
-        add_synthesis_directives(verilog_file)
-
-    if no_sync_hardware: # make project without syncopation hardware
-        # custom sdc
-        with open(sdc_file_project, 'w') as out_f:
-            out_f.write("create_clock -period 2.000 -name CLOCK_50 [get_ports CLOCK_50]\n")
-            out_f.write("derive_pll_clocks\n")
-            out_f.write("derive_clock_uncertainty\n")
-        shutil.copy(os.path.join(TOOL_PATH, "verilog", "de1_top.v"), os.path.join(project_folder, "connect_top.v"))
-        profile_rtl(verilog_file)
-        get_module_data(pipeline, verilog_file)
-    else: 
-        with open(sdc_file_project, 'w') as out_f:
-            print("INFO: Saving project sdc file "+sdc_file_project)
-            out_f.write("create_clock -period 20.000 -name CLOCK_50 [get_ports CLOCK_50]\n")
-            out_f.write("derive_pll_clocks\n")
-            out_f.write("create_clock -period 2 -name dyn_clk [get_nodes connect_top_INST|dynamic_clock:CLOCK_GEN|clk]\n")
-            out_f.write("set_false_path -from dyn_clk -to {connect_top_INST|PLL_INST|pll_inst|altera_pll_i|general[0].gpll~PLL_OUTPUT_COUNTER|divclk}\n")
-            out_f.write("derive_clock_uncertainty")
-        shutil.copy(os.path.join(TOOL_PATH, "verilog", "syncopation_top.v"), os.path.join(project_folder, "connect_top.v"))
-        
-        # Profile rtl to determine parameters
-        profile_rtl(verilog_file)
-
-        # Insert Syncopation hardware
-        insert_syncoption_hardware(pipeline, verilog_file)
-
-    generate_top_module(no_sync_hardware, pipeline, verilog_file)
-    execute(["quartus_sh", "-t", "setup_sync_proj.tcl"], cd=project_folder, wait=True)
+    print("INFO: Creating project...") 
+    profiler = StageProfiler(output_directory, profile, cprofile)
+    project = Project(verilog_file)
 
     # save settings such as pipeline/synth directives
     settings = {
@@ -155,12 +105,110 @@ def make_project(c_file, no_synth_directives, add_synth_directives, no_sync_hard
         'no_synth_directives':no_synth_directives,
         'no_sync_hardware':no_sync_hardware
     }
-    settings = save(os.path.join(output_directory, "settings.json"), settings)
+    if project.exists("settings.json") and project.read("settings.json") != settings:
+        print("INFO: Options differ from the previous `syncopation make`, rebuilding every stage...")
+        force = True
+
+    def make():
+        print("INFO: Cleaning previous files...")
+        if os.path.exists(output_directory):
+            shutil.rmtree(output_directory, ignore_errors=True)
+        os.makedirs(output_directory)
+        project.clear()
+        execute([MAKE,"clean"], cd=project_folder, wait=True)
+        execute([MAKE], cd=project_folder, wait=True)
+        # backup copy of verilog
+        shutil.copy(verilog_file, record_file)
+
+    def copy_files():
+        # move plls
+        if os.path.exists(os.path.join(project_folder,"pll")):
+            shutil.rmtree(os.path.join(project_folder,"pll"))
+        shutil.copytree(os.path.join(TOOL_PATH,"pll",str(int(PLL_CLOCK))), os.path.join(project_folder,"pll"))
+        # move clock file
+        shutil.copy(os.path.join(TOOL_PATH, "verilog", "dynamic_clock.v"), os.path.join(project_folder, "dynamic_clock.v"))
+        # move tcl file
+        shutil.copy(os.path.join(TOOL_PATH, "tcl", "setup_sync_proj.tcl"), os.path.join(project_folder, "setup_sync_proj.tcl"))
+        if no_sync_hardware: connect_top = "de1_top.v"
+        else: connect_top = "syncopation_top.v"
+        shutil.copy(os.path.join(TOOL_PATH, "verilog", connect_top), os.path.join(project_folder, "connect_top.v"))
+
+    def clean_sdc():
+        # Clean away sdc timing constraint files
+        if os.path.exists(os.path.join(project_folder,"sdc")):
+            shutil.rmtree(os.path.join(project_folder,"sdc"))
+        clean_file(sdc_file)
+        clean_file(sdc_file_debug)
+        clean_file(sdc_file_fmax)
+        if no_sync_hardware: # make project without syncopation hardware
+            # custom sdc
+            with open(sdc_file_project, 'w') as out_f:
+                out_f.write("create_clock -period 2.000 -name CLOCK_50 [get_ports CLOCK_50]\n")
+                out_f.write("derive_pll_clocks\n")
+                out_f.write("derive_clock_uncertainty\n")
+        else:
+            with open(sdc_file_project, 'w') as out_f:
+                print("INFO: Saving project sdc file "+sdc_file_project)
+                out_f.write("create_clock -period 20.000 -name CLOCK_50 [get_ports CLOCK_50]\n")
+                out_f.write("derive_pll_clocks\n")
+                out_f.write("create_clock -period 2 -name dyn_clk [get_nodes connect_top_INST|dynamic_clock:CLOCK_GEN|clk]\n")
+                out_f.write("set_false_path -from dyn_clk -to {connect_top_INST|PLL_INST|pll_inst|altera_pll_i|general[0].gpll~PLL_OUTPUT_COUNTER|divclk}\n")
+                out_f.write("derive_clock_uncertainty")
+
+    def make_p():
+        print("INFO: Generating Quartus Project...")
+        execute([MAKE,"p"], cd=project_folder, wait=True)
+
+    def restore_rtl():
+        # the stages below edit the verilog in place, start from the LegUp output
+        shutil.copy(record_file, verilog_file)
+
+    def directives():
+        print("INFO: Adding synthesis directives")
+        add_synthesis_directives(project)
+
+    # python stages rerun when syncopation or the settings they use change
+    digest = hashlib.sha256(artifact_cache.digest().encode())
+    digest.update(repr((PLL_CLOCK, COUNTER_BITS)).encode())
+    # profiled stages run one at a time, the CPU times of the profiler are process-wide
+    flow = Flow(os.path.join(output_directory, "flow"), profiler, force, workers=1 if profile or cprofile else FLOW_WORKERS, digest=digest.hexdigest())
+    flow.add("make", make, inputs=[c_file, "Makefile"], outputs=[record_file, schedule_file], tool=True)
+    flow.add("copy_files", copy_files, outputs=["pll", "dynamic_clock.v", "setup_sync_proj.tcl", "connect_top.v"], after=["make"],
+        sources=[os.path.join(TOOL_PATH, "pll", str(int(PLL_CLOCK))), os.path.join(TOOL_PATH, "verilog"), os.path.join(TOOL_PATH, "tcl")])
+    flow.add("clean_sdc", clean_sdc, outputs=[sdc_file, sdc_file_debug, sdc_file_fmax, sdc_file_project], after=["make"])
+    # make p reads the LegUp verilog, the RTL is only edited once it is done
+    flow.add("make_p", make_p, inputs=[record_file], after=["make"], tool=True)
+    flow.add("restore_rtl", restore_rtl, inputs=[record_file], after=["make_p"])
+    rtl = "restore_rtl"
+    add_directives = bool(no_sync_hardware==False and no_synth_directives==False) or bool(no_sync_hardware==True and add_synth_directives==True)
+    if add_directives: 
+        flow.add("add_synthesis_directives", directives, after=[rtl])
+        rtl = "add_synthesis_directives"
+    flow.add("profile_rtl", lambda: profile_rtl(project), inputs=[schedule_file], after=[rtl])
+    if no_sync_hardware:
+        flow.add("get_module_data", lambda: get_module_data(pipeline, project), after=["profile_rtl"])
+        rtl = "get_module_data"
+        roms = []
+    else:
+        # Insert Syncopation hardware
+        flow.add("insert_syncopation_hardware", lambda: insert_syncoption_hardware(pipeline, project), after=["profile_rtl"])
+        rtl = "insert_syncopation_hardware"
+        flow.add("generate_rom_files", lambda: generate_rom_files(project), outputs=[os.path.join(output_directory, "rom")], after=[rtl])
+        roms = ["generate_rom_files"]
+    # stages share the Project, which is not locked, so the RTL stages run one after another
+    flow.add("generate_top_module", lambda: generate_top_module(no_sync_hardware, pipeline, project), outputs=["board_top.v"], after=[rtl] + roms)
+    flow.add("setup_sync_proj", lambda: execute([QUARTUS_SH, "-t", "setup_sync_proj.tcl"], cd=project_folder, wait=True),
+        after=["make_p", "copy_files", "clean_sdc", "generate_top_module"] + roms, tool=True)
+    flow.run()
+
+    project.save("settings.json", settings)
+    project.store()
+    profiler.report("make")
 
 ###################################
 ############# Simulate ############
 ###################################
-def run_modelsim(c_file, log_file=None):
+def run_modelsim(c_file, log_file=None, background=False, cancel=None):
     """ Runs modelsim to test results """
     print("INFO: Starting Modelsim...")
     project_name = c_file.split(".")[0]
@@ -169,23 +217,70 @@ def run_modelsim(c_file, log_file=None):
     output_directory = project_name+"_files"
 
     if log_file == None: log_file = os.path.join(output_directory, "modelsim.log")
-    out = execute(["make","v"], cd=project_folder, print_output=True)
-    save(log_file, out)
+    if background: # only the log, so the output does not interleave with synthesis
+        execute([MAKE,"v"], cd=project_folder, quiet=True, t=None, log_file=log_file, cancel=cancel)
+    else:
+        execute([MAKE,"v"], cd=project_folder, print_output=True, log_file=log_file, cancel=cancel)
+
+class BackgroundSimulation(object):
+    """
+    Default Modelsim run started alongside synthesis. The state trace only
+    depends on the state sequence, not on the divisor memories, so it can
+    run while Quartus fits the design. If the run is cancelled or fails,
+    its incomplete state trace is removed so it is not mistaken for a
+    finished one later.
+    """
+    def __init__(self, c_file, trace_file):
+        self.trace_file = trace_file
+        self.cancelled = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        log_file = None if STATE_TRACE == "binary" else trace_file
+        self.future = self.executor.submit(run_modelsim, c_file, log_file, True, self.cancelled)
+
+    def discard(self):
+        if os.path.exists(self.trace_file): os.remove(self.trace_file)
+
+    def result(self):
+        """ Wait for the simulation, exits if it did not produce a state trace """
+        try:
+            self.future.result()
+        except Exception as e:
+            self.discard()
+            print("ERROR: Default simulation failed: {}".format(e))
+            sys.exit(2)
+        finally:
+            self.executor.shutdown()
+        if not os.path.exists(self.trace_file) or os.path.getsize(self.trace_file) == 0:
+            self.discard()
+            print("ERROR: Default simulation did not write a state trace to "+self.trace_file)
+            sys.exit(2)
+
+    def cancel(self):
+        """ Stop the simulation if it is still running """
+        if self.future.done():
+            if self.future.exception(): self.discard()
+            return
+        print("INFO: Cancelling default simulation...")
+        self.cancelled.set()
+        self.executor.shutdown()
+        self.discard()
 
 ############################################
 ############# Synthesize design ############
 ############################################
-def make_synthesis(c_file, enhanced_synthesis, no_synth, no_sta, log_file=None):
+def make_synthesis(c_file, enhanced_synthesis, no_synth, no_sta, log_file=None, profile=False, cprofile=False, incremental_sta=False):
     """ Synthesize hardware """
     # create project name based on input file
     project_name = c_file.split(".")[0]
     verilog_file = project_name+'.v'
     project_folder = os.path.dirname(os.path.abspath(c_file))
     output_directory = project_name+"_files"
-    if log_file == None: log_file = os.path.join(output_directory, "modelsim.log")
+    profiler = StageProfiler(output_directory, profile, cprofile)
 
     # load settings such as pipeline/synth directives
-    settings = read_file(os.path.join(output_directory, "settings.json"))
+    project = Project(verilog_file)
+    if log_file == None: log_file = get_default_log(project)
+    settings = project.read("settings.json")
     pipeline = settings['pipeline']
     no_synth_directives = settings['no_synth_directives']
     no_sync_hardware = settings['no_sync_hardware']
@@ -202,99 +297,129 @@ def make_synthesis(c_file, enhanced_synthesis, no_synth, no_sta, log_file=None):
     sdc_file_fmax = os.path.join(project_folder, 'sdc', "fmax_delay.sdc")
     clean_file(sdc_file_fmax)
 
-    generating_es = False
-    if not enhanced_synthesis: # clean file to not impact timing
-        clean_file(sdc_file)
-        if no_synth:
-            print("INFO: Skipping synthesis pass because --no_synth was specified...")
-        else:
-            print("INFO: Synthesizing...")
-            execute(["make","f"], cd=project_folder, print_output=True)
-    else: 
-        sdc_contents = read_file(sdc_file)
-        if len(sdc_contents) > 1: 
+    # run modelsim to determine performance, in the background while synthesizing
+    simulation = None
+    if not no_sync_hardware and not os.path.exists(log_file):
+        print("INFO: Simulation log not found.")
+        print("INFO: A custom modelsim log can be specified by running `syncopation modelsim` with the option --log=<LOG_FILE>")
+        print("INFO: Performing default simulation alongside synthesis. This may take some time...")
+        simulation = BackgroundSimulation(c_file, log_file)
+
+    try:
+        generating_es = False
+        if not enhanced_synthesis: # clean file to not impact timing
+            clean_file(sdc_file)
             if no_synth:
-                print("INFO: Skipping enhanced synthesis pass because --no_synth was specified...")
-            else:
-                print("INFO: Synthesizing with enhanced synthesis constraints...")
-                execute(["make","f"], cd=project_folder, print_output=True)
-        else: 
-            generating_es = True
-            if no_synth:
-                print("INFO: Skipping synthesis pass because --no_synth was specified. Generating ES constraints...")
+                print("INFO: Skipping synthesis pass because --no_synth was specified...")
             else:
                 print("INFO: Synthesizing...")
-                execute(["make","f"], cd=project_folder, print_output=True)
-
-    if no_sync_hardware:
-        print("INFO: Checking max operating frequency...")
-        result = execute(['quartus_sta', '-t', os.path.join(TOOL_PATH, 'tcl','fmax_check.tcl')], cd=project_folder, quiet=True)
-        freq = [l for l in result.split('\n') if 'MHz' in l]
-        freq = freq[0].strip().split()[2]
-        print("FMAX: "+ freq)
-        print("INFO: Saving result to "+os.path.join(output_directory,'no_sync_fmax.csv'))
-        save(os.path.join(output_directory,'no_sync_fmax.csv'), [freq])
-        profile_rtl(verilog_file)
-        get_module_data(pipeline, verilog_file)
-        get_timing_constraints(verilog_file, True)
-    else: # with syncopation hardware
-        clean_file(sdc_file)
-        result = execute(['quartus_sta', '-t', os.path.join(TOOL_PATH, 'tcl','report_longest.tcl')], cd=project_folder, quiet=True)
-        result = result.split('\n')
-        slack = [l for l in result if "Slack: "  in l]
-        slack = float(slack[0].split()[-1])
-        max_frequency = 1000.0/(2-slack)
-        print("FMAX "+str(max_frequency))
-        print("Note: Syncopation performance is not determined by FMAX.")
-        print("      Effective frequency is more indicative of circuit performance.")
-
-        if no_sta:
-            print("INFO: Skipping updating fine-grained STA because --no_sta was specified.")
-            print("INFO: Skipping updating memory contents and project because --no_sta was specified.")
-            print("      Run `quartus_cdb --update_mif top` and `quartus_asm top` to update memories.")
-        else:
-            print("INFO: Executing tcl script for fine-grained static timing analysis...")
-            perform_sta(verilog_file)
-            print("INFO: Determining dynamic clock settings...")
+                with profiler.stage("make_f", tool=True):
+                    execute([MAKE,"f"], cd=project_folder, print_output=True)
+        else: 
+            sdc_contents = read_file(sdc_file)
+            if len(sdc_contents) > 1: 
+                if no_synth:
+                    print("INFO: Skipping enhanced synthesis pass because --no_synth was specified...")
+                else:
+                    print("INFO: Synthesizing with enhanced synthesis constraints...")
+                    with profiler.stage("make_f", tool=True):
+                        execute([MAKE,"f"], cd=project_folder, print_output=True)
+            else: 
+                generating_es = True
+                if no_synth:
+                    print("INFO: Skipping synthesis pass because --no_synth was specified. Generating ES constraints...")
+                else:
+                    print("INFO: Synthesizing...")
+                    with profiler.stage("make_f", tool=True):
+                        execute([MAKE,"f"], cd=project_folder, print_output=True)
+
+        # one timing session serves every slack query of this run
+        with StaSession(project_folder) as sta:
+            if no_sync_hardware:
+                print("INFO: Checking max operating frequency...")
+                with profiler.stage("report_fmax", tool=True):
+                    result = sta.report_fmax()
+                freq = [l for l in result if 'MHz' in l]
+                freq = freq[0].strip().split()[2]
+                print("FMAX: "+ freq)
+                print("INFO: Saving result to "+os.path.join(output_directory,'no_sync_fmax.csv'))
+                save(os.path.join(output_directory,'no_sync_fmax.csv'), [freq])
+                with profiler.stage("profile_rtl"):
+                    profile_rtl(project)
+                with profiler.stage("get_module_data"):
+                    get_module_data(pipeline, project)
+                with profiler.stage("get_timing_constraints"):
+                    get_timing_constraints(project, True, sta)
+            else: # with syncopation hardware
+                clean_file(sdc_file)
+                with profiler.stage("report_fmax", tool=True):
+                    slack = get_slack(sta.report_longest("dyn_clk"))
+                max_frequency = 1000.0/(2-slack)
+                print("FMAX "+str(max_frequency))
+                print("Note: Syncopation performance is not determined by FMAX.")
+                print("      Effective frequency is more indicative of circuit performance.")
+
+                if no_sta:
+                    print("INFO: Skipping updating fine-grained STA because --no_sta was specified.")
+                    print("INFO: Skipping updating memory contents and project because --no_sta was specified.")
+                    print("      Run `quartus_cdb --update_mif top` and `quartus_asm top` to update memories.")
+                else:
+                    print("INFO: Executing tcl script for fine-grained static timing analysis...")
+                    with profiler.stage("perform_sta", tool=True):
+                        perform_sta(project, sta=sta, incremental=incremental_sta)
+                    print("INFO: Determining dynamic clock settings...")
             
-        get_dynamic_timing(verilog_file, False) # enhanced_synthesis is False to generate correct sdc constraints
-        if not no_sta: get_timing_constraints(verilog_file)
-        clean_file(sdc_file_fmax)
-        generate_clock_settings(verilog_file, pipeline) # determine frequencies per state
-        generate_mif_files(verilog_file, pipeline) # populate divisor memories
-        if not no_sta:
-            print("INFO: Updating project memory contents...")
-            # execute(["quartus_cdb", "--update_mif", "top"], cd=project_folder, wait=True)
-            # execute(["quartus_asm", "top"], cd=project_folder, wait=True)
-
-        if no_synth_directives:
-            print("INFO: Synthesis directives not present. Configuration may result in data corruption")
-        # run modelsim to determine performance
-        if not os.path.exists(log_file):
-            print("INFO: Simulation log not found.")
-            print("INFO: A custom modelsim log can be specified by running `syncopation modelsim` with the option --log=<LOG_FILE>")
-            # need to run simulation...
-            print("INFO: Performing default simulation. This may take some time...")
-            run_modelsim(c_file, log_file=log_file)
-        if enhanced_synthesis and not generating_es:
-            print("INFO: Evaluating Syncopation enhanced synthesis performance...")
-        else:
-            print("INFO: Evaluating Syncopation performance...")
-
-        get_simulation_performance(verilog_file, pipeline, log_file=log_file)
+                with profiler.stage("get_dynamic_timing"):
+                    get_dynamic_timing(project, False) # enhanced_synthesis is False to generate correct sdc constraints
+                with profiler.stage("get_timing_constraints"):
+                    if not no_sta: get_timing_constraints(project, sta=sta)
 
-        if enhanced_synthesis: 
-            print("INFO: Generating enhanced synthesis constraints.")
-            if generating_es: 
-                print("      Run synthesis again to determine performance...")
-            get_dynamic_timing(verilog_file, enhanced_synthesis)
+        if no_sync_hardware:
+            project.store()
+        else:
+            clean_file(sdc_file_fmax)
+            with profiler.stage("generate_clock_settings"):
+                generate_clock_settings(project, pipeline) # determine frequencies per state
+            with profiler.stage("generate_mif_files"):
+                generate_mif_files(project, pipeline) # populate divisor memories
+            if not no_sta:
+                print("INFO: Updating project memory contents...")
+                # execute([QUARTUS_CDB, "--update_mif", "top"], cd=project_folder, wait=True)
+                # execute([QUARTUS_ASM, "top"], cd=project_folder, wait=True)
+
+            if no_synth_directives:
+                print("INFO: Synthesis directives not present. Configuration may result in data corruption")
+            # the default simulation meets synthesis here
+            if simulation:
+                print("INFO: Waiting for the default simulation...")
+                with profiler.stage("modelsim", tool=True):
+                    simulation.result()
+            if enhanced_synthesis and not generating_es:
+                print("INFO: Evaluating Syncopation enhanced synthesis performance...")
+            else:
+                print("INFO: Evaluating Syncopation performance...")
+
+            with profiler.stage("get_simulation_performance"):
+                get_simulation_performance(project, pipeline, log_file=log_file)
+
+            if enhanced_synthesis: 
+                print("INFO: Generating enhanced synthesis constraints.")
+                if generating_es: 
+                    print("      Run synthesis again to determine performance...")
+                with profiler.stage("get_dynamic_timing_enhanced"):
+                    get_dynamic_timing(project, enhanced_synthesis)
+            project.store()
+    finally:
+        # synthesis failed or was interrupted before the simulation was needed
+        if simulation: simulation.cancel()
 
     clean_file(sdc_file_debug)
+    profiler.report("synth")
 
 #############################################
 ############# Generate timing files #########
 #############################################
-def make_timing(c_file, clean_timing):
+def make_timing(c_file, profile=False, cprofile=False, incremental_sta=False):
     """ Make SDC File """
     print("Generating SDC File")
     # create project name based on input file
@@ -302,8 +427,10 @@ def make_timing(c_file, clean_timing):
     verilog_file = project_name+'.v'
     project_folder = os.path.dirname(os.path.abspath(c_file))
     output_directory = project_name+"_files"
+    profiler = StageProfiler(output_directory, profile, cprofile)
 
-    settings = read_file(os.path.join(output_directory, "settings.json"))
+    project = Project(verilog_file)
+    settings = project.read("settings.json")
     pipeline = settings['pipeline']
     no_synth_directives = settings['no_synth_directives']
     no_sync_hardware = settings['no_sync_hardware']
@@ -315,30 +442,59 @@ def make_timing(c_file, clean_timing):
     clean_file(sdc_file)
     clean_file(sdc_file_fmax)
 
-    result = execute(['quartus_sta', '-t', os.path.join(TOOL_PATH, 'tcl','report_longest.tcl')], cd=project_folder, quiet=True)
-    result = result.split('\n')
-    slack = [l for l in result if "Slack: "  in l]
-    slack = float(slack[0].split()[-1])
-    max_frequency = 1000.0/(2-slack)
-    print("FMAX "+str(max_frequency))
-    print("Note: Syncopation performance is not determined by FMAX.")
-    print("      Effective frequency is more indicative of circuit performance.")
-    
-    print("INFO: Executing tcl script for fine-grained static timing analysis...")
-    perform_sta(verilog_file)
-    print("INFO: Determining dynamic clock settings...")
-    
-    get_dynamic_timing(verilog_file, False) # enhanced_synthesis is False to generate correct sdc constraints
-    get_timing_constraints(verilog_file)
-    generate_clock_settings(verilog_file, pipeline)
-    generate_mif_files(verilog_file, pipeline)
+    with StaSession(project_folder) as sta:
+        with profiler.stage("report_fmax", tool=True):
+            slack = get_slack(sta.report_longest("dyn_clk"))
+        max_frequency = 1000.0/(2-slack)
+        print("FMAX "+str(max_frequency))
+        print("Note: Syncopation performance is not determined by FMAX.")
+        print("      Effective frequency is more indicative of circuit performance.")
+
+        print("INFO: Executing tcl script for fine-grained static timing analysis...")
+        with profiler.stage("perform_sta", tool=True):
+            perform_sta(project, sta=sta, incremental=incremental_sta)
+        print("INFO: Determining dynamic clock settings...")
+
+        with profiler.stage("get_dynamic_timing"):
+            get_dynamic_timing(project, False) # enhanced_synthesis is False to generate correct sdc constraints
+        with profiler.stage("get_timing_constraints"):
+            get_timing_constraints(project, sta=sta)
+    with profiler.stage("generate_clock_settings"):
+        generate_clock_settings(project, pipeline)
+    with profiler.stage("generate_mif_files"):
+        generate_mif_files(project, pipeline)
+    project.store()
 
     print("INFO: Updating project memory contents...")
-    execute(["quartus_cdb", "--update_mif", "top"], cd=project_folder, wait=True)
-    execute(["quartus_asm", "top"], cd=project_folder, wait=True)
+    with profiler.stage("update_mif", tool=True):
+        execute([QUARTUS_CDB, "--update_mif", "top"], cd=project_folder, wait=True)
+        execute([QUARTUS_ASM, "top"], cd=project_folder, wait=True)
 
     print("INFO: generated file "+sdc_file_debug)
     print("INFO: generated file "+sdc_file_fmax)
+    profiler.report("timing")
+
+##############################################
+############# Explore design space ###########
+##############################################
+def make_exploration(c_file, pll_clocks, counter_widths, workers=None, select=None):
+    """ Evaluate PLL frequencies and divisor widths on the last simulation """
+    project_name = c_file.split(".")[0]
+    verilog_file = project_name+'.v'
+
+    project = Project(verilog_file)
+    settings = project.read("settings.json")
+    pipeline = settings['pipeline']
+
+    if select:
+        pll_clock, counter_bits = select.split(":")
+        select_point(project, pipeline, float(pll_clock), int(counter_bits))
+    else:
+        pll_clocks = [float(f) for f in pll_clocks.split(",")]
+        counter_widths = [int(b) for b in counter_widths.split(",")]
+        if workers: explore(project, pipeline, pll_clocks, counter_widths, int(workers))
+        else: explore(project, pipeline, pll_clocks, counter_widths)
+    project.store()
 
 ####################################
 ########### Main Routine ###########
@@ -347,31 +503,35 @@ def main():
     # Get user arguments
     options = docopt(__doc__)
 
-    src = ''
-    if os.path.exists('Makefile'):
-        with open('Makefile', 'r') as mfile:
-            for line in mfile:
-                if 'SRCS' in line:
-                    src = line.split('=')[1].strip()
-                if 'NAME' in line:
-                    name = line.split('=')[1].strip()
-    else:
+    if options["batch"]:
+        run_batch(options["<design_dir>"], options["--stages"], options["--jobs"], options["--state"], options["--out"],
+            options["--no_sync_hardware"], options["--pipeline"])
+        return
+
+    src = get_source_file()
+    if src == None:
         print("ERROR: No makefile found in current directory.")
         exit(0)
-
-    if src == '':
-        src = name + '.c'
     
     if not os.path.exists(src): 
         print("ERROR: No source file {} found in current directory.".format(src))
         exit(0)
 
     # Run Syncopation using user options
+    if options["--cache"]: artifact_cache.enabled = True
     if options["make"]:
-        make_project(src, options["--no_synth_directives"], options["--add_synth_directives"], options["--no_sync_hardware"], options["--pipeline"])
+        make_project(src, options["--no_synth_directives"], options["--add_synth_directives"], options["--no_sync_hardware"], options["--pipeline"],
+            options["--profile"], options["--cprofile"], options["--force"])
     if options["modelsim"]:
         run_modelsim(src, log_file=options["--log"])
     if options["synth"]:
-        make_synthesis(src, options["--enhanced_synthesis"], options["--no_synthesis"], options["--no_sta"], options["--log"])
+        make_synthesis(src, options["--enhanced_synthesis"], options["--no_synthesis"], options["--no_sta"], options["--log"],
+            options["--profile"], options["--cprofile"], options["--incremental_sta"])
     if options["timing"]:
-        make_timing(src)
+        make_timing(src, options["--profile"], options["--cprofile"], options["--incremental_sta"])
+    if options["explore"]:
+        make_exploration(src, options["--pll"], options["--counter_bits"], options["--workers"], options["--select"])
+    artifact_cache.report()
+
+if __name__ == "__main__":
+    main()
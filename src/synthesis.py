@@ -21,34 +21,149 @@
 # IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #---------------------------------------------------------------------------
 
-from .misc import read_file, execute, save
-import os, math
-from .string_templates import header_template, request_template, request_template_dual, sdc_template, sdc_template_dual
+from .misc import execute, save
+import os, sys, math
+import numpy as np
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from .string_templates import header_template, query_proc, query_template, guard_template, sdc_template_dual
 from .verilog_processing import get_num_bits, get_num_nStates, get_states
+from .sdc import SdcBuilder
+from .sta_session import StaSession, StaPool, get_slack
+from .transitions import TransitionCounts
 from .settings import *
 
-def perform_sta(verilog_file):
+def contiguous_shards(weights, num_shards):
+    """
+    Split weighted items, in order, into at most num_shards runs of about
+    equal weight. Returns the item indices of each non-empty shard.
+    """
+    total = sum(weights)
+    shards = [[]]
+    load = 0
+    for idx, weight in enumerate(weights):
+        if len(shards) < num_shards and len(shards[-1]) > 0 and load >= total*len(shards)/num_shards:
+            shards.append([])
+        shards[-1].append(idx)
+        load += weight
+    return [shard for shard in shards if len(shard) > 0]
+
+def index_sta_results(result):
+    """
+    Parse the `State ... Delay` lines of an STA log once.
+    Returns delays keyed by (state, priority, direction, endpoint) and by
+    (state, priority). Endpoints are the queried patterns without the
+    trailing wildcard, so `main_1_reg` and `main_10_reg` stay distinct.
+    """
+    delays_per_endpoint = {}
+    delays_per_state = {}
+    def add(d, key, delay):
+        if key not in d: d[key] = []
+        d[key].append(delay)
+
+    for line in result:
+        words = line.split()
+        if len(words) < 7 or words[0] != 'State' or words[-2] != 'Delay':
+            continue
+        state = words[1]
+        priority = words[-3]
+        delay = float(words[-1])
+        add(delays_per_state, (state, priority), delay)
+        if len(words) == 9: # from <source> to <drain>
+            add(delays_per_endpoint, (state, priority, words[2], words[3].rstrip('*')), delay)
+            add(delays_per_endpoint, (state, priority, words[4], words[5].rstrip('*')), delay)
+        else: # <dir> <reg>
+            add(delays_per_endpoint, (state, priority, words[2], words[3].rstrip('*')), delay)
+    return delays_per_endpoint, delays_per_state
+
+def slack_to_frequency(slack):
+    """ State frequency in MHz for a worst slack on the 2 ns (500 MHz) SDC clock, 0 means no path """
+    if slack == 0: return 500
+    return min(1000.0/(2-slack), 500)
+
+def near_divisor_boundary(slack, margin=STA_REUSE_MARGIN):
+    """ True if a slack change within margin could change the divisor of a state """
+    try:
+        return get_frequency_div(slack_to_frequency(slack-margin)) != get_frequency_div(slack_to_frequency(slack+margin))
+    except AssertionError: # too slow for the divisor counter either way
+        return True
+
+def probe_modules(sta, states_per_module):
+    """ Worst slack of the paths within each module, a cheap check whether a re-fit changed it """
+    probe = {}
+    for module in states_per_module.keys():
+        if module == "main": inst = "main_inst"
+        else: inst = module
+        path = "*|{}:{}|".format(module,inst)
+        try: probe[module] = get_slack(sta.report_longest("dyn_clk", path+"*", path+"*"))
+        except (IndexError, ValueError): probe[module] = None # no path
+    return probe
+
+def get_requery_states(project, states_per_module, requests_per_state, probe):
+    """
+    States whose STA results cannot be carried over from the previous run:
+    their requested paths changed, their previous slack is close to a
+    divisor boundary, or the probe of their module moved
+    """
+    previous_requests = project.read("sta_requests.json")
+    previous_slack = project.read("minSlackPerState.json")
+    previous_probe = project.read("sta_probe.json") if project.exists("sta_probe.json") else {}
+
+    changed, near, moved = [], [], []
+    for module, states in states_per_module.items():
+        module_moved = probe is None or module not in previous_probe or probe[module] != previous_probe[module] and (
+            probe[module] is None or previous_probe[module] is None or abs(probe[module]-previous_probe[module]) > STA_PROBE_MARGIN)
+        for state in states:
+            if previous_requests.get(state) != requests_per_state.get(state, []) or state not in previous_slack:
+                changed.append(state)
+            elif module_moved:
+                moved.append(state)
+            elif near_divisor_boundary(previous_slack[state]):
+                near.append(state)
+    num_states = sum([len(states) for states in states_per_module.values()])
+    print("INFO: Incremental STA re-queries {} of {} states: {} with changed paths, {} in modules changed by the re-fit, {} near a divisor boundary".format(
+        len(changed)+len(moved)+len(near), num_states, len(changed), len(moved), len(near)))
+    return set(changed + moved + near)
+
+def perform_sta(project, shards=STA_WORKERS, sta=None, incremental=False):
+    """
+    Fine-grained STA of every state. The queries and results per state are
+    kept in the project; with incremental, only the states selected by
+    get_requery_states are queried again and the others keep their
+    previous results. sta is the timing session used to probe the modules
+    for an incremental run.
+    """
+    verilog_file = project.verilog_file
     project_folder = os.path.dirname(os.path.abspath(verilog_file))
-    project_name = verilog_file.split(".")[0]
-    out_dir = project_name+"_files"
+    project_name = project.project_name
+    out_dir = project.out_dir
 
-    states_per_module = read_file(os.path.join(out_dir,"hls_statesPerModule.json"))
-    drains_per_state = read_file(os.path.join(out_dir, "drainsPerState.json"))
-    sources_per_state = read_file(os.path.join(out_dir, "sourcesPerState.json"))
-    memory_drains_per_state = read_file(os.path.join(out_dir, "memoryDrainsPerState.json"))
-    memory_sources_per_state = read_file(os.path.join(out_dir, "memorySourcesPerState.json"))
-    instructions_per_state = read_file(os.path.join(out_dir, "hls_instructionsPerState.json"))
+    states_per_module = project.read("hls_statesPerModule.json")
+    drains_per_state = project.read("drainsPerState.json")
+    sources_per_state = project.read("sourcesPerState.json")
+    memory_drains_per_state = project.read("memoryDrainsPerState.json")
+    memory_sources_per_state = project.read("memorySourcesPerState.json")
+    instructions_per_state = project.read("hls_instructionsPerState.json")
 
-    tcl_file = os.path.join(out_dir, 'sta.tcl')
     sdc_file = project_name + '.sdc'
 
-    lines = header_template.substitute({"sdc":sdc_file})
+    # every distinct report_timing query is issued once per shard, its
+    # result is printed for each (state, priority) that requested it
+    requests_per_query = {}
+    def request(state, priority, to=None, frm=None):
+        if (to, frm) not in requests_per_query:
+            requests_per_query[(to, frm)] = []
+        requests_per_query[(to, frm)].append((state, priority))
 
+    # endpoints whose lower priority results count towards the state slack, see endpoint_slack
+    consulted_per_state = {}
     for module,states in states_per_module.items():
         if module == "main": inst = "main_inst"
         else: inst = module
         path = "*|{}:{}|".format(module,inst)
         for state in states:
+            consulted_per_state[state] = set([("to", path+d) for d in drains_per_state[state]])
+            consulted_per_state[state].update([("from", "*|"+inst+"_"+s if 'arg' in s else path+s) for s in sources_per_state[state]])
             sources = []
             sources.extend([path+s for s in sources_per_state[state] if 'arg_' not in s])
             sources.extend(["*|"+inst+"_"+s for s in sources_per_state[state] if 'arg_' in s])
@@ -58,43 +173,150 @@ def perform_sta(verilog_file):
             drains.extend(memory_drains_per_state[state])
             for source in sources:
                 for drain in drains:
-                    lines += request_template_dual.substitute({"priority":"Priority1", "to":drain+"*", "from":source+"*", "state":state})
-
-                # lines += request_template_dual.substitute({"priority":"Priority1", "to":path+"cur_state*", "from":source+"*", "state":state})
-                # lines += request_template_dual.substitute({"priority":"Priority1", "to":"*|top_inst|div_top_reg*", "from":source+"*", "state":state})
-                # lines += request_template_dual.substitute({"priority":"Priority1", "to":path+module+"_rom*", "from":source+"*", "state":state})
-                lines += request_template.substitute({"priority":"Priority2", "reg":source+"*", "dir":"from", "state":state})
-                # lines += request_template_dual.substitute({"priority":"Priority2", "to":path+"cur_state*", "from":source+"*", "state":state})
+                    request(state, "Priority1", to=drain+"*", frm=source+"*")
+                request(state, "Priority2", frm=source+"*")
 
             for drain in drains:
-                # lines += request_template_dual.substitute({"priority":"Priority1", "from":path+"cur_state*", "to":drain+"*", "state":state})
                 if "finish" in drain or "return_val" in drain:
-                    lines += request_template.substitute({"priority":"Priority1", "reg":drain+"*", "dir":"from", "state":state})
-                
-                # lines += request_template_dual.substitute({"priority":"Priority2", "from":path+"cur_state*", "to":drain+"*", "state":state})
-                lines += request_template.substitute({"priority":"Priority2", "reg":drain+"*", "dir":"to", "state":state})
-            
-            if 'LEGUP_0' in state:
-                lines += request_template.substitute({"priority":"Priority1", "reg":path+"start*", "dir":"to", "state":state})
-                lines += request_template.substitute({"priority":"Priority1", "reg":"*"+module+"_arg*", "dir":"from", "state":state})
+                    request(state, "Priority1", frm=drain+"*")
+                request(state, "Priority2", to=drain+"*")
 
-            # if len(drains) == 0 and len(sources) == 0:
-                # lines += request_template_dual.substitute({"priority":"Priority2", "to":path+"cur_state*", "from":path+"cur_state*", "state":state})
-
-
-            # lines += request_template_dual.substitute({"priority":"Priority3", "to":path+module+"_rom*", "from":path+"cur_state*", "state":state})
-            # lines += request_template_dual.substitute({"priority":"Priority3", "to":path+"cur_state*", "from":path+"cur_state*", "state":state})
-            # lines += request_template_dual.substitute({"priority":"Priority3", "to":"*|top_inst|div_top_reg*", "from":path+"cur_state*", "state":state})
-
-    save(tcl_file, lines)
-
-    result = execute(['quartus_sta', '-t', tcl_file], t=5000, cd=project_folder, quiet=True)
-    result = result.split('\n')
+            if 'LEGUP_0' in state:
+                request(state, "Priority1", to=path+"start*")
+                request(state, "Priority1", frm="*"+module+"_arg*")
+
+    requests_per_state = {}
+    for (to, frm), requests in requests_per_query.items():
+        for state, priority in requests:
+            requests_per_state.setdefault(state, []).append("{} {} {}".format(priority, to, frm))
+    for state in requests_per_state.keys():
+        requests_per_state[state].sort()
+
+    # the probe is only taken for incremental runs; without a session the
+    # re-fit cannot be checked, so every state is queried
+    probe = None
+    if incremental and sta is None:
+        print("INFO: No timing session to probe the modules, incremental STA queries every state...")
+        incremental = False
+    elif incremental:
+        probe = probe_modules(sta, states_per_module)
+    requery = None # every state
+    previous_results = {}
+    if incremental and project.exists("sta_requests.json") and project.exists("sta_results.json"):
+        requery = get_requery_states(project, states_per_module, requests_per_state, probe)
+        previous_results = project.read("sta_results.json")
+        for query in list(requests_per_query.keys()):
+            requests_per_query[query] = [r for r in requests_per_query[query] if r[0] in requery]
+            if len(requests_per_query[query]) == 0: del requests_per_query[query]
+    elif incremental:
+        print("INFO: No previous STA results, querying every state...")
+
+    # Priority2/3 results only count while no higher priority path they are
+    # combined with violates, so the script skips them at run time:
+    # - on an endpoint consulted by endpoint_slack, once every consulted
+    #   endpoint of the query has a violating path
+    # - otherwise (backup and worst case slack), once any path of the state
+    #   violates, and for Priority3 also once a backup path violates
+    query_ids = {}
+    requests_per_state_query = {}
+    for (to, frm), requests in requests_per_query.items():
+        for state, priority in requests:
+            requests_per_state_query.setdefault(state, []).append((priority, to, frm))
+
+    def negative(flags, op):
+        return op.join(["![info exists {{neg({})}}]".format(flag) for flag in flags])
+
+    def state_script(state):
+        lines = ''
+        for priority in ("Priority1", "Priority2", "Priority3"):
+            for request_priority, to, frm in requests_per_state_query[state]:
+                if request_priority != priority: continue
+                if (to, frm) not in query_ids: query_ids[(to, frm)] = len(query_ids)
+                endpoints = []
+                if frm is None:
+                    args = "-to "+to
+                    description = "to "+to
+                elif to is None:
+                    args = "-from "+frm
+                    description = "from "+frm
+                else:
+                    args = "-to {} -from {}".format(to, frm)
+                    description = "from {} to {}".format(frm, to)
+                if frm is not None: endpoints.append(("from", frm.rstrip('*')))
+                if to is not None: endpoints.append(("to", to.rstrip('*')))
+                consulted = ["{} {} {}".format(state, d, e) for d, e in endpoints if (d, e) in consulted_per_state[state]]
+
+                flags = list(consulted)
+                if priority == "Priority1" or len(consulted) > 0: flags.append(state)
+                else: flags.append(state+" "+{"Priority2":"backup", "Priority3":"worstcase"}[priority])
+                body = query_template.substitute({"key":query_ids[(to, frm)], "args":args, "state":state,
+                    "endpoints":description, "priority":priority,
+                    "flags":"; ".join(["set {{neg({})}} 1".format(flag) for flag in flags])})
+                if priority == "Priority1": condition = None
+                elif len(consulted) > 0: condition = negative(consulted, " || ")
+                elif priority == "Priority2": condition = negative([state], " && ")
+                else: condition = negative([state, state+" backup"], " && ")
+                if condition is not None: body = guard_template.substitute({"condition":condition, "body":body})
+                lines += body
+        return lines
+
+    # shard by contiguous runs of states, so the queries they share stay in one shard
+    states = [state for module_states in states_per_module.values() for state in module_states if state in requests_per_state_query]
+    num_requests = sum([len(requests_per_state_query[state]) for state in states])
+    shards = contiguous_shards([len(requests_per_state_query[state]) for state in states], shards)
+    tcl_files = []
+    for i, shard in enumerate(shards):
+        if len(shards) == 1: tcl_file = os.path.join(out_dir, 'sta.tcl')
+        else: tcl_file = os.path.join(out_dir, 'sta_{}.tcl'.format(i))
+        query_ids.clear()
+        lines = header_template.substitute({"sdc":sdc_file})
+        lines += query_proc
+        lines += ''.join([state_script(states[idx]) for idx in shard])
+        save(tcl_file, lines)
+        tcl_files.append((tcl_file, len(query_ids)))
+
+    def run_shard(shard):
+        # only the result lines are kept, the full report goes to the shard log
+        tcl_file, _ = shard
+        lines = []
+        issued = [0]
+        def on_line(l):
+            l = l.lstrip()
+            if l.startswith('State '): lines.append(l)
+            elif l.startswith('report_timing '): issued[0] += 1
+        execute([QUARTUS_STA, '-t', tcl_file], t=5000, cd=project_folder, quiet=True,
+            log_file=os.path.splitext(tcl_file)[0]+'.log', on_line=on_line)
+        return '\n'.join(lines), issued[0]
+    with ThreadPoolExecutor(max_workers=max(len(tcl_files), 1)) as executor:
+        shard_results = list(executor.map(run_shard, tcl_files))
+    num_queries = sum([num for _, num in tcl_files])
+    num_issued = sum([issued for _, issued in shard_results])
+    print("INFO: {} of {} timing queries issued for {} requests, the others could not change the state slack".format(
+        num_issued, num_queries, num_requests))
+    result = [l for l in '\n'.join([lines for lines, _ in shard_results]).split('\n') if l]
+
+    # results per state, carried over for the states that were not queried
+    results_per_state = {}
+    for module,states in states_per_module.items():
+        for state in states:
+            if requery is None or state in requery: results_per_state[state] = []
+            else: results_per_state[state] = previous_results.get(state, [])
+    for line in result:
+        words = line.split()
+        if len(words) > 1 and words[1] in results_per_state:
+            results_per_state[words[1]].append(line)
+    result = [l for lines in results_per_state.values() for l in lines]
+    # sta_results.log only holds the `State <state> <endpoints> <priority> Delay <slack>`
+    # lines, one per (state, priority) request of an issued query, grouped per
+    # state in module order and including the lines carried over by an
+    # incremental run. The full report_timing output is in sta.log, or sta_<i>.log per shard.
     save(os.path.join(out_dir, "sta_results.log"), result)
+    project.save("sta_requests.json", requests_per_state)
+    project.save("sta_results.json", results_per_state)
+    # a full run leaves no probe, so the next incremental run queries every state once more
+    project.save("sta_probe.json", probe if probe is not None else {})
 
-    delay_vals_one = [line for line in result if 'Delay' in line and 'State' in line and "Priority1" in line]
-    delay_vals_two = [line for line in result if 'Delay' in line and 'State' in line and "Priority2" in line]
-    delay_vals_three = [line for line in result if 'Delay' in line and 'State' in line and "Priority3" in line]
+    delays_per_endpoint, delays_per_state = index_sta_results(result)
 
     minSlackPerState = {}
     backupSlackPerState = {}
@@ -107,54 +329,37 @@ def perform_sta(verilog_file):
             worstcaseSlackPerState[state] = 0
             slacksPerState[state] = []
 
+    def endpoint_slack(state, direction, endpoint):
+        # lower priority results only count if no higher priority path violates
+        delays = [0]
+        for priority in ("Priority1", "Priority2", "Priority3"):
+            if min(delays) < 0: break
+            delays.extend(delays_per_endpoint.get((state, priority, direction, endpoint), []))
+        return min(delays)
+
     for module,states in states_per_module.items():
         if module == "main": inst = "main_inst"
         else: inst = module
         path = "*|{}:{}|".format(module,inst)
         for state in states:
-            drains = drains_per_state[state]
-            sources = sources_per_state[state]
-            results1 = [l for l in delay_vals_one if state in l]
-            results2 = [l for l in delay_vals_two if state in l]
-            results3 = [l for l in delay_vals_three if state in l]
             slacksPerState[state] = [0]
-            for d in drains:
-                delays = [0]
-                d_path = "to "+path+d
-                delays.extend([float(l.split()[-1]) for l in results1 if d_path in l])
-                if min(delays) >= 0:
-                    delays.extend([float(l.split()[-1]) for l in results2 if d_path in l])
-                if min(delays) >= 0:
-                    delays.extend([float(l.split()[-1]) for l in results3 if d_path in l])
-                slacksPerState[state].append(min(delays))
-            for s in sources:
+            for d in drains_per_state[state]:
+                slacksPerState[state].append(endpoint_slack(state, "to", path+d))
+            for s in sources_per_state[state]:
                 if 'arg' in s:
-                    s_path = "from *|"+inst+"_"+s
-                else: s_path = "from "+path+s
-                delays = [0]
-                delays.extend([float(l.split()[-1]) for l in results1 if s_path in l])
-                if min(delays) >= 0:
-                    delays.extend([float(l.split()[-1]) for l in results2 if s_path in l])
-                if min(delays) >= 0:
-                    delays.extend([float(l.split()[-1]) for l in results3 if s_path in l])
-                slacksPerState[state].append(min(delays))
+                    s_path = "*|"+inst+"_"+s
+                else: s_path = path+s
+                slacksPerState[state].append(endpoint_slack(state, "from", s_path))
             minSlackPerState[state] = min(slacksPerState[state])
 
-    for val in delay_vals_one:
-        state = val.split(' ')[1]
-        delay = float(val.split(' ')[-1])
-        if delay < minSlackPerState[state]: minSlackPerState[state] = delay 
-        slacksPerState[state].append(delay)
-
-    for val in delay_vals_two:
-        state = val.split(' ')[1]
-        delay = float(val.split(' ')[-1])
-        if delay < backupSlackPerState[state]: backupSlackPerState[state] = delay 
-
-    for val in delay_vals_three:
-        state = val.split(' ')[1]
-        delay = float(val.split(' ')[-1])
-        if delay < worstcaseSlackPerState[state]: worstcaseSlackPerState[state] = delay 
+    for (state, priority), delays in delays_per_state.items():
+        if priority == "Priority1":
+            minSlackPerState[state] = min([minSlackPerState[state]] + delays)
+            slacksPerState[state].extend(delays)
+        elif priority == "Priority2":
+            backupSlackPerState[state] = min([backupSlackPerState[state]] + delays)
+        elif priority == "Priority3":
+            worstcaseSlackPerState[state] = min([worstcaseSlackPerState[state]] + delays)
 
     for state, delay in minSlackPerState.items():
         if delay == 0:
@@ -180,30 +385,33 @@ def perform_sta(verilog_file):
         else:
             frequencyPerState[state] = 500
 
-    save(os.path.join(out_dir, "frequencyPerState.json"), frequencyPerState)
+    project.save("frequencyPerState.json", frequencyPerState)
 
-    save(os.path.join(out_dir, "minSlackPerState.json"), minSlackPerState)
-    save(os.path.join(out_dir, "backupSlackPerState.json"), backupSlackPerState)
-    save(os.path.join(out_dir, "worstcaseSlackPerState.json"), worstcaseSlackPerState)
-    save(os.path.join(out_dir, "slacksPerState.json"), slacksPerState)
+    project.save("minSlackPerState.json", minSlackPerState)
+    # diagnostics only: the Priority2/3 queries skipped by the script once a
+    # higher priority path violates are missing here, so these can be less
+    # negative than a run of every query. minSlackPerState and
+    # frequencyPerState do not depend on the skipped queries.
+    project.save("backupSlackPerState.json", backupSlackPerState)
+    project.save("worstcaseSlackPerState.json", worstcaseSlackPerState)
+    project.save("slacksPerState.json", slacksPerState)
 
-def get_dynamic_timing(verilog_file, enhanced_synthesis):
+def get_dynamic_timing(project, enhanced_synthesis):
+    verilog_file = project.verilog_file
     project_folder = os.path.dirname(verilog_file)
-    project_name = verilog_file.split(".")[0]
-    out_dir = project_name+"_files"
 
-    states_per_module = read_file(os.path.join(out_dir,"hls_statesPerModule.json"))
-    drains_per_state = read_file(os.path.join(out_dir, "drainsPerState.json"))
-    sources_per_state = read_file(os.path.join(out_dir, "sourcesPerState.json"))
-    memory_drains_per_state = read_file(os.path.join(out_dir, "memoryDrainsPerState.json"))
-    memory_sources_per_state = read_file(os.path.join(out_dir, "memorySourcesPerState.json"))
-    instructions_per_state = read_file(os.path.join(out_dir, "hls_instructionsPerState.json"))
+    states_per_module = project.read("hls_statesPerModule.json")
+    drains_per_state = project.read("drainsPerState.json")
+    sources_per_state = project.read("sourcesPerState.json")
+    memory_drains_per_state = project.read("memoryDrainsPerState.json")
+    memory_sources_per_state = project.read("memorySourcesPerState.json")
+    instructions_per_state = project.read("hls_instructionsPerState.json")
 
     # First, figure out what the clock period is for each state:
     if not enhanced_synthesis:
-        newFreqPerState = read_file(os.path.join(out_dir, "frequencyPerState.json"))
+        newFreqPerState = project.read("frequencyPerState.json")
     else:
-        newFreqPerState = read_file(os.path.join(out_dir, "correctedFrequencyPerState.json"))
+        newFreqPerState = project.read("correctedFrequencyPerState.json")
 
     optimisticFreqPerState = {k: (lambda x: PLL_CLOCK/math.floor(PLL_CLOCK/x))(v)
                                 for k,v in newFreqPerState.items()}
@@ -212,10 +420,10 @@ def get_dynamic_timing(verilog_file, enhanced_synthesis):
     optimisticPeriodPerState = {k: (lambda x: 1000/x)(v) for k, v in optimisticFreqPerState.items()}
     pessimisticPeriodPerState = {k: (lambda x: 1000/x)(v) for k, v in pessimisticFreqPerState.items()}        
      
-    save(os.path.join(out_dir, "optimistic_freqs.json"), optimisticFreqPerState)
-    save(os.path.join(out_dir, "optimistic_periods.json"), optimisticPeriodPerState)
-    save(os.path.join(out_dir, "pessimistic_freqs.json"), pessimisticFreqPerState)
-    save(os.path.join(out_dir, "pessimistic_periods.json"), pessimisticPeriodPerState)
+    project.save("optimistic_freqs.json", optimisticFreqPerState)
+    project.save("optimistic_periods.json", optimisticPeriodPerState)
+    project.save("pessimistic_freqs.json", pessimisticFreqPerState)
+    project.save("pessimistic_periods.json", pessimisticPeriodPerState)
 
     # choose period per state
     chosenPeriodPerState = {}
@@ -225,7 +433,7 @@ def get_dynamic_timing(verilog_file, enhanced_synthesis):
         else:
             chosenPeriodPerState[state] = pessimisticPeriodPerState[state]
 
-    save(os.path.join(out_dir, "chosen_periods.json"), chosenPeriodPerState)
+    project.save("chosen_periods.json", chosenPeriodPerState)
 
     # Now generate an SDC constraining delays based on the new freqs
     if not enhanced_synthesis:
@@ -239,8 +447,8 @@ def get_dynamic_timing(verilog_file, enhanced_synthesis):
         lines = ""
         module_sdc = os.path.join(project_folder, "sdc", "path_delays_debug.sdc")
 
-        fmax_per_module = read_file(os.path.join(out_dir, "max_freq_per_module.json"))
-        instances_per_module = read_file(os.path.join(out_dir,"instancesPerModule.json"))
+        fmax_per_module = project.read("max_freq_per_module.json")
+        instances_per_module = project.read("instancesPerModule.json")
 
         optimisticFreqPerModule = {k: (lambda x: PLL_CLOCK/math.floor(PLL_CLOCK/x))(v) 
                                     for k,v in fmax_per_module.items()}
@@ -263,7 +471,7 @@ def get_dynamic_timing(verilog_file, enhanced_synthesis):
 
         save(os.path.join(project_folder, "sdc", "fmax_delay.sdc"), lines)
 
-    lines = ""
+    constraints = SdcBuilder()
     delay_per_source = {}
     delay_per_drain = {}
 
@@ -273,8 +481,8 @@ def get_dynamic_timing(verilog_file, enhanced_synthesis):
             else: inst = module
             path = "*|{}:{}|".format(module,inst)
 
-            # Go through these delays from low frequency (large period) to high frequency (small period) so that the delay
-            # ends up set to the smallest possible value.
+            # The builder keeps the smallest delay constrained on each pair, so a register
+            # shared by several states is bound by its highest frequency state.
             sorted_states = sorted(states, key=lambda x:chosenPeriodPerState[x], reverse=True) 
             for state in sorted_states:
                 chosen_period = "{:.3f}".format(chosenPeriodPerState[state])
@@ -285,8 +493,8 @@ def get_dynamic_timing(verilog_file, enhanced_synthesis):
                 if 'function_call' in state:
                     callee = [r for r in drains_per_state[state] if 'start' in r][0]
                     callee = callee.split('_start')[0]
-                    lines += sdc_template_dual.substitute({"from":path+callee+":"+callee+"|return_val*", "to":path+callee+"_return_val_reg", "freq":chosen_period})
-                    lines += sdc_template_dual.substitute({"from":path+callee+":"+callee+"|finish*", "to":path+callee+"_finish_reg*", "freq":chosen_period})
+                    constraints.max_delay(chosen_period, frm=path+callee+":"+callee+"|return_val*", to=path+callee+"_return_val_reg")
+                    constraints.max_delay(chosen_period, frm=path+callee+":"+callee+"|finish*", to=path+callee+"_finish_reg*")
 
                 if "*|top_inst|div_top_reg*" not in delay_per_drain.keys():
                     delay_per_drain["*|top_inst|div_top_reg*"] = []
@@ -298,26 +506,26 @@ def get_dynamic_timing(verilog_file, enhanced_synthesis):
                 
                 for drain in memory_drains_per_state[state]:
                     if "main_LEGUP_0" in state:
-                        lines += sdc_template.substitute({"reg":drain+"*",  "dir":"to", "freq":chosen_period})
-                    lines += sdc_template_dual.substitute({"to":drain+"*", "from":path+"cur_state*", "freq":chosen_period})
+                        constraints.max_delay(chosen_period, to=drain+"*")
+                    constraints.max_delay(chosen_period, frm=path+"cur_state*", to=drain+"*")
                     for source in memory_sources_per_state[state]:
-                        lines += sdc_template_dual.substitute({"from":source+"*", "to":drain+"*", "freq":chosen_period})
+                        constraints.max_delay(chosen_period, frm=source+"*", to=drain+"*")
                     for source in sources_per_state[state]:
                         if 'arg_' in source:
-                            lines += sdc_template_dual.substitute({"from":"*|"+inst+"_"+source+"*", "to":drain+"*", "freq":chosen_period})
+                            constraints.max_delay(chosen_period, frm="*|"+inst+"_"+source+"*", to=drain+"*")
                         else:
-                            lines += sdc_template_dual.substitute({"from":path+source+"*", "to":drain+"*", "freq":chosen_period})
+                            constraints.max_delay(chosen_period, frm=path+source+"*", to=drain+"*")
 
                 for source in memory_sources_per_state[state]:
                     if "main_LEGUP_0" in state:
-                        lines += sdc_template.substitute({"reg":source+"*",  "dir":"from", "freq":chosen_period})
-                    lines += sdc_template_dual.substitute({"from":source+"*", "to":path+"*", "freq":chosen_period})
+                        constraints.max_delay(chosen_period, frm=source+"*")
+                    constraints.max_delay(chosen_period, frm=source+"*", to=path+"*")
                     for drain in drains_per_state[state]:
-                        lines += sdc_template_dual.substitute({"from":source+"*", "to":path+drain+"*", "freq":chosen_period})
+                        constraints.max_delay(chosen_period, frm=source+"*", to=path+drain+"*")
                 
                 for drain in drains_per_state[state]:
                     if "main_LEGUP_0" in state:
-                        lines += sdc_template.substitute({"reg":path+drain+"*",  "dir":"to", "freq":chosen_period})
+                        constraints.max_delay(chosen_period, to=path+drain+"*")
                     if 'finish' in drain and 'main_inst' in inst:
                         if "*return_val_reg*" not in delay_per_drain.keys():
                             delay_per_drain["*return_val_reg*"] = []
@@ -336,33 +544,29 @@ def get_dynamic_timing(verilog_file, enhanced_synthesis):
                         delay_per_source[path+"cur_state*"] = []
                     delay_per_source[path+"cur_state*"].append(chosen_period)
 
-                    lines += sdc_template_dual.substitute({"to":path+drain+"*",  "from":path+"cur_state*", "freq":chosen_period})
+                    constraints.max_delay(chosen_period, frm=path+"cur_state*", to=path+drain+"*")
                     for source in sources_per_state[state]:
                         if 'arg_' in source:
-                            lines += sdc_template_dual.substitute({"from":"*|"+inst+"_"+source+"*", "to":path+drain+"*", "freq":chosen_period})
+                            constraints.max_delay(chosen_period, frm="*|"+inst+"_"+source+"*", to=path+drain+"*")
                         else:
-                            lines += sdc_template_dual.substitute({"from":path+source+"*", "to":path+drain+"*", "freq":chosen_period})
+                            constraints.max_delay(chosen_period, frm=path+source+"*", to=path+drain+"*")
                 
                 for source in sources_per_state[state]:
                     if "main_LEGUP_0" in state:
-                        lines += sdc_template.substitute({"reg":path+source+"*",  "dir":"from", "freq":chosen_period})
+                        constraints.max_delay(chosen_period, frm=path+source+"*")
                     if "arg_" in source:
-                        lines += sdc_template_dual.substitute({"from":"*|"+inst+"_"+source+"*",  "to":path+"cur_state*", "freq":chosen_period})
-                        lines += sdc_template_dual.substitute({"from":"*|"+inst+"_"+source+"*",  "to":"*|top_inst|div_top_reg*", "freq":chosen_period})
-                        lines += sdc_template_dual.substitute({"from":"*|"+inst+"_"+source+"*",  "to":path+module+"_rom:"+module+"_rom_INST|*", "freq":chosen_period})
+                        constraints.max_delay(chosen_period, frm="*|"+inst+"_"+source+"*", to=path+"cur_state*")
+                        constraints.max_delay(chosen_period, frm="*|"+inst+"_"+source+"*", to="*|top_inst|div_top_reg*")
+                        constraints.max_delay(chosen_period, frm="*|"+inst+"_"+source+"*", to=path+module+"_rom:"+module+"_rom_INST|*")
                     else:
-                        lines += sdc_template_dual.substitute({"from":path+source+"*", "to":path+"cur_state*", "freq":chosen_period})
-                        lines += sdc_template_dual.substitute({"from":path+source+"*", "to":"*|top_inst|div_top_reg*", "freq":chosen_period})
-                        lines += sdc_template_dual.substitute({"from":path+source+"*", "to":path+module+"_rom:"+module+"_rom_INST|*", "freq":chosen_period})
-                        
-                # if len(drains_per_state[state]) == 0 and len(sources_per_state[state]) == 0 and len(memory_sources_per_state[state]) == 0 and len(memory_drains_per_state[state]) == 0:
-                #     lines += sdc_template.substitute({"reg":path+module+"_rom*", "dir":"to",  "freq":chosen_period})
-                #     lines += sdc_template.substitute({"reg":"*|top_inst|div_top_reg*", "dir":"to",  "freq":chosen_period})
+                        constraints.max_delay(chosen_period, frm=path+source+"*", to=path+"cur_state*")
+                        constraints.max_delay(chosen_period, frm=path+source+"*", to="*|top_inst|div_top_reg*")
+                        constraints.max_delay(chosen_period, frm=path+source+"*", to=path+module+"_rom:"+module+"_rom_INST|*")
 
         for source, delays in delay_per_source.items():
-            lines += sdc_template.substitute({"reg":source, "dir":"from",  "freq":max([float(d) for d in delays])})
+            constraints.max_delay(max([float(d) for d in delays]), frm=source)
         for drain,delays in delay_per_drain.items():
-            lines += sdc_template.substitute({"reg":drain,  "dir":"to", "freq":max([float(d) for d in delays])})
+            constraints.max_delay(max([float(d) for d in delays]), to=drain)
     
     else: # enhanced synthesis
         for module,states in states_per_module.items():
@@ -370,55 +574,111 @@ def get_dynamic_timing(verilog_file, enhanced_synthesis):
             else: inst = module
             path = "*|{}:{}|".format(module,inst)
 
-            # Go through these delays from low frequency (large period) to high frequency (small period) so that the delay
-            # ends up set to the smallest possible value.
+            # The builder keeps the smallest delay constrained on each pair, so a register
+            # shared by several states is bound by its highest frequency state.
             sorted_states = sorted(states, key=lambda x:chosenPeriodPerState[x], reverse=True) 
             for state in sorted_states:
                 chosen_period = "{:.3f}".format(chosenPeriodPerState[state])
                 
                 for drain in memory_drains_per_state[state]:
-                    lines += sdc_template.substitute({"reg":drain+"*", "dir":"to", "freq":chosen_period})
+                    constraints.max_delay(chosen_period, to=drain+"*")
 
                 for source in memory_sources_per_state[state]:
-                    lines += sdc_template.substitute({"reg":source+"*", "dir":"from", "freq":chosen_period})
+                    constraints.max_delay(chosen_period, frm=source+"*")
                 
                 for drain in drains_per_state[state]:
-                    lines += sdc_template.substitute({"reg":path+drain+"*",  "dir":"to", "freq":chosen_period})
+                    constraints.max_delay(chosen_period, to=path+drain+"*")
                 
                 for source in sources_per_state[state]:
                     if "arg_" in source:
-                        lines += sdc_template.substitute({"reg":"*|"+inst+"_"+source+"*", "dir":"from", "freq":chosen_period})
+                        constraints.max_delay(chosen_period, frm="*|"+inst+"_"+source+"*")
                     else:
-                        lines += sdc_template.substitute({"reg":path+source+"*", "dir":"from", "freq":chosen_period})
+                        constraints.max_delay(chosen_period, frm=path+source+"*")
+
+    constraints.write(sdc_file)
+
+def print_path(lines, label, frequency, slack):
+    """ Print the worst path of a timing report (debug) """
+    from_node = [l.strip().split(" ")[-1].strip() for l in lines if "From Node" in l]
+    to_node = [l.strip().split(" ")[-1].strip() for l in lines if "To Node" in l]
+    if len(from_node) > 0 and len(to_node) > 0:
+        print("DEBUG: "+label)
+        print("\t"+from_node[0])
+        print("\t"+" to node ")
+        print("\t"+to_node[0])
+        print("\t"+" :  "+str(frequency)+"  (Slack "+str(slack)+")")
+    else: print('\n'.join(lines))
+
+def get_module_levels(instances_per_module):
+    """
+    Group modules into topological levels of the instance hierarchy.
+    Leaves are level 0 and every module sits one level above its deepest
+    submodule, so modules within a level never instantiate each other.
+    """
+    levels_per_module = {}
+    def get_level(module):
+        if module not in levels_per_module:
+            submodules = [m for m in instances_per_module[module] if m in instances_per_module and m != "top"]
+            if len(submodules) == 0: levels_per_module[module] = 0
+            else: levels_per_module[module] = 1 + max([get_level(m) for m in submodules])
+        return levels_per_module[module]
+
+    levels = []
+    for module in instances_per_module.keys():
+        if module == "top": continue
+        level = get_level(module)
+        while len(levels) <= level:
+            levels.append([])
+        levels[level].append(module)
+    return levels
+
+def get_module_frequency(sta, module, baseline):
+    """ Max frequency of paths within a module (and into its state register) """
+    clock = "CLOCK_50" if baseline else "dyn_clk"
+    if module == "main": inst = "main_inst"
+    else: inst = module
+    path = "*|{}:{}|*".format(module,inst)
+
+    lines = sta.report_longest(clock, path, path)
+    slack = get_slack(lines)
+    if slack > 0:
+        max_frequency = 500.0
+    else:
+        max_frequency = 1000.0/(2-slack)
+    if DEBUG: print_path(lines, "Path from ", max_frequency, slack)
 
-    save(sdc_file, lines)
+    if not baseline:
+        lines = sta.report_longest(clock, "*", path[0:-1]+"cur_state*")
+        slack = get_slack(lines)
+        if slack > 0:
+            frequency = 500.0
+        else:
+            frequency = 1000.0/(2-slack)
+        if DEBUG: print_path(lines, "Path from ", frequency, slack)
+        if frequency < max_frequency:
+            max_frequency = frequency 
 
-def get_timing_constraints(verilog_file, baseline=False):
-    per_module = True
+    return max_frequency
 
+def get_timing_constraints(project, baseline=False, sta=None, workers=STA_WORKERS):
+    verilog_file = project.verilog_file
     project_folder = os.path.dirname(os.path.abspath(verilog_file))
-    project_name = verilog_file.split(".")[0]
-    out_dir = project_name+"_files"
-    instances_per_module = read_file(os.path.join(out_dir,"instancesPerModule.json"))
+    if sta is None:
+        with StaSession(project_folder) as sta:
+            return get_timing_constraints(project, baseline, sta, workers)
+    # sdc files may have changed since the session was started
+    sta.reload()
+
+    per_module = True
+    clock = "CLOCK_50" if baseline else "dyn_clk"
+
+    instances_per_module = project.read("instancesPerModule.json")
     fmax_per_module = dict.fromkeys(instances_per_module)
 
-    if not baseline:
-        result = execute(['quartus_sta', '-t', os.path.join(TOOL_PATH, 'tcl','report_longest.tcl')], cd=project_folder, quiet=True)
-    else: result = execute(['quartus_sta', '-t', os.path.join(TOOL_PATH, 'tcl', 'baseline_longest.tcl')], cd=project_folder, quiet=True)
-    lines = result.split('\n')
-    slack = [l for l in lines if "Slack: "  in l]
-    slack = float(slack[0].split()[-1])
+    lines = sta.report_longest(clock)
+    slack = get_slack(lines)
     max_frequency = 1000.0/(2-slack)
-    if DEBUG:
-        from_node = [l.strip().split(" ")[-1].strip() for l in lines if "From Node" in l]
-        to_node = [l.strip().split(" ")[-1].strip() for l in lines if "To Node" in l]
-        if len(from_node) > 0 and len(to_node) > 0:
-            print("DEBUG: Max Frequency Path from ")
-            print("\t"+from_node[0])
-            print("\t"+" to node ")
-            print("\t"+to_node[0])
-            print("\t"+" :  "+str(max_frequency)+"  (Slack "+str(slack)+")")
-        else: print(result)
+    if DEBUG: print_path(lines, "Max Frequency Path from ", max_frequency, slack)
         
     modules = list(instances_per_module.keys())
     def num_submodules(module):
@@ -433,133 +693,53 @@ def get_timing_constraints(verilog_file, baseline=False):
         fmax_per_module[module] = max_frequency
 
     if per_module:
-        not_processed = list(instances_per_module.keys())
-        not_processed.remove("top")
-        sdc_lines = []
-        while len(not_processed) > 0:
-            def get_next_module(not_processed, instances_per_module):
-                for module in not_processed:
-                    if len(instances_per_module[module]) == 0: # leaf
-                        return module 
-                    elif all([bool(m not in not_processed) for m in instances_per_module[module]]): # all instances processed, leaf
-                        return module
-            leaf_module = get_next_module(not_processed, instances_per_module)
-            not_processed.remove(leaf_module)
-            
-            if leaf_module == "main": inst = "main_inst"
-            else: inst = leaf_module
-            path = "*|{}:{}|*".format(leaf_module,inst)
-
-            # get timing
-            if not baseline:
-                result = execute(['quartus_sta', '-t', os.path.join(TOOL_PATH, 'tcl', 'report_longest_custom.tcl'), path, path], cd=project_folder, quiet=True)
-                lines = result.split('\n')
-                slack = [l for l in lines if "Slack: "  in l]
-                slack = float(slack[0].split()[-1])
-                if slack > 0:
-                    frequency = 500.0
-                else:
-                    frequency = 1000.0/(2-slack)
-                if DEBUG:
-                    from_node = [l.strip().split(" ")[-1].strip() for l in lines if "From Node" in l]
-                    to_node = [l.strip().split(" ")[-1].strip() for l in lines if "To Node" in l]
-                    if len(from_node) > 0 and len(to_node) > 0:
-                        print("DEBUG: Path from ")
-                        print("\t"+from_node[0])
-                        print("\t"+" to node ")
-                        print("\t"+to_node[0])
-                        print("\t"+" :  "+str(frequency)+"  (Slack "+str(slack)+")")
-                    else: print(result)
-                max_frequency = frequency 
-
-                result = execute(['quartus_sta', '-t', os.path.join(TOOL_PATH, 'tcl', 'report_longest_custom.tcl'), "*", path[0:-1]+"cur_state*"], cd=project_folder, quiet=True)
-                lines = result.split('\n')
-                slack = [l for l in lines if "Slack: "  in l]
-                slack = float(slack[0].split()[-1])
-                if slack > 0:
-                    frequency = 500.0
-                else:
-                    frequency = 1000.0/(2-slack)
-                if DEBUG:
-                    from_node = [l.strip().split(" ")[-1].strip() for l in lines if "From Node" in l]
-                    to_node = [l.strip().split(" ")[-1].strip() for l in lines if "To Node" in l]
-                    if len(from_node) > 0 and len(to_node) > 0:
-                        print("DEBUG: Path from ")
-                        print("\t"+from_node[0])
-                        print("\t"+" to node ")
-                        print("\t"+to_node[0])
-                        print("\t"+" :  "+str(frequency)+"  (Slack "+str(slack)+")")
-                    else: print(result)
-                if frequency < max_frequency:
-                    max_frequency = frequency 
-            else: 
-                result = execute(['quartus_sta', '-t', os.path.join(TOOL_PATH, 'tcl', 'baseline_longest_custom.tcl'), path, path], cd=project_folder, quiet=True)
-                lines = result.split('\n')
-                slack = [l for l in lines if "Slack: "  in l]
-                slack = float(slack[0].split()[-1])
-                if slack > 0:
-                    max_frequency = 500.0
-                else:
-                    max_frequency = 1000.0/(2-slack)
-                if DEBUG:
-                    from_node = [l.strip().split(" ")[-1].strip() for l in lines if "From Node" in l]
-                    to_node = [l.strip().split(" ")[-1].strip() for l in lines if "To Node" in l]
-                    if len(from_node) > 0 and len(to_node) > 0:
-                        print("DEBUG: Path from ")
-                        print("\t"+from_node[0])
-                        print("\t"+" to node ")
-                        print("\t"+to_node[0])
-                        print("\t"+" :  "+str(max_frequency)+"  (Slack "+str(slack)+")")
-                    else: print(result)
-
-            fmax_per_module[leaf_module] = max_frequency
-
-            max_delay = 1000.0/(PLL_CLOCK/math.ceil(PLL_CLOCK/max_frequency)) # bin frequency for simplicity
-
-            sdc_lines = [sdc_template_dual.substitute({"to":path,  "from":path, "freq":max_delay})] + sdc_lines
-            with open(os.path.join('sdc', 'fmax_delay.sdc'), 'w') as outf:
-                for line in sdc_lines:
-                    outf.write(line)
-
-        if not baseline: result = execute(['quartus_sta', '-t', os.path.join(TOOL_PATH, 'tcl','report_longest.tcl')], cd=project_folder, quiet=True)
-        else: result = execute(['quartus_sta', '-t', os.path.join(TOOL_PATH, 'tcl', 'baseline_longest.tcl')], cd=project_folder, quiet=True)
-        lines = result.split('\n')
-        slack = [l for l in lines if "Slack: "  in l]
-        slack = float(slack[0].split()[-1])
+        # modules of one level are independent: query them concurrently, then
+        # constrain the whole level before moving up the hierarchy
+        sdc_entries = []
+        with StaPool(project_folder, workers, sta) as pool:
+            for level in get_module_levels(instances_per_module):
+                frequencies = pool.map(lambda session, module: get_module_frequency(session, module, baseline), level)
+                for module, max_frequency in zip(level, frequencies):
+                    fmax_per_module[module] = max_frequency
+
+                    if module == "main": inst = "main_inst"
+                    else: inst = module
+                    path = "*|{}:{}|*".format(module,inst)
+                    max_delay = 1000.0/(PLL_CLOCK/math.ceil(PLL_CLOCK/max_frequency)) # bin frequency for simplicity
+                    sdc_entries = [(path, max_delay)] + sdc_entries
+
+                # enclosing modules first, as before
+                constraints = SdcBuilder()
+                for path, max_delay in sdc_entries:
+                    constraints.max_delay(max_delay, frm=path, to=path)
+                constraints.write(os.path.join(project_folder, 'sdc', 'fmax_delay.sdc'), sort=False)
+                pool.reload()
+
+        lines = sta.report_longest(clock)
+        slack = get_slack(lines)
         if slack > 0:
             max_frequency = 500.0
         else:
             max_frequency = 1000.0/(2-slack)
-        if DEBUG:
-            from_node = [l.strip().split(" ")[-1].strip() for l in lines if "From Node" in l]
-            to_node = [l.strip().split(" ")[-1].strip() for l in lines if "To Node" in l]
-            if len(from_node) > 0 and len(to_node) > 0:
-                print("DEBUG: Max Frequency Path post-analysis from ")
-                print("\t"+from_node[0])
-                print("\t"+" to node ")
-                print("\t"+to_node[0])
-                print("\t"+" :  "+str(max_frequency)+"  (Slack "+str(slack)+")")
-            else: print(result)
+        if DEBUG: print_path(lines, "Max Frequency Path post-analysis from ", max_frequency, slack)
 
         fmax_per_module["top"] = max_frequency
     
     print(fmax_per_module)
 
-    save(os.path.join(out_dir, "max_freq_per_module.json"), fmax_per_module)
+    project.save("max_freq_per_module.json", fmax_per_module)
 
     return fmax_per_module
 
-def generate_clock_settings(verilog_file, pipeline):
-    project_name = verilog_file.split(".")[0]
-    out_dir = project_name+"_files"
+def generate_clock_settings(project, pipeline):
 
-    minSlackPerState = read_file(os.path.join(out_dir, "minSlackPerState.json"))
-    statesPerModule = read_file(os.path.join(out_dir,"hls_statesPerModule.json"))
+    minSlackPerState = project.read("minSlackPerState.json")
+    statesPerModule = project.read("hls_statesPerModule.json")
     
     def convert_slack_to_MHz(slack_ns, period=2):
         return 1000.0/(period-slack_ns)
 
-    fmax_per_module = read_file(os.path.join(out_dir, "max_freq_per_module.json"))
+    fmax_per_module = project.read("max_freq_per_module.json")
 
     correctedFrequencyPerState = dict.fromkeys(minSlackPerState.keys())
     for module, states in statesPerModule.items():
@@ -574,23 +754,31 @@ def generate_clock_settings(verilog_file, pipeline):
             else:
                 correctedFrequencyPerState[state] = max_frequency
 
-    save(os.path.join(out_dir, "correctedFrequencyPerState.json"), correctedFrequencyPerState)
+    project.save("correctedFrequencyPerState.json", correctedFrequencyPerState)
 
-def generate_mif_files(verilog_file, pipeline):
-    project_name = verilog_file.split(".")[0]
-    out_dir = project_name+"_files"
+def generate_mif_files(project, pipeline, pll_clock=PLL_CLOCK, counter_bits=COUNTER_BITS, rom_dir=None):
+    """
+    Divisor memories of every module. Without rom_dir they go to the project
+    ROMs along with the binned frequencies and divisors; with rom_dir (a
+    point the RTL was not generated for) the MIFs and divisors go there and
+    the project is left unchanged.
+    """
+    out_dir = project.out_dir
 
-    frequencyPerState = bin_frequencies_per_state(out_dir)
-    statesPerModule = read_file(os.path.join(out_dir,"hls_statesPerModule.json"))
-    valuePerState = get_value_per_state(out_dir, verilog_file)
-    bits = get_num_bits(verilog_file)
+    if rom_dir is None:
+        frequencyPerState = bin_frequencies_per_state(project, pll_clock, counter_bits)
+    else:
+        frequencyPerState = project.read("correctedFrequencyPerState.json")
+    statesPerModule = project.read("hls_statesPerModule.json")
+    valuePerState = get_value_per_state(project)
+    bits = get_num_bits(project)
 
     divPerState = {}
     for state, frequency in frequencyPerState.items():
-        divPerState[state] = get_frequency_div(frequency)
+        divPerState[state] = get_frequency_div(frequency, pll_clock, counter_bits)
 
-    nstatesPerState = read_file(os.path.join(out_dir, 'hls_nstatesPerState.json'))
-    num_nStates = get_num_nStates(out_dir)
+    nstatesPerState = project.read('hls_nstatesPerState.json')
+    num_nStates = get_num_nStates(project)
     dataPerState = {}
 
     for module,states in statesPerModule.items():
@@ -608,23 +796,27 @@ def generate_mif_files(verilog_file, pipeline):
             data = 0
             for nstate in nstates:
                 tags = tags << int(addr_w)
-                data = data << COUNTER_BITS
+                data = data << counter_bits
                 tags = tags + int(valuePerState[nstate])
                 data = data + int(divs[nstate])
-            dataPerState[state] = data + (tags << (COUNTER_BITS*num_nStates[module]))
+            dataPerState[state] = data + (tags << (counter_bits*num_nStates[module]))
 
-    save(os.path.join(out_dir, "lookupDivPerState.json"), divPerState)
+    if rom_dir is None:
+        project.save("lookupDivPerState.json", divPerState)
+        rom_dir = os.path.join(out_dir, "rom")
+    else:
+        save(os.path.join(rom_dir, "lookupDivPerState.json"), divPerState)
 
     for module,states in statesPerModule.items():
         addr_w = bits[module]
         depth = 2**addr_w
-        data_w = num_nStates[module] * COUNTER_BITS + num_nStates[module] *addr_w
-        data = [2**COUNTER_BITS-1] * (int(depth))
+        data_w = num_nStates[module] * counter_bits + num_nStates[module] *addr_w
+        data = [2**counter_bits-1] * (int(depth))
         for state in states:
             address = int(valuePerState[state])
             data[address] = dataPerState[state]
 
-        mif_file = os.path.join(out_dir, "rom", "{}_rom.mif".format(module))
+        mif_file = os.path.join(rom_dir, "{}_rom.mif".format(module))
         with open(mif_file, "w+") as outf:
             outf.write("-- ROM Initialization file\n")
             outf.write("WIDTH = {};\n".format(data_w))
@@ -636,252 +828,321 @@ def generate_mif_files(verilog_file, pipeline):
                 outf.write("\t{:x} : {:x};\n".format(address,data[address]))
             outf.write("END\n")
 
-def bin_frequencies_per_state(out_dir):
-    frequencyPerState = read_file(os.path.join(out_dir,"correctedFrequencyPerState.json"))
+def bin_frequencies_per_state(project, pll_clock=PLL_CLOCK, counter_bits=COUNTER_BITS):
+    frequencyPerState = project.read("correctedFrequencyPerState.json")
     binnedFrequencyPerState = {}
     for state, frequency in frequencyPerState.items():
-        binnedFrequencyPerState[state] = float(PLL_CLOCK) / float(get_frequency_div(frequency))
+        binnedFrequencyPerState[state] = float(pll_clock) / float(get_frequency_div(frequency, pll_clock, counter_bits))
 
-    save(os.path.join(out_dir, "binnedFrequencyPerState.json"), binnedFrequencyPerState)
+    project.save("binnedFrequencyPerState.json", binnedFrequencyPerState)
     return frequencyPerState
 
-def get_frequency_div(f):
+def get_frequency_div(f, pll_clock=PLL_CLOCK, counter_bits=COUNTER_BITS):
     div = 2
-    while (float(PLL_CLOCK) / float(div)) > float(f) and div < 2**COUNTER_BITS:
+    while (float(pll_clock) / float(div)) > float(f) and div < 2**counter_bits:
         div += 1
-    assert (div != 2**COUNTER_BITS)
+    assert (div != 2**counter_bits)
 
     return div
 
-def get_value_per_state(out_dir, verilog_file):
-    lines = get_states(verilog_file)
+def get_value_per_state(project):
+    lines = get_states(project)
     valuePerState = {}
     for line in lines:
         state = line[0]
         value = line[1][1]
         valuePerState[state] = value 
-    save(os.path.join(out_dir, "valuePerState.json"), valuePerState)
+    project.save("valuePerState.json", valuePerState)
     return valuePerState
 
-def get_simulation_performance(verilog_file, pipeline, log_file=None):
-    project_folder = os.path.dirname(verilog_file)
-    project_name = verilog_file.split(".")[0]
-    out_dir = project_name+"_files"
-    subroutine_calls = read_file(os.path.join(out_dir,"subroutine_calls.json"))
-
-    if log_file == None:
-        results = read_file(os.path.join(out_dir,"modelsim.log"))
-    else:
-        results = read_file(log_file)
-    if DEBUG: print("DEBUG: measuring performance using log file "+log_file)
-
-    modules = read_file(log_file)
-    results = [l.split('STATE')[-1].strip() for l in results if 'STATE' in l]
+def read_state_log(log_file):
+    """
+    Stream the STATE lines of a Modelsim log into one typed array of
+    encoded state values per instance, in order of first appearance
+    """
+    instances = []
+    values = {}
+    with open(log_file, 'r') as f:
+        for line in f:
+            if 'STATE' not in line: continue
+            words = line.split('STATE')[-1].split()
+            for i in range(0, len(words)-1, 2):
+                inst = words[i]
+                state = words[i+1]
+                if inst not in values:
+                    instances.append(inst)
+                    values[inst] = array('i')
+                if state.isdigit():
+                    values[inst].append(int(state))
+    return instances, values
+
+def read_change_log(log_file):
+    """
+    Stream the CHANGE lines of a change-only Modelsim log (STATE_TRACE =
+    "changes") into the cycle of each record and one typed array per
+    instance of the state printed in it, -1 where the instance was not on
+    the active call chain
+    """
     instances = []
-    activeStates = {}
-    for l in results:
-        line = l.split()
-        i = 0
-        while i < len(line)-1:
-            inst = line[i]
-            state = line[i+1]
-            if inst not in instances:
-                instances.append(inst)
-                activeStates[inst] = []
-            if state.isdigit():
-                activeStates[inst].append(int(state))
-            i += 2
-
-    sim_state_counts = []
-    for _,v in activeStates.items():
-        sim_state_counts.append(len(v))
-
-    assert(all([x==sim_state_counts[0] for x in sim_state_counts]))
-    sim_state_count = sim_state_counts[0]
-    save(os.path.join(out_dir, "transition_count.csv"), [sim_state_count])
+    values = {}
+    cycles = array('q')
+    with open(log_file, 'r') as f:
+        for line in f:
+            if 'CHANGE' not in line: continue
+            words = line.split('CHANGE')[-1].split()
+            cycles.append(int(words[0]))
+            for i in range(1, len(words)-1, 2):
+                inst = words[i]
+                if inst not in values:
+                    instances.append(inst)
+                    values[inst] = array('i', [-1]) * (len(cycles)-1)
+                values[inst].append(int(words[i+1]))
+            for inst in instances:
+                if len(values[inst]) < len(cycles): values[inst].append(-1)
+    return instances, cycles, values
+
+def expand_changes(cycles, states):
+    """
+    Per-cycle states from the records of a change-only log: each record
+    holds until the next one, the last record is a single cycle, and an
+    instance keeps its last printed state while off the active call chain
+    """
+    cycles = np.frombuffer(cycles, dtype=np.int64)
+    states = np.frombuffer(states, dtype=np.int32)
+    last_printed = np.maximum.accumulate(np.where(states >= 0, np.arange(len(states)), 0))
+    states = np.where(states[last_printed] >= 0, states[last_printed], -1)
+    return np.repeat(states, np.diff(cycles, append=cycles[-1]+1))
+
+def get_log_format(log_file):
+    """ "binary", "changes" or "text" depending on the records in log_file """
+    if log_file.endswith(".bin"): return "binary"
+    with open(log_file, 'r') as f:
+        for line in f:
+            if 'CHANGE' in line: return "changes"
+            if 'STATE' in line: return "text"
+    return "text"
+
+def read_state_trace(trace_file):
+    """
+    Instance paths and the cycles x instances matrix of encoded states of
+    a binary trace written by the testbench (STATE_TRACE = "binary"). The
+    matrix is memory mapped rather than read.
+    """
+    with open(trace_file, 'rb') as f:
+        header = f.read(TRACE_FIELD).decode().split()
+        if len(header) < 2 or header[0] != "SYNCOPATION_TRACE":
+            print("ERROR: {} is not a Syncopation state trace".format(trace_file))
+            sys.exit(2)
+        num_instances = int(header[1])
+        instances = [f.read(TRACE_FIELD).decode().strip() for _ in range(num_instances)]
+    # one little endian 32 bit word per instance and cycle ($fwrite %u),
+    # a record cut short by the end of simulation is dropped
+    offset = TRACE_FIELD*(num_instances+1)
+    cycles = (os.path.getsize(trace_file) - offset) // (4*num_instances)
+    return instances, np.memmap(trace_file, dtype='<u4', mode='r', offset=offset, shape=(cycles, num_instances))
+
+def get_state_trace(project, log_file):
+    """
+    Instances and the cycles x instances matrix of state ids (see
+    Project.index) simulated in log_file, a Modelsim log (full or
+    change-only) or binary trace
+    """
+    log_format = get_log_format(log_file)
+    if log_format == "binary":
+        instances, values = read_state_trace(log_file)
+        columns = [values[:, i] for i in range(len(instances))]
+    elif log_format == "changes":
+        instances, cycles, values = read_change_log(log_file)
+        columns = [expand_changes(cycles, values[instance]) for instance in instances]
+    else:
+        instances, values = read_state_log(log_file)
+        sim_state_counts = [len(values[instance]) for instance in instances]
+        assert(all([x==sim_state_counts[0] for x in sim_state_counts]))
+        columns = [np.frombuffer(values[instance], dtype=np.int32) for instance in instances]
 
     # dict to translate state integer value to state name as a string
-    statesPerModule = read_file(os.path.join(out_dir,"hls_statesPerModule.json"))
-    valuePerState = read_file(os.path.join(out_dir, "valuePerState.json"))
+    statesPerModule = project.read("hls_statesPerModule.json")
+    valuePerState = project.read("valuePerState.json")
     stateTranslator = {}
     for m in statesPerModule.keys():
         stateTranslator[m] = {}
         for state in statesPerModule[m]:
             stateTranslator[m][valuePerState[state]] = state
-    save(os.path.join(out_dir, "stateTranslator.json"), stateTranslator)
+    project.save("stateTranslator.json", stateTranslator)
 
-    # convert list of values of active states for each instance to lists of string names of active states
-    activeStateNames = {}
-    for instance in instances:
-        activeStateNames[instance] = []
+    states = project.index()['states']
+    matrix = np.empty((len(columns[0]), len(instances)), dtype=np.int32)
+    for i, instance in enumerate(instances):
         module = instance.split('.')[-1]
         if module == 'main_inst': module = 'main'
-        for stateNum in activeStates[instance]:
-            activeStateNames[instance].append(stateTranslator[module][str(stateNum)])
-    save(os.path.join(out_dir, "activeStateNames.json"), activeStateNames)
+        column = columns[i]
+        if column.min() < 0: # not yet on the active call chain, assume the first state
+            column = np.where(column < 0, min([int(value) for value in stateTranslator[module]]), column)
+        ids = np.full(max([int(value) for value in stateTranslator[module]] + [int(column.max())]) + 1, -1, dtype=np.int32)
+        for value, state in stateTranslator[module].items():
+            ids[int(value)] = states[state]
+        matrix[:, i] = ids[column]
+        if np.any(matrix[:, i] < 0):
+            print("ERROR: Unknown state value in {} of instance {}".format(log_file, instance))
+            sys.exit(2)
+    return instances, matrix
+
+def get_call_masks(instances, num_states, matrix, calls):
+    """
+    active[c,i] is set if instance i is main_inst or a sub-routine that
+    main_inst is waiting on in cycle c. counted[c,i] additionally clears
+    instances that wait on a call in both this and the next cycle - the
+    caller frequency does not limit the frequency of the callee.
+    """
+    column = dict((instance, i) for i, instance in enumerate(instances))
+    active = np.zeros(matrix.shape, dtype=bool)
+    active[:, column["main_inst"]] = True
+    for instance in sorted(instances, key=lambda i: i.count('.')):
+        if '.' not in instance: continue
+        caller, module = instance.rsplit('.', 1)
+        if caller not in column: continue
+        calls_module = np.zeros(num_states, dtype=bool)
+        calls_module[[state for state, callee in calls.items() if callee == module]] = True
+        active[:, column[instance]] = active[:, column[caller]] & calls_module[matrix[:, column[caller]]]
+
+    is_call = np.zeros(num_states, dtype=bool)
+    is_call[list(calls)] = True
+    waiting = is_call[matrix]
+    counted = active & ~(waiting & np.roll(waiting, -1, axis=0))
+    return active, counted
+
+def masked_min(values, mask):
+    """ Row-wise min of values where mask is set, and its column """
+    masked = np.where(mask, values, np.inf)
+    column = np.argmin(masked, axis=1)
+    return masked[np.arange(len(masked)), column], column
+
+def get_default_log(project):
+    """ State trace written by the default simulation """
+    if STATE_TRACE == "binary": return os.path.join(project.project_folder, TRACE_FILE)
+    else: return os.path.join(project.out_dir, "modelsim.log")
+
+def get_simulation_performance(project, pipeline, log_file=None):
+    out_dir = project.out_dir
+    subroutine_calls = project.read("subroutine_calls.json")
+
+    if log_file == None: log_file = get_default_log(project)
+    if DEBUG: print("DEBUG: measuring performance using log file "+log_file)
+
+    instances, matrix = get_state_trace(project, log_file)
+    transition_count = len(matrix)
+    project.save("transition_count.csv", [transition_count])
+
+    tables = project.index()
+    states = tables['states']
+    if EXPORT_FILES:
+        # names of the active states per cycle are only exported, not kept in the model
+        activeStateNames = dict((instance, [states.name(s) for s in matrix[:, i]]) for i, instance in enumerate(instances))
+        save(os.path.join(out_dir, "activeStateNames.json"), activeStateNames)
+        del activeStateNames
+
+    # sub-routine called in a state, per state id
+    calls = {}
+    for module in subroutine_calls:
+        for state, callee in subroutine_calls[module].items():
+            if state in states: calls[states[state]] = callee
+
+    active, counted = get_call_masks(instances, len(states), matrix, calls)
+    rows = np.arange(transition_count)
 
     # corrected frequencies are the optimum without binning, determined precisely
-    correctedFrequencyPerState = read_file(os.path.join(out_dir, "correctedFrequencyPerState.json"))
-    correctedActiveStateFrequencies = {}
-    for instance in instances:
-        correctedActiveStateFrequencies[instance] = []
-        for state in activeStateNames[instance]:
-            correctedActiveStateFrequencies[instance].append(correctedFrequencyPerState[state])
-    counts = []
-    for instance in instances:
-        counts.append(len(correctedActiveStateFrequencies[instance]))
-    if all([x==counts[0] and x==sim_state_count for x in counts]): transition_count = counts[0]
-    else: 
-        print("Error: mismatching state transitions among modules.")
-        assert(0)
-
-    correctedFrequencySchedule = []
-    for cycle in range(transition_count):
-        freqs = []
-        instance = "main_inst"
-        state = activeStateNames[instance][cycle]
-        if cycle+1 < transition_count: next_state = activeStateNames[instance][cycle+1]
-        else: next_state = activeStateNames[instance][0]
-        instance_base = "main"
-        if not (state in subroutine_calls[instance_base].keys() and next_state in subroutine_calls[instance_base].keys()):
-            freqs.append(correctedActiveStateFrequencies[instance][cycle])
-        while state in subroutine_calls[instance_base].keys():
-            instance = instance + '.' + subroutine_calls[instance_base][state]
-            freqs.append(correctedActiveStateFrequencies[instance][cycle])
-            state = activeStateNames[instance][cycle]
-            if cycle+1 < transition_count: next_state = activeStateNames[instance][cycle+1]
-            else: next_state = activeStateNames[instance][0]
-            instance_base = instance.split('.')[-1]
-            if not (state in subroutine_calls[instance_base].keys() and next_state in subroutine_calls[instance_base].keys()):
-                freqs.append(correctedActiveStateFrequencies[instance][cycle])
-
-        # for instance in instances:
-        #     freqs.append(correctedActiveStateFrequencies[instance][cycle])
-        correctedFrequencySchedule.append(min(freqs))
+    correctedFrequencyPerState = project.read("correctedFrequencyPerState.json")
+    corrected = np.array([correctedFrequencyPerState.get(state, np.nan) for state in states], dtype=float)
+    correctedFrequencies = corrected[matrix]
+    # a callee is limited by its current state even while it is calling
+    root = np.zeros(len(instances), dtype=bool)
+    root[instances.index("main_inst")] = True
+    _, column = masked_min(correctedFrequencies, counted | (active & ~root))
+    correctedFrequencySchedule = np.array([correctedFrequencyPerState.get(state) for state in states], dtype=object)[matrix[rows, column]].tolist()
+    ideal_frequencies, _ = masked_min(correctedFrequencies, counted)
+    ideal_time = float(np.sum(1.0/ideal_frequencies))
+    del correctedFrequencies
 
     # now do the same with the binned frequencies. 
     # 'Skips' are for when a sub-routine is being called - the caller frequency 
     # does not limit the frequency of the callee in this implementation
     # also, in pipelined implementation, the frequency cannot be determined precisely
     # it is determined as a min(frequency[previous_state])
-    binnedFrequencyPerState = read_file(os.path.join(out_dir, "binnedFrequencyPerState.json"))
+    # binned frequencies are PLL_CLOCK/div, latency is accumulated in PLL ticks
+    binnedFrequencyPerState = project.read("binnedFrequencyPerState.json")
+    divs = np.zeros(len(states), dtype=np.int64)
+    for state, frequency in binnedFrequencyPerState.items():
+        if state in states: divs[states[state]] = int(round(PLL_CLOCK/frequency))
 
     # takes two cycles to set dynamic clock for the first time - it's saturated (min frequency) for conservativeness
+    statesPerModule = project.read("hls_statesPerModule.json")
     hwFrequencySchedule = [PLL_CLOCK/((2**COUNTER_BITS)-1),PLL_CLOCK/((2**COUNTER_BITS)-1)]
-    hwFreqcounter = {}
-    time = 1.0/(PLL_CLOCK/((2**COUNTER_BITS)-1))+1.0/(PLL_CLOCK/((2**COUNTER_BITS)-1))
-    ideal_time = 0
+    ticks = 2*((2**COUNTER_BITS)-1)
     freqs_per_module = dict.fromkeys(statesPerModule.keys())
-    time_per_module = dict.fromkeys(statesPerModule.keys())
+    ticks_per_module = dict.fromkeys(statesPerModule.keys())
     for m in statesPerModule.keys():
-        time_per_module[m] = 0
+        ticks_per_module[m] = 0
         freqs_per_module[m] = []
 
-    time_per_module["main"] += time 
+    ticks_per_module["main"] += ticks
     freqs_per_module["main"] = [PLL_CLOCK/((2**COUNTER_BITS)-1),PLL_CLOCK/((2**COUNTER_BITS)-1)]
 
-    for cycle in range(transition_count):
-        freqs = []
-        instance = "main_inst"
-        state = activeStateNames[instance][cycle]
-        if cycle+1 < transition_count: next_state = activeStateNames[instance][cycle+1]
-        else: next_state = activeStateNames[instance][0]
-        instance_base = "main"
-        if not(state in subroutine_calls[instance_base].keys() and next_state in subroutine_calls[instance_base].keys()):
-            freqs.append(correctedFrequencyPerState[state])
-        while state in subroutine_calls[instance_base].keys():
-            instance = instance + '.' + subroutine_calls[instance_base][state]
-            state = activeStateNames[instance][cycle]
-            if cycle+1 < transition_count: next_state = activeStateNames[instance][cycle+1]
-            else: next_state = activeStateNames[instance][0]
-            instance_base = instance.split('.')[-1]
-            if not (state in subroutine_calls[instance_base].keys() and next_state in subroutine_calls[instance_base].keys()):
-                freqs.append(correctedFrequencyPerState[state])
-        ideal_time += 1.0/(min(freqs))
+    # sub-routine deepest in the call chain of each cycle
+    depth = np.array([instance.count('.') for instance in instances])
+    deepest = np.argmax(np.where(active[2:], depth, -1), axis=1)
+    module_names = list(statesPerModule.keys())
+    module_of_instance = np.array([module_names.index("main" if instance == "main_inst" else instance.split('.')[-1]) for instance in instances])
+    module_per_cycle = module_of_instance[deepest]
+    transitions = TransitionCounts.from_trace(states, module_names, tables['state_table'], matrix, counted, module_per_cycle)
+    transitions.save(os.path.join(out_dir, "transitions.npz"))
 
     if pipeline:
-        precise_time = 1.0/(PLL_CLOCK/((2**COUNTER_BITS)-1))+1.0/(PLL_CLOCK/((2**COUNTER_BITS)-1))
-        nextStatesPerState = read_file(os.path.join(out_dir, "hls_nstatesPerState.json"))
-
-        for cycle in range(2, transition_count):
-            freqs = []
-            precise_freqs = []
-
-            instance = "main_inst"
-            state = activeStateNames[instance][cycle]
-            if cycle+1 < transition_count: next_state = activeStateNames[instance][cycle+1]
-            else: next_state = activeStateNames[instance][0]
-            instance_base = "main"
-            if not(state in subroutine_calls[instance_base].keys() and next_state in subroutine_calls[instance_base].keys()):
-                previous_state = activeStateNames[instance][cycle-1] 
-                current_state_candidates = nextStatesPerState[previous_state]
-                freqs.append(min([binnedFrequencyPerState[s] for s in current_state_candidates]))
-                precise_freqs.append(binnedFrequencyPerState[state])
-
-            while state in subroutine_calls[instance_base].keys():
-                instance = instance + '.' + subroutine_calls[instance_base][state]
-                state = activeStateNames[instance][cycle]
-                if cycle+1 < transition_count: next_state = activeStateNames[instance][cycle+1]
-                else: next_state = activeStateNames[instance][0]
-                instance_base = instance.split('.')[-1]
-                if not (state in subroutine_calls[instance_base].keys() and next_state in subroutine_calls[instance_base].keys()):
-                    previous_state = activeStateNames[instance][cycle-1] 
-                    current_state_candidates = nextStatesPerState[previous_state]
-                    freqs.append(min([float(binnedFrequencyPerState[s]) for s in current_state_candidates]))
-                    precise_freqs.append(binnedFrequencyPerState[state])
-
-            hwFrequencySchedule.append(min(freqs))
-            if min(freqs) not in hwFreqcounter.keys(): hwFreqcounter[min(freqs)] = 0
-            hwFreqcounter[min(freqs)] += 1
-            time += 1.0/(min(freqs))
-            precise_time += 1.0/min(precise_freqs)
+        precise_ticks = ticks
+        # the divisor is chosen in the previous state, for any of its next states
+        state_table = tables['state_table']
+        predicted = np.zeros(len(states), dtype=np.int64)
+        for state in range(len(states)):
+            candidates = state_table.successors(state)
+            if len(candidates): predicted[state] = divs[np.frombuffer(candidates, dtype=np.int32)].max()
+        hw_divs = np.where(counted[2:], predicted[matrix[1:-1]], 0).max(axis=1)
+        precise_divs = np.where(counted[2:], divs[matrix[2:]], 0).max(axis=1)
+        precise_ticks += int(precise_divs.sum())
+        precise_time = precise_ticks/PLL_CLOCK
 
         print("PRECISE SIMULATION LATENCY ",precise_time)
-        print("PRECISE SIMULATION EFFECTIVE FREQUENCY ",float(len(hwFrequencySchedule))/precise_time)
+        print("PRECISE SIMULATION EFFECTIVE FREQUENCY ",float(len(hwFrequencySchedule)+len(hw_divs))/precise_time)
     else: 
         print(subroutine_calls)
-        for cycle in range(2, transition_count):
-            freqs = []
-            instance = "main_inst"
-            state = activeStateNames[instance][cycle]
-            if cycle+1 < transition_count: next_state = activeStateNames[instance][cycle+1]
-            else: next_state = activeStateNames[instance][0]
-            instance_base = "main"
-            if not(state in subroutine_calls[instance_base].keys() and next_state in subroutine_calls[instance_base].keys()):
-                freqs.append(binnedFrequencyPerState[state])
-
-            while state in subroutine_calls[instance_base].keys():
-                instance = instance + '.' + subroutine_calls[instance_base][state]
-                state = activeStateNames[instance][cycle]
-                if cycle+1 < transition_count: next_state = activeStateNames[instance][cycle+1]
-                else: next_state = activeStateNames[instance][0]
-                instance_base = instance.split('.')[-1]
-                if not (state in subroutine_calls[instance_base].keys() and next_state in subroutine_calls[instance_base].keys()):
-                    freqs.append(float(binnedFrequencyPerState[state]))
-
-            hwFrequencySchedule.append(min(freqs))
-            freqs_per_module[instance_base].append(min(freqs))
-            if min(freqs) not in hwFreqcounter.keys(): hwFreqcounter[min(freqs)] = 0
-            hwFreqcounter[min(freqs)] += 1
-            time += 1.0/(min(freqs))
-            time_per_module[instance_base] += 1.0/(min(freqs))
+        hw_divs = np.where(counted[2:], divs[matrix[2:]], 0).max(axis=1)
+        for i, m in enumerate(module_names):
+            in_module = module_per_cycle == i
+            freqs_per_module[m] += (PLL_CLOCK/hw_divs[in_module]).tolist()
+            ticks_per_module[m] += int(hw_divs[in_module].sum())
+
+    assert(np.all(hw_divs > 0))
+    ticks += int(hw_divs.sum())
+    hwFrequencySchedule += (PLL_CLOCK/hw_divs).tolist()
+    hwFreqcounter = {}
+    values, first, counts = np.unique(hw_divs, return_index=True, return_counts=True)
+    for i in np.argsort(first):
+        hwFreqcounter[PLL_CLOCK/values[i]] = int(counts[i])
+    time = ticks/PLL_CLOCK
+    time_per_module = dict((m, t/PLL_CLOCK if t else 0) for m, t in ticks_per_module.items())
 
+    if not pipeline:
         print("Per-Module Syncopation Results")
         for m in statesPerModule.keys():
             if time_per_module[m] == 0: print("No cycles in module ", m)
             else: print(m," EFFECTIVE FREQUENCY",float(len(freqs_per_module[m]))/time_per_module[m])
 
-    save(os.path.join(out_dir, "correctedFrequencySchedule.csv"), correctedFrequencySchedule)
-    save(os.path.join(out_dir, "hwFrequencySchedule.csv"), hwFrequencySchedule)
-    save(os.path.join(out_dir, "hwFreqCounter.json"), hwFreqcounter)
-    save(os.path.join(out_dir, "hwTime.csv"), [time])
-    save(os.path.join(out_dir, "instances.csv"), instances)
-    save(os.path.join(out_dir, "time_per_module.json"), time_per_module)
-    save(os.path.join(out_dir, "freqs_per_module.json"), freqs_per_module)
+    project.save("correctedFrequencySchedule.csv", correctedFrequencySchedule)
+    project.save("hwFrequencySchedule.csv", hwFrequencySchedule)
+    project.save("hwFreqCounter.json", hwFreqcounter)
+    project.save("hwTime.csv", [time])
+    project.save("instances.csv", instances)
+    project.save("time_per_module.json", time_per_module)
+    project.save("freqs_per_module.json", freqs_per_module)
 
     print("SIMULATION LATENCY ",time)
     print("SIMULATION HYPOTHETICAL FMAX ",float(len(hwFrequencySchedule))/ideal_time)
     print("SIMULATION EFFECTIVE FREQUENCY ",float(len(hwFrequencySchedule))/time)
-
-
-
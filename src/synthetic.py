@@ -0,0 +1,250 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+"""
+Synthetic LegUp 4.0 designs: a scheduling.legup.rpt and the matching
+Verilog, in the formats read by schedule_processing and
+verilog_processing. Used to benchmark the parsers without the LegUp VM.
+
+Modules form a call tree of the given depth under main. Each module is a
+chain of basic blocks with forward branches, one function call state per
+callee and a final return state. Instructions are drawn from the mix:
+    alu     single cycle add/sub/and/xor
+    mul     two cycle multiply with a stage0 register
+    div     multi-cycle sdiv
+    load    two cycle load through the memory controller
+    store   single cycle store
+"""
+
+import os, math, random
+
+DEFAULT_MIX = {'alu':0.6, 'mul':0.1, 'div':0.05, 'load':0.15, 'store':0.1}
+ALU_OPS = ['add', 'sub', 'and', 'xor']
+PORTS = ['clk', 'clk2x', 'clk1x_follower', 'reset', 'memory_controller_waitrequest', 'start', 'finish', 'return_val']
+
+class SyntheticModule(object):
+    """ Schedule of one synthetic module: states, their instructions and next states """
+    def __init__(self, name, num_states, callees, instructions_per_state, mix, rng, first_register=0):
+        self.name = name
+        self.callees = callees
+        self.states = [] # (name, value, basic block)
+        self.instructions = {} # state -> [(kind, text, destination, finish state)]
+        self.next_states = {}
+        self.registers = []
+        self.first_register = first_register
+        self.generate(max(num_states, len(callees) + 3), instructions_per_state, mix, rng)
+
+    def generate(self, num_states, instructions_per_state, mix, rng):
+        m = self.name
+        self.bits = max(1, int(math.ceil(math.log(num_states, 2))))
+        # basic blocks of 2-8 states, call states placed at random positions
+        call_values = set(rng.sample(range(1, num_states-1), len(self.callees)))
+        block = 0
+        left = 0
+        for value in range(num_states):
+            if value == 0:
+                self.states.append(("LEGUP_0", 0, "0"))
+                continue
+            if left == 0:
+                block += 1
+                left = rng.randint(2, 8)
+            left -= 1
+            if value in call_values: name = "LEGUP_function_call_{}".format(value)
+            else: name = "LEGUP_F_{}_BB{}_{}".format(m, block, value)
+            self.states.append((name, value, "BB{}".format(block)))
+
+        names = [s[0] for s in self.states]
+        kinds = list(mix.keys())
+        weights = [mix[k] for k in kinds]
+        callees = list(self.callees)
+        # registers are numbered across modules, LegUp matches instructions by their text
+        first = self.first_register
+        count = first
+        for i, (state, value, bb) in enumerate(self.states):
+            self.instructions[state] = []
+            if i == 0:
+                self.next_states[state] = [state, names[1]]
+                continue
+            if i == len(self.states) - 1:
+                self.instructions[state].append(('ret', "ret i32 %v{}".format(max(count-1, first)), None, state))
+                self.next_states[state] = [names[0]]
+                continue
+            if state.startswith("LEGUP_function_call"):
+                callee = callees.pop(0)
+                text = "%v{} = call i32 @{}(i32 %v{})".format(count, callee, rng.randint(first, max(count-1, first)))
+                self.instructions[state].append(('call', text, "v{}".format(count), state))
+                self.registers.append(("v{}".format(count), bb))
+                count += 1
+                self.next_states[state] = [state, names[i+1]]
+                continue
+            # later states of the same basic block, where multi-cycle instructions finish
+            rest = []
+            for s, _, b in self.states[i+1:i+9]:
+                if b != bb or s.startswith("LEGUP_function_call"): break
+                rest.append(s)
+            for _ in range(instructions_per_state):
+                kind = rng.choices(kinds, weights)[0]
+                if kind in ('mul', 'load', 'div') and len(rest) == 0: kind = 'alu'
+                a = "%v{}".format(rng.randint(first, count-1)) if count > first else "1"
+                b = "%v{}".format(rng.randint(first, count-1)) if count > first else "2"
+                dest = "v{}".format(count)
+                finish = state
+                if kind == 'alu': text = "%{} = {} i32 {}, {}".format(dest, rng.choice(ALU_OPS), a, b)
+                elif kind == 'mul':
+                    text = "%{} = mul i32 {}, {}".format(dest, a, b)
+                    finish = rest[0]
+                elif kind == 'div':
+                    text = "%{} = sdiv i32 {}, {}".format(dest, a, b)
+                    finish = rest[min(len(rest), rng.randint(2, 8))-1]
+                elif kind == 'load':
+                    text = "%{} = load i32* {}, align 4".format(dest, a)
+                    finish = rest[0]
+                else:
+                    text = "store i32 {}, i32* {}, align 4".format(a, b)
+                    dest = None
+                self.instructions[state].append((kind, text, dest, finish))
+                if dest:
+                    self.registers.append((dest, bb))
+                    count += 1
+            # last state of a block branches to the next block, sometimes skipping ahead
+            next_states = [names[i+1]]
+            if self.states[i+1][2] != bb:
+                text = "br label %{}".format(self.states[i+1][2])
+                if rng.random() < 0.3 and i+2 < len(self.states)-1:
+                    skip = rng.randint(i+2, len(self.states)-2)
+                    next_states.append(names[skip])
+                    text = "br i1 {}, label %{}, label %{}".format("%v{}".format(count-1) if count > first else "true", self.states[i+1][2], self.states[skip][2])
+                self.instructions[state].append(('br', text, None, state))
+            self.next_states[state] = next_states
+
+    def schedule(self):
+        """ Lines of this module in scheduling.legup.rpt """
+        lines = ["Start Function: {}".format(self.name)]
+        bb = None
+        for state, value, block in self.states:
+            if block != bb:
+                bb = block
+                lines.append("  Basic Block: %{}".format(block))
+            lines.append("    state: {}".format(state))
+            for kind, text, dest, finish in self.instructions[state]:
+                if kind in ('br', 'ret'): lines.append("      {}".format(text))
+                else: lines.append("      {} (endState: {})".format(text, finish))
+            lines.append("      Transition: {}".format(' '.join(self.next_states[state])))
+        lines.append("")
+        return lines
+
+    def verilog(self):
+        """ Lines of this module in the LegUp Verilog """
+        m = self.name
+        w = self.bits
+        lines = ["module {}".format(m), "("]
+        lines += ["\t{},".format(p) for p in PORTS[:-1]] + ["\t{}".format(PORTS[-1]), ");", ""]
+        for state, value, bb in self.states:
+            lines.append("parameter [{}:0] {} = {}'d{};".format(w-1, state, w, value))
+        lines += ["", "input  clk;", "input  clk2x;", "input  clk1x_follower;", "input  reset;",
+            "input  memory_controller_waitrequest;", "input  start;", "output reg  finish;", "output reg [31:0] return_val;",
+            "reg [{}:0] cur_state;".format(w-1), "reg [{}:0] next_state;".format(w-1)]
+        for reg, bb in self.registers:
+            lines.append("reg [31:0] {}_{}_{}_reg;".format(m, bb, reg))
+        for callee in self.callees:
+            lines += ["reg  {}_start;".format(callee), "wire  {}_finish;".format(callee), "wire [31:0] {}_return_val;".format(callee)]
+        lines.append("")
+
+        for callee in self.callees:
+            lines.append("{} {} (".format(callee, callee))
+            for p in PORTS:
+                if p in ('start', 'finish', 'return_val'): signal = "{}_{}".format(callee, p)
+                else: signal = p
+                lines.append("\t.{} ({}){}".format(p, signal, "" if p == PORTS[-1] else ","))
+            lines += [");", ""]
+
+        lines += ["always @(posedge clk) begin", "if (reset == 1'b1)", "\tcur_state <= LEGUP_0;",
+            "else if (memory_controller_waitrequest == 1'd1)", "\tcur_state <= cur_state;", "else", "\tcur_state <= next_state;", "end", ""]
+
+        for state, value, bb in self.states:
+            for kind, text, dest, finish in self.instructions[state]:
+                if kind in ('load', 'store'):
+                    # address of the memory access in its first state
+                    lines += ["always @(*) begin", "\t/* {}: %{}*/".format(m, bb), "\t/*   {}*/".format(text),
+                        "\tif ((cur_state == {})) begin".format(state), "\t\tmemory_controller_address_a = 32'd0;", "\tend", "end"]
+                if dest:
+                    reg = "{}_{}_{}".format(m, bb, dest)
+                    source = "{}_return_val".format(text.split('@')[1].split('(')[0]) if kind == 'call' else reg
+                    lines += ["always @(posedge clk) begin", "\t/* {}: %{}*/".format(m, bb), "\t/*   {}*/".format(text),
+                        "\tif ((cur_state == {})) begin".format(finish), "\t\t{}_reg <= {};".format(reg, source), "\tend", "end"]
+                if kind == 'call':
+                    # start signal of the callee, asserted in the call state
+                    start = "{}_start".format(source.split('_return_val')[0])
+                    lines += ["always @(posedge clk) begin", "\tif ((cur_state == LEGUP_0)) begin", "\t\t{} <= 1'd0;".format(start), "\tend",
+                        "\t/* {}: %{}*/".format(m, bb), "\t/*   {}*/".format(text),
+                        "\tif ((cur_state == {})) begin".format(state), "\t\t{} <= 1'd1;".format(start), "\tend", "end"]
+                if kind == 'mul':
+                    lines += ["always @(posedge clk) begin", "\tif (clk) begin", "\tif (!memory_controller_waitrequest) begin",
+                        "\t\t{}_{}_{}_stage0_reg <= {}_{}_{};".format(m, bb, dest, m, bb, dest), "\tend", "\tend", "end"]
+        lines += ["endmodule", ""]
+        return lines
+
+def generate_design(directory, name="main", num_modules=4, states_per_module=64, instructions_per_state=2,
+        call_depth=2, mix=DEFAULT_MIX, seed=0):
+    """
+    Writes scheduling.legup.rpt and <name>.v of a synthetic design to directory,
+    returns the path of the Verilog file. Modules are written one at a time,
+    so designs of a million states fit in memory.
+    """
+    rng = random.Random(seed)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    # call tree: every module below main has a caller one level up
+    modules = ["main"] + ["fn{}x".format(i) for i in range(1, num_modules)]
+    levels = [["main"]] + [[] for _ in range(max(call_depth, 1))]
+    callees = dict((m, []) for m in modules)
+    for i, m in enumerate(modules[1:]):
+        level = 1 + i % max(call_depth, 1)
+        if len(levels[level-1]) == 0: level = 1
+        callees[rng.choice(levels[level-1])].append(m)
+        levels[level].append(m)
+
+    verilog_file = os.path.join(directory, name+".v")
+    with open(os.path.join(directory, "scheduling.legup.rpt"), 'w') as rpt, open(verilog_file, 'w') as v:
+        registers = 0
+        for m in modules:
+            module = SyntheticModule(m, states_per_module, callees[m], instructions_per_state, mix, rng, registers)
+            registers += len(module.registers)
+            rpt.write('\n'.join(module.schedule())+'\n')
+            v.write('\n'.join(module.verilog())+'\n')
+        v.write('\n'.join(top_verilog())+'\n')
+    return verilog_file
+
+def top_verilog():
+    """ top, memory controller and testbench modules around main """
+    lines = ["module top", "("] + ["\t{},".format(p) for p in ['clk', 'reset', 'start', 'finish']] + ["\treturn_val", ");", ""]
+    lines += ["input  clk;", "input  reset;", "input  start;", "output wire  finish;", "output wire [31:0] return_val;",
+        "wire  memory_controller_waitrequest;", ""]
+    lines += ["main main_inst(", "\t.clk (clk),", "\t.clk2x (clk),", "\t.clk1x_follower (1'b0),", "\t.reset (reset),",
+        "\t.memory_controller_waitrequest (memory_controller_waitrequest),", "\t.start (start),", "\t.finish (finish),",
+        "\t.return_val (return_val)", ");", ""]
+    lines += ["memory_controller memory_controller_inst (", "\t.clk (clk),", "\t.waitrequest (memory_controller_waitrequest)", ");", "", "endmodule", ""]
+    lines += ["module memory_controller", "(", "\tclk,", "\twaitrequest", ");", "input clk;", "output reg waitrequest;", "endmodule", ""]
+    lines += ["module main_tb", "(", ");", "reg  clk;", "reg  reset;", "reg  start;", "wire  finish;", "wire [31:0] return_val;", "",
+        "top top_inst (", "\t.clk (clk),", "\t.reset (reset),", "\t.start (start),", "\t.finish (finish),", "\t.return_val (return_val)", ");", "", "endmodule"]
+    return lines
@@ -0,0 +1,53 @@
+package require cmdline
+
+# Long-lived timing session. Commands are read one per line from stdin,
+# each reply is terminated by a line containing only STA_DONE:
+#   longest <clock> [<to> <from>]   worst setup slack (optionally between nodes)
+#   fmax                            clock fmax summary
+#   reload                          re-read project sdc files
+#   exit
+
+fconfigure stdout -buffering line
+
+project_open top
+create_timing_netlist
+read_sdc
+update_timing_netlist
+
+puts "STA_READY"
+
+while {[gets stdin line] >= 0} {
+    set cmd [lindex $line 0]
+    if {$cmd == "exit"} { break }
+
+    if {[catch {
+        if {$cmd == "longest"} {
+            set clk [lindex $line 1]
+            if {[llength $line] > 2} {
+                set to [lindex $line 2]
+                set from [lindex $line 3]
+                set tuple [report_timing -detail summary -from_clock $clk -to_clock $clk -to $to -from $from -setup -npaths 1 -nworst 1 -pairs_only]
+            } else {
+                set tuple [report_timing -detail summary -from_clock $clk -to_clock $clk -setup -npaths 1 -nworst 1 -pairs_only]
+            }
+            set num [lindex $tuple 0]
+            set result [lindex $tuple 1]
+            puts "Slack: $result"
+        } elseif {$cmd == "fmax"} {
+            set clk [report_clock_fmax_summary]
+            puts $clk
+        } elseif {$cmd == "reload"} {
+            reset_design
+            read_sdc
+            update_timing_netlist
+        } else {
+            puts "Error: unknown command $cmd"
+        }
+    } err]} {
+        puts "Error: $err"
+    }
+    puts "STA_DONE"
+}
+
+delete_timing_netlist
+project_close
@@ -0,0 +1,144 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+import numpy as np
+from .settings import *
+
+class TransitionCounts(object):
+    """
+    Summary of a simulated state trace for what-if analysis of frequency
+    tables. Rows are distinct call contexts, with a column per instance
+    holding the state id counted in that cycle (-1 where the instance is
+    off the call chain or waiting on a call):
+        states/previous/modules/counts  cycles from the third on, by the
+                                        counted states, the states of the
+                                        same instances one cycle earlier
+                                        (pipelined divisor prediction) and
+                                        the module deepest in the chain
+        visits/visit_counts             every cycle, by counted states
+    successors holds the next state ids of each state, padded with -1.
+    Evaluating a table is O(contexts + states) regardless of trace length.
+    """
+    def __init__(self, state_names, module_names, successors, states, previous, modules, counts, visits, visit_counts):
+        self.state_names = list(state_names)
+        self.module_names = list(module_names)
+        self.successors = successors
+        self.states = states
+        self.previous = previous
+        self.modules = modules
+        self.counts = counts
+        self.visits = visits
+        self.visit_counts = visit_counts
+        self.state_ids = dict((name, i) for i, name in enumerate(self.state_names))
+
+    @classmethod
+    def from_trace(cls, state_names, module_names, state_table, matrix, counted, module_per_cycle):
+        """
+        Reduce a cycles x instances matrix of state ids, its counted mask
+        and the deepest module index of every cycle from the third on
+        """
+        width = matrix.shape[1]
+        current = np.where(counted, matrix, -1)
+        keys = np.concatenate([current[2:], np.where(counted[2:], matrix[1:-1], -1), module_per_cycle[:, None]], axis=1)
+        keys, counts = np.unique(keys, axis=0, return_counts=True)
+        visits, visit_counts = np.unique(current, axis=0, return_counts=True)
+
+        num_states = len(state_names)
+        num_successors = max([len(state_table.successors(s)) for s in range(num_states)] + [1])
+        successors = np.full((num_states, num_successors), -1, dtype=np.int32)
+        for s in range(num_states):
+            next_states = state_table.successors(s)
+            successors[s, :len(next_states)] = next_states
+        return cls(state_names, module_names, successors, keys[:, :width], keys[:, width:2*width], keys[:, 2*width], counts, visits, visit_counts)
+
+    def save(self, filename):
+        if DEBUG: print("DEBUG: Saving "+filename)
+        np.savez_compressed(filename, state_names=np.array(self.state_names), module_names=np.array(self.module_names),
+            successors=self.successors, states=self.states, previous=self.previous, modules=self.modules,
+            counts=self.counts, visits=self.visits, visit_counts=self.visit_counts)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            return cls(f['state_names'].tolist(), f['module_names'].tolist(), f['successors'], f['states'],
+                f['previous'], f['modules'], f['counts'], f['visits'], f['visit_counts'])
+
+    @property
+    def cycles(self):
+        return int(self.visit_counts.sum())
+
+    def frequency_array(self, frequencies):
+        """ Per-state frequencies by state id, from a dict by state name or an array """
+        if isinstance(frequencies, dict):
+            table = np.full(len(self.state_names), np.nan)
+            for state, frequency in frequencies.items():
+                if state in self.state_ids: table[self.state_ids[state]] = frequency
+            return table
+        return np.asarray(frequencies, dtype=float)
+
+    def divisors(self, frequencies, pll_clock=PLL_CLOCK, counter_bits=COUNTER_BITS):
+        """ Smallest PLL divisor (at least 2) not exceeding each frequency, as get_frequency_div """
+        frequencies = self.frequency_array(frequencies)
+        divs = np.maximum(np.ceil(float(pll_clock)/frequencies), 2)
+        # ceil can overshoot by one where pll_clock/frequency rounds up
+        lower = np.maximum(divs - 1, 2)
+        divs = np.where(float(pll_clock)/lower <= frequencies, lower, divs)
+        # states without a frequency get no divisor, they must not be visited
+        divs = np.where(np.isnan(frequencies), 0, divs).astype(np.int64)
+        assert(np.all(divs < 2**counter_bits))
+        return divs
+
+    def evaluate(self, frequencies, pipeline=False, pll_clock=PLL_CLOCK, counter_bits=COUNTER_BITS):
+        """
+        Latency, effective frequency and time per module of the trace with
+        the frequencies of a per-state table binned to pll_clock/div, as
+        get_simulation_performance reports them
+        """
+        frequencies = self.frequency_array(frequencies)
+        divs = np.append(self.divisors(frequencies, pll_clock, counter_bits), 0) # index -1 -> no state
+        if pipeline:
+            # the divisor is chosen in the previous state, for any of its next states
+            predicted = np.append(divs[self.successors].max(axis=1), 0)
+            context_divs = predicted[self.previous].max(axis=1)
+        else:
+            context_divs = divs[self.states].max(axis=1)
+        assert(np.all(context_divs > 0))
+
+        # takes two cycles to set dynamic clock for the first time
+        init_ticks = 2*((2**counter_bits)-1)
+        ticks = init_ticks + int(np.dot(self.counts, context_divs))
+        time = ticks/float(pll_clock)
+        ideal_time = float(np.sum(self.visit_counts/np.append(frequencies, np.inf)[self.visits].min(axis=1)))
+
+        ticks_per_module = np.zeros(len(self.module_names), dtype=np.int64)
+        if not pipeline:
+            np.add.at(ticks_per_module, self.modules, self.counts*context_divs)
+        ticks_per_module[self.module_names.index("main")] += init_ticks
+        time_per_module = dict((m, t/float(pll_clock) if t else 0) for m, t in zip(self.module_names, ticks_per_module.tolist()))
+
+        return {
+            'time':time,
+            'effective_frequency':self.cycles/time,
+            'hypothetical_fmax':self.cycles/ideal_time,
+            'time_per_module':time_per_module
+        }
@@ -21,18 +21,19 @@
 # IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #---------------------------------------------------------------------------
 
-from .misc import read_file, save
+from .misc import read_file
+from .cache import artifact_cache
 from .string_templates import rom_file_template, qip_file_template
 from .settings import *
 import os
 from string import Template
 
-def get_modules(verilog_file):
+def get_modules(project):
     """ Return list of module names """
-    project_name = verilog_file.split(".")[0]
+    verilog_file = project.verilog_file
     project_folder = os.path.dirname(verilog_file)
     schedule_file = os.path.join(project_folder,"scheduling.legup.rpt")
-    modules_file = os.path.join(project_name+"_files","hls_modules.csv")
+    modules_file = "hls_modules.csv"
 
     def extract_modules(verilog_file, modules_file):
         lines = read_file(schedule_file)    
@@ -53,20 +54,20 @@ def get_modules(verilog_file):
                 if currentModule not in modules:
                     modules.append(currentModule)
 
-        save(modules_file, modules)
+        project.save(modules_file, modules)
         return modules
 
-    if not os.path.exists(modules_file):
+    if not project.exists(modules_file):
         modules = extract_modules(verilog_file, modules_file)
     else:
-        modules = read_file(modules_file)
+        modules = project.read(modules_file)
 
     return modules
 
-def get_states(verilog_file):
+def get_states(project):
     """ Return list of module names """
-    project_name = verilog_file.split(".")[0]
-    states_file = os.path.join(project_name+"_files","states.csv")
+    verilog_file = project.verilog_file
+    states_file = "states.csv"
 
     def extract_state(verilog_file, modules_file):
         lines = read_file(verilog_file)    
@@ -99,28 +100,34 @@ def get_states(verilog_file):
                 if state not in states: 
                     states.append(state)
 
-        save(states_file, states)
+        project.save(states_file, states)
         return states
 
-    if not os.path.exists(states_file):
+    if not project.exists(states_file):
         states = extract_state(verilog_file, states_file)
     else:
-        lines = read_file(states_file)
-        # extract into tuples
-        states = []
-        for line in lines:
-            s = line.split(',')[0].split('(')[1].strip("'")
-            v = [l.strip("' ") for l in line.split('[')[1].split(']')[0].split(',')]
-            states.append((s, v))
+        states = project.read(states_file)
+        if states and isinstance(states[0], str):
+            # exported csv rows, extract into tuples
+            lines = states
+            states = []
+            for line in lines:
+                s = line.split(',')[0].split('(')[1].strip("'")
+                v = [l.strip("' ") for l in line.split('[')[1].split(']')[0].split(',')]
+                states.append((s, v))
+            project.data[states_file] = states
 
     return states
 
-def get_rtl_data(verilog_file):
+def get_rtl_data(project):
+    """ RTL data of the project, restored from the artifact cache if possible """
+    artifact_cache.run(project, "get_rtl_data", [project.verilog_file], parse_rtl_data)
+
+def parse_rtl_data(project):
     """
     Extract States, Registers, and Modules from Verilog File
     """
-    project_name = verilog_file.split(".")[0]
-    out_dir = project_name+"_files"
+    verilog_file = project.verilog_file
 
     lines = read_file(verilog_file)
     # open unedited verilog file 
@@ -414,49 +421,49 @@ def get_rtl_data(verilog_file):
         previousLine = currentLine
 
 
-    save(os.path.join(out_dir,"rtl_instructions.csv"), instructions)
-    save(os.path.join(out_dir,"rtl_states.csv"), states)
-    save(os.path.join(out_dir,"rtl_modules.csv"), modules)
-    save(os.path.join(out_dir,"rtl_registers.csv"), registers)
+    project.save("rtl_instructions.csv", instructions)
+    project.save("rtl_states.csv", states)
+    project.save("rtl_modules.csv", modules)
+    project.save("rtl_registers.csv", registers)
 
-    save(os.path.join(out_dir,"rtl_memoryInstances.json"), memory_instances)
-    save(os.path.join(out_dir,"rtl_memoryModules.json"), memory_modules)
+    project.save("rtl_memoryInstances.json", memory_instances)
+    project.save("rtl_memoryModules.json", memory_modules)
 
     for k,v in memory_per_instruction.items(): memory_per_instruction[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"rtl_memoriesPerInstruction.json"), memory_per_instruction)
+    project.save("rtl_memoriesPerInstruction.json", memory_per_instruction)
 
     for k,v in registers_per_state.items(): registers_per_state[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"rtl_regsPerState.json"), registers_per_state)
+    project.save("rtl_regsPerState.json", registers_per_state)
 
     for k,v in states_per_module.items(): states_per_module[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"rtl_statesPerModule.json"), states_per_module)
+    project.save("rtl_statesPerModule.json", states_per_module)
 
     for k,v in registers_per_instruction.items(): registers_per_instruction[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"rtl_regsPerInstruction.json"), registers_per_instruction)
+    project.save("rtl_regsPerInstruction.json", registers_per_instruction)
 
     for k,v in registers_per_module.items(): registers_per_module[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"rtl_regsPerModule.json"), registers_per_module)
+    project.save("rtl_regsPerModule.json", registers_per_module)
 
     for k,v in instructions_per_module.items(): instructions_per_module[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"rtl_instructionsPerModule.json"), instructions_per_module)
+    project.save("rtl_instructionsPerModule.json", instructions_per_module)
 
     for k,v in nodes_per_module.items(): nodes_per_module[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"rtl_nodesPerModule.json"), nodes_per_module)
+    project.save("rtl_nodesPerModule.json", nodes_per_module)
 
     for k,v in phi_constant_source_per_state.items(): phi_constant_source_per_state[k] = list(dict.fromkeys(v))
-    save(os.path.join(out_dir,"rtl_constantPhiPerState.json"), phi_constant_source_per_state)
+    project.save("rtl_constantPhiPerState.json", phi_constant_source_per_state)
 
-    save(os.path.join(out_dir,"rtl_startsPerInstruction.json"), start_sigs_per_instruction)
-    save(os.path.join(out_dir,"rtl_functionCallValues.json"), function_call_values)
+    project.save("rtl_startsPerInstruction.json", start_sigs_per_instruction)
+    project.save("rtl_functionCallValues.json", function_call_values)
 
-def generate_roms(verilog_file):
-    project_name = verilog_file.split(".")[0]
-    out_dir = project_name+"_files"
+def generate_roms(project):
+    verilog_file = project.verilog_file
+    out_dir = project.out_dir
     bmark = os.path.basename(verilog_file).split(".")[0]
 
-    modules = get_modules(verilog_file)
-    num_bits = get_num_bits(verilog_file)
-    num_nStates = get_num_nStates(out_dir) 
+    modules = get_modules(project)
+    num_bits = get_num_bits(project)
+    num_nStates = get_num_nStates(project) 
     
     for module in modules:
         addr_w = num_bits[module]
@@ -484,19 +491,18 @@ def generate_roms(verilog_file):
         with open(qip_file, "w+") as outf:
             outf.write(qip_file_template.safe_substitute(qip_dict))
 
-def generate_temp_mif(verilog_file):
-    project_name = verilog_file.split(".")[0]
-    out_dir = project_name+"_files"
+def generate_temp_mif(project):
+    out_dir = project.out_dir
 
-    modules = get_modules(verilog_file)
-    num_bits = get_num_bits(verilog_file)
-    num_nStates = get_num_nStates(out_dir) 
+    modules = get_modules(project)
+    num_bits = get_num_bits(project)
+    num_nStates = get_num_nStates(project) 
 
     for module in modules:
         addr_w = num_bits[module]
         data_w = num_nStates[module]*COUNTER_BITS + num_nStates[module]*addr_w
         depth = 2**addr_w
-        tags_per_address = get_tags_per_address(out_dir, verilog_file, module)
+        tags_per_address = get_tags_per_address(project, module)
 
         mif_file = os.path.join(out_dir, "rom", "{}_rom.mif".format(module))
         if not os.path.exists(os.path.dirname(mif_file)):
@@ -528,19 +534,19 @@ def generate_temp_mif(verilog_file):
                 outf.write("\t{:x} : {:x};\n".format(address,output))
             outf.write("END\n")
 
-def pull_out_state(pipeline, verilog_file):
-    project_name = verilog_file.split(".")[0]
-    out_dir = project_name+"_files"
-    modules = get_modules(verilog_file)
+def pull_out_state(pipeline, project):
+    verilog_file = project.verilog_file
+    project_name = project.project_name
+    modules = get_modules(project)
     verilog = read_file(verilog_file)
 
     modules = modules + ['top']
 
-    instructions_per_start_sig = read_file(os.path.join(out_dir,"rtl_startsPerInstruction.json"))
-    value_per_state = read_file(os.path.join(out_dir,"rtl_functionCallValues.json"))
-    instructions_per_state = read_file(os.path.join(out_dir,"hls_instructionsPerState.json"))
-    hls_function_per_state = read_file(os.path.join(out_dir,"hls_functionCallsPerState.json"))
-    nstatesPerModule = get_num_nStates(out_dir)
+    instructions_per_start_sig = project.read("rtl_startsPerInstruction.json")
+    value_per_state = project.read("rtl_functionCallValues.json")
+    instructions_per_state = project.read("hls_instructionsPerState.json")
+    hls_function_per_state = project.read("hls_functionCallsPerState.json")
+    nstatesPerModule = get_num_nStates(project)
     
     module_formats = {}
     module_lengths = {}
@@ -804,7 +810,6 @@ def pull_out_state(pipeline, verilog_file):
                         else: new_paths.append(new_path)
                 return populate_paths(new_paths, done_paths)
 
-            strings = ["always @(posedge clk) begin"]
             instances = []
             for k,v in instance_names_per_module.items():
                 instances.extend(v)
@@ -813,19 +818,17 @@ def pull_out_state(pipeline, verilog_file):
                 paths = ['{}.cur_state'.format(instance)]
                 p,done = populate_paths(paths,[])
                 all_paths.extend(done)
-            l = '$display("STATE '
-            m = '"'
             all_paths = list(dict.fromkeys(all_paths))
+            state_paths = []
             for path in all_paths:
                 path = path.split('.')[1::]
                 path = '.'.join(path)
                 basepath = path.split('.')[0:-1]
                 basepath = '.'.join(basepath)
-                l = l +'{}\t%d\t'.format(basepath)
-                m = m +',{}'.format(path)
-            m = m + ");"
-            strings.append(l+m)
-            strings.append('end')
+                state_paths.append((basepath, path))
+            if STATE_TRACE == "binary": strings = state_trace_writer(state_paths)
+            elif STATE_TRACE == "changes": strings = state_change_display(state_paths, subroutine_calls, value_per_state)
+            else: strings = state_display(state_paths)
             i = len(strings)-1
             while i >= 0:
                 verilog.insert(idx, strings[i])
@@ -838,8 +841,8 @@ def pull_out_state(pipeline, verilog_file):
         v_string = v_string + line + '\n'
 
     v_template = Template(v_string)
-    # nstatesPerModule = get_num_nStates(out_dir)
-    bitsPerModule = get_num_bits(verilog_file)
+    # nstatesPerModule = get_num_nStates(project)
+    bitsPerModule = get_num_bits(project)
     template_dict = {}
     for module in instance_count_per_module.keys():
         template_dict["{}_count_instances".format(module)] = instance_count_per_module[module]
@@ -853,24 +856,96 @@ def pull_out_state(pipeline, verilog_file):
             if i == "main_inst":
                 instance_per_module[m].remove(i)
                 instance_per_module[m].append('main')
-    save(os.path.join(out_dir,"instancesPerModule.json"), instance_per_module)
-    save(os.path.join(out_dir,"subroutine_calls.json"), subroutine_calls)
+    project.save("instancesPerModule.json", instance_per_module)
+    project.save("subroutine_calls.json", subroutine_calls)
 
     return v_template.safe_substitute(template_dict).split('\n')
 
-def get_num_nStates(out_dir):
+def state_display(state_paths):
+    """ Testbench lines printing a STATE line with every instance state per cycle """
+    l = '$display("STATE '
+    m = '"'
+    for basepath, path in state_paths:
+        l = l +'{}\t%d\t'.format(basepath)
+        m = m +',{}'.format(path)
+    m = m + ");"
+    return ["always @(posedge clk) begin", l+m, 'end']
+
+def state_change_display(state_paths, subroutine_calls, value_per_state):
+    """
+    Testbench lines printing a CHANGE line with the cycle count and the
+    states of the active call chain, only in cycles where some state
+    changed (and while finish is set, to mark the end of the run)
+    """
+    basepaths = [basepath for basepath, _ in state_paths]
+    strings = ["reg [63:0] state_cycle;", "initial state_cycle = 0;"]
+    for i, (basepath, path) in enumerate(state_paths):
+        strings.append("reg [31:0] state_last_{};".format(i))
+        strings.append("wire state_active_{};".format(i))
+        if '.' not in basepath:
+            strings.append("assign state_active_{} = 1'b1;".format(i))
+            continue
+        # a sub-routine is on the chain while its caller waits in a call state
+        caller, callee = basepath.rsplit('.', 1)
+        caller_module = caller.split('.')[-1]
+        if caller_module == 'main_inst': caller_module = 'main'
+        values = [value_per_state[state] for state, c in subroutine_calls.get(caller_module, {}).items() if c == callee]
+        if caller not in basepaths or len(values) == 0:
+            strings.append("assign state_active_{} = 1'b0;".format(i))
+            continue
+        caller_path = state_paths[basepaths.index(caller)][1]
+        conditions = " || ".join(["{} == {}".format(caller_path, value) for value in values])
+        strings.append("assign state_active_{} = state_active_{} && ({});".format(i, basepaths.index(caller), conditions))
+
+    strings.append("always @(posedge clk) begin")
+    strings.append("state_cycle <= state_cycle + 1;")
+    changed = ["state_cycle == 0", "finish"]
+    for i, (basepath, path) in enumerate(state_paths):
+        strings.append("state_last_{} <= {};".format(i, path))
+        changed.append("{} != state_last_{}".format(path, i))
+    strings.append("if ({}) begin".format(" || ".join(changed)))
+    strings.append('$write("CHANGE %0d", state_cycle);')
+    for i, (basepath, path) in enumerate(state_paths):
+        strings.append('if (state_active_{}) $write(" {} %0d", {});'.format(i, basepath, path))
+    strings.append('$write("\\n");')
+    strings.append("end")
+    strings.append("end")
+    return strings
+
+def state_trace_writer(state_paths):
+    """
+    Testbench lines writing every instance state per cycle to TRACE_FILE:
+    a header of TRACE_FIELD byte text fields (magic and instance count,
+    then one instance path each), followed by one 32 bit word per instance
+    and cycle. Read by synthesis.read_state_trace.
+    """
+    def field(text):
+        assert(len(text) < TRACE_FIELD)
+        return text.ljust(TRACE_FIELD-1) + "\\n"
+    strings = ["integer state_trace;", "initial begin"]
+    strings.append('state_trace = $fopen("{}", "wb");'.format(TRACE_FILE))
+    strings.append('$fwrite(state_trace, "{}");'.format(field("SYNCOPATION_TRACE {}".format(len(state_paths)))))
+    for basepath, path in state_paths:
+        strings.append('$fwrite(state_trace, "{}");'.format(field(basepath)))
+    strings.append('end')
+    strings.append("always @(posedge clk) begin")
+    strings.append('$fwrite(state_trace, "{}", {});'.format("%u"*len(state_paths), ", ".join([path for _, path in state_paths])))
+    strings.append('end')
+    return strings
+
+def get_num_nStates(project):
     """ Returns dict of max(next_states) per module """
-    nextStates = read_file(os.path.join(out_dir, "hls_nstatesPerState.json"))
-    statesPerModule = read_file(os.path.join(out_dir, "hls_statesPerModule.json"))
+    nextStates = project.read("hls_nstatesPerState.json")
+    statesPerModule = project.read("hls_statesPerModule.json")
     nstatesPerModule = {}
     for module, states in statesPerModule.items():
         nstatesPerModule[module] = max([len(nextStates[state]) for state in states])
     return nstatesPerModule
 
-def get_num_bits(verilog_file):
+def get_num_bits(project):
     """ Returns dict of state_bits per module """
-    modules = get_modules(verilog_file)
-    lines = get_states(verilog_file)
+    modules = get_modules(project)
+    lines = get_states(project)
     bits = {}
     for module in modules:
         bits[module] = [line[1][0] for line in lines if module in line[0].split('_LEGUP')[0]]
@@ -879,10 +954,10 @@ def get_num_bits(verilog_file):
         bits[module] = int(bits[module][0])
     return bits
 
-def get_tags_per_address(out_dir, verilog_file, module):
+def get_tags_per_address(project, module):
     """ next state ``tags'' for each state """
-    nextStateNames = read_file(os.path.join(out_dir, "hls_nstatesPerState.json"))
-    data = get_states(verilog_file)
+    nextStateNames = project.read("hls_nstatesPerState.json")
+    data = get_states(project)
 
     stateValues = {} # dict to translate state name to numerical value
     for line in data:
@@ -0,0 +1,56 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+import os, shutil
+
+from src.cache import artifact_cache
+from src.model import Project
+from src.project import profile_rtl
+from src.synthetic import generate_design
+
+def build(out_dir):
+    """ profile_rtl of a fresh project, its data and exported files """
+    shutil.rmtree(out_dir, ignore_errors=True)
+    project = Project("main.v", export=True)
+    profile_rtl(project)
+    files = {}
+    for name in sorted(os.listdir(out_dir)):
+        with open(os.path.join(out_dir, name), 'rb') as f:
+            files[name] = f.read()
+    return project.data, files
+
+def test_hit_restores_what_a_miss_saves(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(artifact_cache, "enabled", True)
+    monkeypatch.setattr(artifact_cache, "directory", str(tmp_path / "cache"))
+    generate_design(".", "main", num_modules=3, states_per_module=12, seed=1)
+
+    miss_data, miss_files = build("main_files")
+    hits = artifact_cache.hits
+    hit_data, hit_files = build("main_files")
+
+    assert artifact_cache.hits == hits + 1
+    assert hit_data == miss_data
+    assert hit_files == miss_files
+    # instructions contain commas, so their csv rows are quoted exactly once
+    assert any([row.startswith('"') and not row.startswith('""') for row in hit_data["hls_instructions.csv"]])
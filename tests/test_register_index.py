@@ -0,0 +1,78 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+from src.project import RegisterIndex
+
+def rtl_reg_match(hls_reg, registers):
+    """ The substring matcher RegisterIndex replaced in match_rtl_data """
+    hls_reg = hls_reg.replace('.','').replace('-','')
+    matches = []
+    for reg in registers:
+        if '_{}_reg'.format(hls_reg) in reg:
+            matches.append(reg)
+        if '_{}_var'.format(hls_reg) in reg and '_reg' in reg:
+            matches.append(reg)
+        if 'arg_{}'.format(hls_reg) in reg:
+            matches.append(reg)
+    return list(dict.fromkeys(matches))
+
+REGISTERS = [
+    "main_LEGUP_1_reg",
+    "main_LEGUP_10_reg",
+    "main_BB1_1_reg",
+    "main_BB1_1_var0_reg",
+    "main_BB1_11_var0",
+    "main_BB11_reg",
+    "main_arg_a1",
+    "main_arg_a10",
+    "fn1x_1_reg",
+    "fn1x_1_reg",
+]
+
+def test_suffix_forms():
+    index = RegisterIndex(REGISTERS)
+    assert index.match("LEGUP_1") == ["main_LEGUP_1_reg"]
+    assert index.match("BB1_1") == ["main_BB1_1_reg", "main_BB1_1_var0_reg"]
+    assert index.match("BB1.1") == ["main_BB11_reg"] # '.' and '-' are dropped
+    assert index.match("1") == ["main_LEGUP_1_reg", "main_BB1_1_reg", "main_BB1_1_var0_reg", "fn1x_1_reg"] # no repeats
+    assert index.match("missing") == []
+
+def test_var_form_needs_a_register():
+    index = RegisterIndex(REGISTERS)
+    # main_BB1_11_var0 has no _reg, so only the _reg form of BB1_11 could match it
+    assert index.match("BB1_11") == []
+
+def test_prefix_collisions():
+    index = RegisterIndex(REGISTERS)
+    # the suffix forms end in _reg/_var, so LEGUP_1 does not match LEGUP_10
+    assert "main_LEGUP_10_reg" not in index.match("LEGUP_1")
+    assert index.match("LEGUP_10") == ["main_LEGUP_10_reg"]
+    # arg_<name> is a plain substring test, so a1 also matches arg_a10, as before
+    assert index.match("a1") == ["main_arg_a1", "main_arg_a10"]
+    assert index.match("a10") == ["main_arg_a10"]
+
+def test_same_matches_as_the_substring_matcher():
+    index = RegisterIndex(REGISTERS)
+    names = set([reg[i:j] for reg in REGISTERS for i in range(len(reg)) for j in range(i, len(reg)+1)])
+    for name in sorted(names) + ["LEGUP-1", "BB1.1"]:
+        assert index.match(name) == rtl_reg_match(name, REGISTERS), name
@@ -0,0 +1,108 @@
+#-----------------------------------------------------------------------------
+# Copyright (c) 2020 Kahlan Gibson
+# kahlangibson<at>ece.ubc.ca
+#
+# Permission to use, copy, and modify this software and its documentation is
+# hereby granted only under the following terms and conditions. Both the
+# above copyright notice and this permission notice must appear in all copies
+# of the software, derivative works or modified versions, and any portions
+# thereof, and both notices must appear in supporting documentation.
+# This software may be distributed (but not offered for sale or transferred
+# for compensation) to third parties, provided such third parties agree to
+# abide by the terms and conditions of this notice.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS, AS WELL AS THE UNIVERSITY
+# OF BRITISH COLUMBIA DISCLAIM ALL WARRANTIES WITH REGARD TO THIS SOFTWARE,
+# INCLUDING ALL IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO 
+# EVENT SHALL THE AUTHORS OR THE UNIVERSITY OF BRITISH COLUMBIA BE LIABLE
+# FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR
+# IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#---------------------------------------------------------------------------
+
+import os, sys, json
+import pytest
+
+import src.sta_session as sta_session
+import src.syncopation as syncopation
+from src.sta_session import StaSession, StaPool, get_slack
+
+FAKE_TOOLS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "fake_tools")
+sys.path.insert(0, FAKE_TOOLS)
+from fake_common import fake_slack
+
+@pytest.fixture(autouse=True)
+def fake_sta(monkeypatch):
+    monkeypatch.setattr(sta_session, "QUARTUS_STA", os.path.join(FAKE_TOOLS, "quartus_sta"))
+    monkeypatch.delenv("SYNCOPATION_FAKE_LATENCY", raising=False)
+    monkeypatch.delenv("SYNCOPATION_FAKE_SLACK", raising=False)
+
+def test_get_slack():
+    assert get_slack(["Info: From Node : a", "Slack: -0.125"]) == -0.125
+    with pytest.raises(IndexError):
+        get_slack(["Error: no paths"])
+
+def test_queries_share_one_process(tmp_path):
+    with StaSession(str(tmp_path)) as sta:
+        assert get_slack(sta.report_longest("dyn_clk")) == fake_slack("dyn_clk", "*", "*")
+        process = sta.process
+        to, frm = "*|main:main_inst|main_1_reg*", "*|main:main_inst|cur_state*"
+        assert get_slack(sta.report_longest("dyn_clk", to, frm)) == fake_slack("dyn_clk", to, frm)
+        assert any(["MHz" in l for l in sta.report_fmax()])
+        sta.reload()
+        assert sta.process is process
+    assert sta.process is None
+    assert process.poll() is not None
+
+def test_unknown_command_keeps_the_session(tmp_path):
+    with StaSession(str(tmp_path)) as sta:
+        assert sta.query("bogus") == ["Error: unknown command bogus"]
+        assert get_slack(sta.report_longest("dyn_clk")) == fake_slack("dyn_clk", "*", "*")
+
+def test_session_exit_is_an_error(tmp_path):
+    with StaSession(str(tmp_path)) as sta:
+        with pytest.raises(SystemExit) as error:
+            sta.query("exit")
+        assert error.value.code == 2
+
+def test_closed_on_failure(tmp_path):
+    with pytest.raises(RuntimeError):
+        with StaSession(str(tmp_path)) as sta:
+            sta.report_longest("dyn_clk")
+            process = sta.process
+            raise RuntimeError("stage failed")
+    assert sta.process is None
+    assert process.poll() is not None
+
+def test_pool_matches_a_single_session(tmp_path):
+    nodes = ["*|main:main_inst|main_{}_reg*".format(i) for i in range(8)]
+    query = lambda sta, node: get_slack(sta.report_longest("dyn_clk", node, node))
+    with StaSession(str(tmp_path)) as sta:
+        expected = [query(sta, node) for node in nodes]
+        with StaPool(str(tmp_path), 3, sta=sta) as pool:
+            assert pool.map(query, nodes) == expected
+            owned = [session.process for session in pool.owned if session.process is not None]
+        # the pool closes its own sessions, not the one passed in
+        assert all([process.poll() is not None for process in owned])
+        assert sta.process is not None
+
+def test_make_timing_closes_the_session_on_failure(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("main_files")
+    with open(os.path.join("main_files", "settings.json"), 'w') as f:
+        json.dump({'pipeline':False, 'no_synth_directives':False, 'no_sync_hardware':False}, f)
+    sessions = []
+    class RecordedSession(StaSession):
+        def start(self):
+            StaSession.start(self)
+            sessions.append(self.process)
+    def failing_sta(*args, **kwargs):
+        raise RuntimeError("perform_sta failed")
+    monkeypatch.setattr(syncopation, "StaSession", RecordedSession)
+    monkeypatch.setattr(syncopation, "perform_sta", failing_sta)
+
+    with pytest.raises(RuntimeError):
+        syncopation.make_timing("main.c")
+    assert len(sessions) == 1
+    assert sessions[0].poll() is not None